@@ -0,0 +1,368 @@
+# analysis/alerting.py
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.orm import Session
+
+from bd.models import Alert, AlertStatus, AlertType
+
+
+# ============================
+# Condiciones de alerta
+# ============================
+# condición -> (mensaje, probabilidad); una alerta abierta por máquina y condición
+CONDITIONS = {
+    "temperature_high": ("temperatura alta", 0.8),
+    "vibration_high": ("vibración excesiva", 0.75),
+    "energy_high": ("consumo energético anormal", 0.7),
+    "temperature_anomaly": ("temperatura fuera del comportamiento normal", 0.65),
+    "vibration_anomaly": ("vibración fuera del comportamiento normal", 0.60),
+    "energy_anomaly": ("energía fuera del comportamiento normal", 0.60),
+}
+
+# Histéresis: una condición activa solo cuenta como despejada cuando el valor
+# baja de un límite algo menor que el de disparo (evita abrir/cerrar en el borde)
+# - umbral fijo: límite * (1 - ALERT_HYSTERESIS)
+# - desviación estándar: media + (k - ALERT_HYSTERESIS_SIGMA) * std
+ALERT_HYSTERESIS = 0.05
+ALERT_HYSTERESIS_SIGMA = 0.5
+# Segundos seguidos (según recorded_at) con la condición despejada antes de resolver
+ALERT_COOLDOWN = 300
+# Las actualizaciones de una alerta en curso (última vez vista, ocurrencias,
+# pico) se escriben como mucho cada ALERT_PERSIST_INTERVAL segundos; los
+# cambios de estado se escriben siempre
+ALERT_PERSIST_INTERVAL = 60
+
+# Clave en Session.info con las máquinas tocadas en la transacción en curso
+TOUCHED_KEY = "alert_tracker_machines"
+
+alerts_table = Alert.__table__
+# UPDATE por id con Core: una fila borrada (retención, rescore, máquina
+# borrada) no lanza StaleDataError como el UPDATE por clave primaria del ORM
+UPDATE_ALERT = (
+    update(alerts_table)
+    .where(alerts_table.c.id == bindparam("alert_id"))
+    .values(
+        status=bindparam("status"),
+        last_seen_at=bindparam("last_seen_at"),
+        occurrences=bindparam("occurrences"),
+        peak_value=bindparam("peak_value"),
+    )
+)
+RESOLVE_ALERT = UPDATE_ALERT.values(resolved_at=bindparam("resolved_at"))
+
+
+def alert_type_for(probability: float) -> AlertType:
+    return AlertType.critical if probability > 0.75 else AlertType.warning
+
+
+def threshold_check(condition: str, value: float, limit: float) -> tuple:
+    """(condición, valor, límite de disparo, límite de despeje) para un umbral fijo."""
+    return condition, value, limit, limit - ALERT_HYSTERESIS * abs(limit)
+
+
+def sigma_check(condition: str, value: float, mean: float, std: Optional[float], k: float = 2.0) -> tuple:
+    """Igual para valor > media + k·std; sin std (pocos datos) no se evalúa."""
+    if std is None:
+        return condition, value, None, None
+    return condition, value, mean + k * std, mean + (k - ALERT_HYSTERESIS_SIGMA) * std
+
+
+class AlertState:
+    """Alerta abierta (open / ongoing) de una máquina para una condición."""
+    __slots__ = (
+        "alert_id", "status", "last_seen_at", "occurrences", "peak_value",
+        "clear_since", "persisted_at", "dirty",
+    )
+
+    def __init__(self, alert_id: int, status: AlertStatus, last_seen_at: datetime, occurrences: int, peak_value: float):
+        self.alert_id = alert_id
+        self.status = status
+        self.last_seen_at = last_seen_at
+        self.occurrences = occurrences
+        self.peak_value = peak_value
+        self.clear_since: Optional[datetime] = None
+        self.persisted_at = last_seen_at
+        self.dirty = False
+
+    @classmethod
+    def from_row(cls, row: Alert) -> "AlertState":
+        return cls(row.id, row.status, row.last_seen_at or row.created_at, row.occurrences or 1, row.peak_value)
+
+    def row(self, resolved_at: Optional[datetime] = None) -> dict:
+        self.dirty = False
+        self.persisted_at = self.last_seen_at
+        values = {
+            "alert_id": self.alert_id,
+            "status": self.status,
+            "last_seen_at": self.last_seen_at,
+            "occurrences": self.occurrences,
+            "peak_value": self.peak_value,
+        }
+        if resolved_at is not None:
+            values["resolved_at"] = resolved_at
+        return values
+
+
+def _alert_dict(condition: str, state: AlertState) -> dict:
+    return {
+        "alert_id": state.alert_id,
+        "condition": condition,
+        "alert_type": alert_type_for(CONDITIONS[condition][1]),
+        "status": state.status,
+        "last_seen_at": state.last_seen_at,
+        "occurrences": state.occurrences,
+        "peak_value": state.peak_value,
+    }
+
+
+class MachineAlerts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.warm = False
+        self.open: Dict[str, AlertState] = {}
+
+
+class AlertTracker:
+    """
+    Ciclo de vida de las alertas por máquina y condición: open → ongoing → resolved.
+    - la primera lectura anómala inserta la alerta (open).
+    - las siguientes la actualizan (ongoing: última vez vista, ocurrencias,
+      valor pico) en memoria y se escriben de forma espaciada.
+    - se resuelve cuando la condición lleva ALERT_COOLDOWN segundos
+      despejada (con histéresis); una nueva anomalía abre otra alerta.
+    - las alertas abiertas se recuperan de la BD al ver la máquina por primera vez.
+    - si la transacción que las analizó no llega a confirmarse, las máquinas
+      tocadas se vuelven a cargar de la BD (la alerta recién abierta no existe).
+    """
+
+    def __init__(self):
+        self._machines: Dict[int, MachineAlerts] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, machine_id: int) -> MachineAlerts:
+        with self._lock:
+            state = self._machines.get(machine_id)
+            if state is None:
+                state = MachineAlerts()
+                self._machines[machine_id] = state
+            return state
+
+    def _warm(self, db: Session, machine_id: int, machine: MachineAlerts):
+        rows = db.execute(
+            select(Alert)
+            .where(
+                Alert.machine_id == machine_id,
+                Alert.status != AlertStatus.resolved,
+                Alert.condition.isnot(None),
+            )
+            .order_by(Alert.id)
+        ).scalars().all()
+        for row in rows:
+            # si hubiera varias para la misma condición, vale la más reciente
+            machine.open[row.condition] = AlertState.from_row(row)
+
+    def warm_all(self, db: Session):
+        """
+        Carga de una vez las alertas abiertas de todas las máquinas (al
+        arrancar), en vez de una consulta por máquina en su primera lectura.
+        Las máquinas ya cargadas no se tocan.
+        """
+        rows = db.execute(
+            select(Alert)
+            .where(Alert.status != AlertStatus.resolved, Alert.condition.isnot(None))
+            .order_by(Alert.id)
+        ).scalars().all()
+        by_machine: Dict[int, list] = {}
+        for row in rows:
+            by_machine.setdefault(row.machine_id, []).append(row)
+        for machine_id, machine_rows in by_machine.items():
+            machine = self._get(machine_id)
+            with machine.lock:
+                if machine.warm:
+                    continue
+                for row in machine_rows:
+                    machine.open[row.condition] = AlertState.from_row(row)
+                machine.warm = True
+
+    def open_alerts(self) -> Dict[int, list]:
+        """Alertas abiertas en memoria: {machine_id: [dict por condición]}."""
+        with self._lock:
+            machines = list(self._machines.items())
+        result = {}
+        for machine_id, machine in machines:
+            with machine.lock:
+                if not machine.open:
+                    continue
+                result[machine_id] = [_alert_dict(condition, state) for condition, state in machine.open.items()]
+        return result
+
+    def load_open_alerts(self, db: Session) -> Dict[int, list]:
+        """Como open_alerts() pero desde la BD (con varios workers la memoria es solo la de este proceso)."""
+        rows = db.execute(
+            select(Alert)
+            .where(Alert.status != AlertStatus.resolved, Alert.condition.isnot(None))
+            .order_by(Alert.id)
+        ).scalars().all()
+        by_machine: Dict[int, Dict[str, AlertState]] = {}
+        for row in rows:
+            by_machine.setdefault(row.machine_id, {})[row.condition] = AlertState.from_row(row)
+        return {
+            machine_id: [_alert_dict(condition, state) for condition, state in states.items()]
+            for machine_id, states in by_machine.items()
+        }
+
+    # ============================
+    # OBSERVACIÓN
+    # ============================
+    def observe(self, db: Session, machine_id: int, checks: list, recorded_at: datetime) -> List[Alert]:
+        """
+        Aplica una lectura. checks = [(condición, valor, límite, límite de
+        despeje)] (ver threshold_check / sigma_check); límite None si no se puede
+        evaluar (p. ej. sin estadísticas). Las alertas nuevas se
+        añaden a la sesión (con flush para tener id) y las actualizaciones se
+        ejecutan en la sesión; lo confirma quien llama. Devuelve las alertas nuevas.
+        """
+        machine = self._get(machine_id)
+        self._track(db, machine_id)
+        opened = []
+        updates = []
+        with machine.lock:
+            if not machine.warm:
+                self._warm(db, machine_id, machine)
+                machine.warm = True
+
+            for condition, value, limit, clear_limit in checks:
+                if limit is None:
+                    continue
+                state = machine.open.get(condition)
+                active = value > limit
+
+                if state is None:
+                    if active:
+                        alert = self._open(db, machine_id, condition, value, recorded_at)
+                        machine.open[condition] = AlertState(alert.id, AlertStatus.open, recorded_at, 1, value)
+                        opened.append(alert)
+                    continue
+
+                if active:
+                    state.occurrences += 1
+                    if recorded_at > state.last_seen_at:
+                        state.last_seen_at = recorded_at
+                    if state.peak_value is None or value > state.peak_value:
+                        state.peak_value = value
+                    state.clear_since = None
+                    state.dirty = True
+                    if state.status == AlertStatus.open:
+                        state.status = AlertStatus.ongoing
+                        updates.append(state.row())
+                    elif (recorded_at - state.persisted_at).total_seconds() >= ALERT_PERSIST_INTERVAL:
+                        updates.append(state.row())
+                elif value <= clear_limit:
+                    if state.clear_since is None:
+                        state.clear_since = recorded_at
+                    if (recorded_at - state.clear_since).total_seconds() >= ALERT_COOLDOWN:
+                        state.status = AlertStatus.resolved
+                        updates.append(state.row(resolved_at=recorded_at))
+                        del machine.open[condition]
+                # dentro de la banda de histéresis no cambia nada: si aún no
+                # se había despejado sigue activa, y si ya se despejó sigue
+                # contando el tiempo para resolver (solo un nuevo disparo lo reinicia)
+
+        self._execute_updates(db, updates)
+        return opened
+
+    def _open(self, db: Session, machine_id: int, condition: str, value: float, recorded_at: datetime) -> Alert:
+        message, probability = CONDITIONS[condition]
+        alert = Alert(
+            machine_id=machine_id,
+            alert_type=alert_type_for(probability),
+            probability=probability,
+            message=message,
+            status=AlertStatus.open,
+            condition=condition,
+            last_seen_at=recorded_at,
+            occurrences=1,
+            peak_value=value,
+        )
+        db.add(alert)
+        # el id hace falta para las actualizaciones siguientes
+        db.flush()
+        return alert
+
+    # ============================
+    # PERSISTENCIA
+    # ============================
+    def flush_all(self, db: Session):
+        """Escribe las alertas en curso con cambios pendientes (p. ej. al apagar)."""
+        with self._lock:
+            machines = list(self._machines.values())
+        updates = []
+        for machine in machines:
+            with machine.lock:
+                updates.extend(state.row() for state in machine.open.values() if state.dirty)
+        self._execute_updates(db, updates)
+        db.commit()
+
+    def _execute_updates(self, db: Session, updates: list):
+        resolved = [values for values in updates if "resolved_at" in values]
+        ongoing = [values for values in updates if "resolved_at" not in values]
+        matched = 0
+        for statement, rows in ((UPDATE_ALERT, ongoing), (RESOLVE_ALERT, resolved)):
+            if rows:
+                matched += db.execute(statement, rows).rowcount
+        if matched != len(updates):
+            self._reconcile(db, [values["alert_id"] for values in updates])
+
+    def _reconcile(self, db: Session, alert_ids: list):
+        """Olvida las alertas en memoria cuya fila ya no existe (borrada por otro camino)."""
+        existing = set(db.execute(select(Alert.id).where(Alert.id.in_(alert_ids))).scalars())
+        missing = set(alert_ids) - existing
+        if not missing:
+            return
+        with self._lock:
+            machines = list(self._machines.values())
+        for machine in machines:
+            with machine.lock:
+                for condition, state in list(machine.open.items()):
+                    if state.alert_id in missing:
+                        del machine.open[condition]
+
+    # ============================
+    # TRANSACCIÓN
+    # ============================
+    def _track(self, db: Session, machine_id: int):
+        """Apunta la máquina en la sesión; la primera vez engancha los eventos de fin de transacción."""
+        touched = db.info.get(TOUCHED_KEY)
+        if touched is None:
+            touched = db.info[TOUCHED_KEY] = set()
+            event.listen(db, "after_commit", self._committed)
+            event.listen(db, "after_transaction_end", self._transaction_end)
+        touched.add(machine_id)
+
+    def _committed(self, db: Session):
+        db.info[TOUCHED_KEY].clear()
+
+    def _transaction_end(self, db: Session, transaction):
+        touched = db.info[TOUCHED_KEY]
+        if transaction.parent is not None or not touched:
+            return
+        # rollback o sesión cerrada sin commit: lo que hay en memoria de
+        # esas máquinas puede no estar en la BD, se recarga en la próxima lectura
+        for machine_id in touched:
+            machine = self._get(machine_id)
+            with machine.lock:
+                machine.open.clear()
+                machine.warm = False
+        touched.clear()
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._machines.pop(machine_id, None)
+
+
+# instancia global
+alert_tracker = AlertTracker()
@@ -1,9 +1,13 @@
 # analysis/predictive.py
 
+import time
+
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from bd.models import MachineData, Alert, AlertType
-from bd.schemas import AlertCreate
+from bd.models import MachineData
+from analisys.alerting import alert_tracker, sigma_check, threshold_check
+from analisys.stats import stats_registry
+from analisys.thresholds import ThresholdCache
+from metrics import metrics
 
 
 # ============================
@@ -15,91 +19,91 @@ THRESHOLDS = {
     "energy_consumption": 700  # W
 }
 
+# Umbrales por máquina / tipo de máquina (tabla threshold_profiles) en memoria;
+# THRESHOLDS queda como valor por defecto de cada métrica
+threshold_cache = ThresholdCache(THRESHOLDS)
+
+analysis_latency = metrics.histogram(
+    "analysis_seconds", "Duración del análisis de una lectura (umbrales, estadísticas y alertas)"
+)
+alerts_opened = metrics.counter("alerts_opened_total", "Alertas nuevas abiertas por el análisis")
+
 
-def analyze_data_point(db: Session, data_point: MachineData):
+def analyze_data_point(db: Session, data_point: MachineData, commit: bool = True):
     """
     Analiza un nuevo punto de datos usando:
     - Reglas por umbrales
     - Desviación estándar para detectar anormalidades
 
-    Si se detecta un problema, se genera una alerta en BD.
+    Cada condición lleva su propia alerta (analisys/alerting.py): la primera
+    lectura anómala la abre y las siguientes solo la actualizan, en lugar de
+    insertar una alerta por lectura. Devuelve la alerta nueva más crítica o None.
+    Con commit=False los cambios solo quedan en la sesión (ver analyze_batch).
     """
 
+    start = time.perf_counter()
     machine_id = data_point.machine_id
 
     # =====================================================
     # 1. REGLAS POR UMBRAL (detección inmediata)
     # =====================================================
-    triggered = []
-
-    if data_point.temperature > THRESHOLDS["temperature"]:
-        triggered.append(("temperatura alta", 0.8))
-
-    if data_point.vibration > THRESHOLDS["vibration"]:
-        triggered.append(("vibración excesiva", 0.75))
-
-    if data_point.energy_consumption > THRESHOLDS["energy_consumption"]:
-        triggered.append(("consumo energético anormal", 0.7))
+    # umbrales de la máquina desde la caché (sin consulta por lectura)
+    thresholds = threshold_cache.get(db, machine_id)
+    checks = [
+        threshold_check("temperature_high", data_point.temperature, thresholds["temperature"]),
+        threshold_check("vibration_high", data_point.vibration, thresholds["vibration"]),
+        threshold_check("energy_high", data_point.energy_consumption, thresholds["energy_consumption"]),
+    ]
 
 
     # =====================================================
     # 2. DESVIACIÓN ESTÁNDAR (anomalías estadísticas)
     # =====================================================
-    stats = db.query(
-        func.avg(MachineData.temperature),
-        func.stddev(MachineData.temperature),
-        func.avg(MachineData.vibration),
-        func.stddev(MachineData.vibration),
-        func.avg(MachineData.energy_consumption),
-        func.stddev(MachineData.energy_consumption),
-    ).filter(
-        MachineData.machine_id == machine_id
-    ).first()
-
-    (
-        avg_t, std_t,
-        avg_v, std_v,
-        avg_e, std_e
-    ) = stats
-
-    # Evita cálculos si muy pocos datos
-    if std_t is not None and data_point.temperature > avg_t + 2 * std_t:
-        triggered.append(("temperatura fuera del comportamiento normal", 0.65))
-
-    if std_v is not None and data_point.vibration > avg_v + 2 * std_v:
-        triggered.append(("vibración fuera del comportamiento normal", 0.60))
-
-    if std_e is not None and data_point.energy_consumption > avg_e + 2 * std_e:
-        triggered.append(("energía fuera del comportamiento normal", 0.60))
+    # Estadísticas incrementales por máquina (O(1) por lectura),
+    # antes era un AVG/STDDEV sobre todo el historial de machine_data
+    # (el checkpoint, si lo hay, se confirma con el commit del final)
+    stats, _ = stats_registry.update(db, data_point)
 
+    avg_t, std_t = stats["temperature"]
+    avg_v, std_v = stats["vibration"]
+    avg_e, std_e = stats["energy_consumption"]
 
-    # =====================================================
-    # 3. SI NO HAY ANOMALÍAS → retorna (estado estable)
-    # =====================================================
-    if not triggered:
-        return None
+    # Evita cálculos si muy pocos datos (std None → no se evalúa)
+    checks += [
+        sigma_check("temperature_anomaly", data_point.temperature, avg_t, std_t),
+        sigma_check("vibration_anomaly", data_point.vibration, avg_v, std_v),
+        sigma_check("energy_anomaly", data_point.energy_consumption, avg_e, std_e),
+    ]
 
 
     # =====================================================
-    # 4. TOMAR EL EVENTO MÁS CRÍTICO
+    # 3. CICLO DE VIDA DE LAS ALERTAS (abrir / actualizar / resolver)
     # =====================================================
-    message, prob = sorted(triggered, key=lambda x: x[1], reverse=True)[0]
+    opened = alert_tracker.observe(db, machine_id, checks, data_point.recorded_at)
+
+    if commit:
+        db.commit()
+    analysis_latency.observe(time.perf_counter() - start)
 
-    alert_type = AlertType.critical if prob > 0.75 else AlertType.warning
+    if not opened:
+        return None
+    alerts_opened.inc(len(opened))
 
     # =====================================================
-    # 5. CREAR ALERTA EN BD
+    # 4. TOMAR EL EVENTO MÁS CRÍTICO
     # =====================================================
-    alert = Alert(
-        machine_id=machine_id,
-        alert_type=alert_type,
-        probability=prob,
-        message=message
-    )
-
-    db.add(alert)
-    db.commit()
-    db.refresh(alert)
+    return max(opened, key=lambda alert: alert.probability)
 
 
-    return alert
+def analyze_batch(db: Session, data_points: list):
+    """
+    Analiza un lote de lecturas ya insertadas (en orden) con un único commit
+    para todas las alertas abiertas o actualizadas.
+    """
+    alerts = []
+    for data_point in data_points:
+        alert = analyze_data_point(db, data_point, commit=False)
+        if alert is not None:
+            alerts.append(alert)
+    db.commit()
+    return alerts
@@ -0,0 +1,489 @@
+# analysis/rescore.py
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from bd.database import SessionLocal, engine
+from bd.models import Alert, AlertStatus, Machine, MachineData
+from analisys import stats as live_stats
+from analisys.alerting import (
+    ALERT_COOLDOWN,
+    ALERT_HYSTERESIS,
+    ALERT_HYSTERESIS_SIGMA,
+    CONDITIONS,
+    alert_type_for,
+)
+from analisys.predictive import threshold_cache
+
+
+# ============================
+# Reglas (las mismas que analyze_data_point)
+# ============================
+# condición -> (métrica, clave del umbral o None para la regla de k·sigma)
+RULES = {
+    "temperature_high": ("temperature", "temperature"),
+    "vibration_high": ("vibration", "vibration"),
+    "energy_high": ("energy_consumption", "energy_consumption"),
+    "temperature_anomaly": ("temperature", None),
+    "vibration_anomaly": ("vibration", None),
+    "energy_anomaly": ("energy_consumption", None),
+}
+RULES_METRICS = tuple(dict.fromkeys(metric for metric, _ in RULES.values()))
+SIGMA_K = 2.0
+
+# Filas de machine_data por bloque leído y alertas por INSERT multi-fila
+CHUNK_SIZE = 50000
+INSERT_CHUNK_SIZE = 1000
+
+# estado de cada lectura frente a una regla
+_CLEAR, _BAND, _ACTIVE = 0, 1, 2
+
+
+# ============================
+# Estadísticas vectorizadas
+# ============================
+# Reproducen las de analisys/stats.py (incluyen la propia lectura):
+# todo el historial, ventana deslizante o EWMA según STATS_WINDOW / STATS_EWMA_ALPHA.
+class CumulativeStats:
+    """Media/desviación de todo el historial con sumas acumuladas desplazadas."""
+
+    def __init__(self, count: int = 0, mean: float = 0.0, var: float = 0.0):
+        self.count = count
+        self.shift = mean  # restar un valor típico evita perder precisión en sumsq
+        self.sum = 0.0
+        self.sumsq = var * count
+
+    def process(self, x: np.ndarray):
+        if self.count == 0:
+            self.shift = float(x[0])
+        xs = x - self.shift
+        n = self.count + np.arange(1, len(x) + 1)
+        s = self.sum + np.cumsum(xs)
+        q = self.sumsq + np.cumsum(xs * xs)
+        mean = s / n
+        var = np.maximum(q / n - mean * mean, 0.0)
+        self.count, self.sum, self.sumsq = int(n[-1]), float(s[-1]), float(q[-1])
+        return self.shift + mean, np.sqrt(var)
+
+
+class WindowStats:
+    """Media/desviación de las últimas `size` lecturas (incluida la actual)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tail = np.empty(0)
+
+    def process(self, x: np.ndarray):
+        z = np.concatenate((self.tail, x))
+        shift = float(z.mean())
+        zs = z - shift
+        cs = np.concatenate(([0.0], np.cumsum(zs)))
+        cs2 = np.concatenate(([0.0], np.cumsum(zs * zs)))
+        pos = np.arange(len(self.tail), len(z))
+        lo = np.maximum(pos - self.size + 1, 0)
+        n = pos - lo + 1
+        mean = (cs[pos + 1] - cs[lo]) / n
+        var = np.maximum((cs2[pos + 1] - cs2[lo]) / n - mean * mean, 0.0)
+        self.tail = z[-(self.size - 1):] if self.size > 1 else np.empty(0)
+        return shift + mean, np.sqrt(var)
+
+
+def linear_recurrence(c: float, y0: float, u: np.ndarray) -> np.ndarray:
+    """
+    y[t] = c·y[t-1] + u[t] sin bucle por elemento: forma cerrada por bloques
+    cortos para que c**-k no desborde.
+    """
+    if c == 0.0:
+        return u.copy()
+    out = np.empty_like(u)
+    block = max(1, int(27.0 / -math.log(c)))  # c**-block <= e**27
+    y = y0
+    for start in range(0, len(u), block):
+        ub = u[start:start + block]
+        pw = c ** np.arange(len(ub))
+        yb = pw * (c * y + np.cumsum(ub / pw))
+        out[start:start + len(ub)] = yb
+        y = yb[-1]
+    return out
+
+
+class EwmaSeries:
+    """Media/varianza con decaimiento exponencial (mismas fórmulas que EwmaStats)."""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def process(self, x: np.ndarray):
+        a = self.alpha
+        mean = np.empty_like(x)
+        m2 = np.empty_like(x)
+        start = 0
+        prev_mean, prev_m2 = self.mean, self.m2
+        if self.count == 0:
+            mean[0], m2[0] = x[0], 0.0
+            prev_mean, prev_m2 = float(x[0]), 0.0
+            start = 1
+        if start < len(x):
+            xt = x[start:]
+            mean[start:] = linear_recurrence(1.0 - a, prev_mean, a * xt)
+            before = np.concatenate(([prev_mean], mean[start:-1]))
+            diff = xt - before
+            m2[start:] = linear_recurrence(1.0 - a, prev_m2, (1.0 - a) * a * diff * diff)
+        self.count += len(x)
+        self.mean, self.m2 = float(mean[-1]), float(m2[-1])
+        return mean, np.sqrt(m2)
+
+
+# ============================
+# Episodios (ciclo de vida de analisys/alerting.py)
+# ============================
+class EpisodeTracker:
+    """
+    Convierte los estados por lectura (despejada / banda / activa) de una
+    condición en episodios open → resolved con la histéresis y el cooldown
+    del AlertTracker. Solo se itera por tramos de estado constante.
+    """
+
+    def __init__(self, cooldown: float):
+        self.cooldown = cooldown
+        self.current: Optional[dict] = None
+        self.episodes: List[dict] = []
+
+    def process(self, t: np.ndarray, values: np.ndarray, state: np.ndarray):
+        if not len(t):
+            return
+        bounds = np.flatnonzero(np.diff(state)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(state)]))
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            code = state[s]
+            ep = self.current
+            if code == _ACTIVE:
+                if ep is None:
+                    ep = self.current = {
+                        "start": t[s], "occurrences": 0, "peak": -math.inf,
+                        "last_seen": t[s], "clear_since": None,
+                    }
+                ep["occurrences"] += e - s
+                ep["peak"] = max(ep["peak"], float(values[s:e].max()))
+                ep["last_seen"] = t[e - 1]
+                ep["clear_since"] = None
+                continue
+            # como en AlertTracker.observe, solo una lectura despejada resuelve:
+            # la banda no cambia nada (ni reinicia ni cierra el episodio)
+            if ep is None or code != _CLEAR:
+                continue
+            if ep["clear_since"] is None:
+                ep["clear_since"] = t[s]
+            j = s + int(np.searchsorted(t[s:e], ep["clear_since"] + self.cooldown, side="left"))
+            if j < e:
+                ep["resolved"] = t[j]
+                self.episodes.append(ep)
+                self.current = None
+
+    def finish(self) -> List[dict]:
+        if self.current is not None:
+            self.episodes.append(self.current)
+            self.current = None
+        return self.episodes
+
+
+# ============================
+# Re-evaluación de una máquina
+# ============================
+def _seconds(values: list) -> np.ndarray:
+    return np.array(values, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+
+def _to_datetime(seconds: float) -> datetime:
+    return datetime.utcfromtimestamp(seconds)
+
+
+def _new_stats(db: Session, machine_id: int, start: Optional[datetime]) -> dict:
+    """Estadísticas por métrica, sembradas con el historial anterior a start."""
+    prior = select(MachineData).where(MachineData.machine_id == machine_id)
+    if start is not None:
+        prior = prior.where(MachineData.recorded_at < start)
+
+    if live_stats.STATS_EWMA_ALPHA is not None or live_stats.STATS_WINDOW is not None:
+        if live_stats.STATS_EWMA_ALPHA is not None:
+            series = {m: EwmaSeries(live_stats.STATS_EWMA_ALPHA) for m in RULES_METRICS}
+            limit = int(math.ceil(10 / live_stats.STATS_EWMA_ALPHA))
+        else:
+            series = {m: WindowStats(live_stats.STATS_WINDOW) for m in RULES_METRICS}
+            limit = live_stats.STATS_WINDOW - 1
+        if start is not None and limit > 0:
+            rows = db.execute(
+                prior.with_only_columns(*[getattr(MachineData, m) for m in RULES_METRICS])
+                .order_by(MachineData.recorded_at.desc(), MachineData.id.desc())
+                .limit(limit)
+            ).all()
+            if rows:
+                cols = np.array(rows[::-1], dtype=float).T
+                for metric, col in zip(RULES_METRICS, cols):
+                    series[metric].process(col)
+        return series
+
+    if start is None:
+        return {m: CumulativeStats() for m in RULES_METRICS}
+    columns = [func.count(MachineData.id)]
+    for m in RULES_METRICS:
+        columns += [func.avg(getattr(MachineData, m)), func.var_pop(getattr(MachineData, m))]
+    agg = db.execute(prior.with_only_columns(*columns)).first()
+    count = agg[0] or 0
+    series = {}
+    for i, m in enumerate(RULES_METRICS):
+        if count:
+            series[m] = CumulativeStats(count, float(agg[1 + 2 * i]), float(agg[2 + 2 * i] or 0.0))
+        else:
+            series[m] = CumulativeStats()
+    return series
+
+
+def _widen_start(db: Session, machine_id: int, start: datetime) -> datetime:
+    """
+    Retrasa start al inicio de los episodios (alertas de ciclo de vida) que
+    seguían abiertos en start, hasta que ninguno quede partido: así se borran
+    y se recalculan enteros en lugar de duplicarse desde start.
+    """
+    while True:
+        earlier = db.execute(
+            select(func.min(Alert.created_at)).where(
+                Alert.machine_id == machine_id,
+                Alert.condition.isnot(None),
+                Alert.created_at < start,
+                or_(Alert.resolved_at.is_(None), Alert.resolved_at >= start),
+            )
+        ).scalar()
+        if earlier is None:
+            return start
+        start = earlier
+
+
+def _widen_end(db: Session, machine_id: int, end: datetime) -> Optional[datetime]:
+    """
+    Adelanta end hasta la resolución de los episodios abiertos en end (None
+    si alguno sigue abierto: hasta la última lectura). Si no, se borrarían y
+    se reinsertarían sin resolved_at, y ninguna lectura posterior los cerraría.
+    """
+    while end is not None:
+        straddling = [
+            Alert.machine_id == machine_id,
+            Alert.condition.isnot(None),
+            Alert.created_at < end,
+            or_(Alert.resolved_at.is_(None), Alert.resolved_at >= end),
+        ]
+        if db.execute(select(Alert.id).where(*straddling, Alert.resolved_at.is_(None)).limit(1)).first():
+            return None
+        later = db.execute(select(func.max(Alert.resolved_at)).where(*straddling)).scalar()
+        if later is None:
+            return end
+        # end es exclusivo: la lectura que resolvió el episodio entra en el rango
+        end = later + timedelta(microseconds=1)
+    return end
+
+
+def rescore_machine(
+    machine_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dry_run: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> dict:
+    """
+    Re-evalúa el historial de una máquina con las reglas (y los umbrales de
+    la máquina) actuales.
+    Lee machine_data por bloques (keyset por recorded_at, id), calcula
+    estadísticas y disparos vectorizados y agrupa los disparos en episodios.
+    Sin dry_run sustituye las alertas de ciclo de vida (condition no nula)
+    del rango por las calculadas; las creadas a mano no se tocan. Si start
+    cae dentro de un episodio, el rango empieza al inicio de ese episodio; si
+    end cae dentro de uno, termina en su resolución (o llega al final del
+    historial si sigue abierto).
+    """
+    db = SessionLocal()
+    try:
+        if start is not None:
+            start = _widen_start(db, machine_id, start)
+        if end is not None:
+            end = _widen_end(db, machine_id, end)
+        series = _new_stats(db, machine_id, start)
+        thresholds = threshold_cache.get(db, machine_id)
+        episodes = {condition: EpisodeTracker(ALERT_COOLDOWN) for condition in RULES}
+
+        filters = [MachineData.machine_id == machine_id]
+        if start is not None:
+            filters.append(MachineData.recorded_at >= start)
+        if end is not None:
+            filters.append(MachineData.recorded_at < end)
+        columns = [MachineData.id, MachineData.recorded_at] + [getattr(MachineData, m) for m in RULES_METRICS]
+
+        readings = 0
+        last = None
+        while True:
+            stmt = select(*columns).where(*filters)
+            if last is not None:
+                stmt = stmt.where(or_(
+                    MachineData.recorded_at > last[0],
+                    and_(MachineData.recorded_at == last[0], MachineData.id > last[1]),
+                ))
+            rows = db.execute(
+                stmt.order_by(MachineData.recorded_at, MachineData.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last = (rows[-1][1], rows[-1][0])
+            readings += len(rows)
+
+            _, recorded, *metric_values = zip(*rows)
+            t = _seconds(recorded)
+            values = {m: np.array(v, dtype=float) for m, v in zip(RULES_METRICS, metric_values)}
+            limits = {}
+            for metric in RULES_METRICS:
+                mean, std = series[metric].process(values[metric])
+                limits[metric] = (mean + SIGMA_K * std, mean + (SIGMA_K - ALERT_HYSTERESIS_SIGMA) * std)
+
+            for condition, (metric, threshold_key) in RULES.items():
+                x = values[metric]
+                if threshold_key is not None:
+                    limit = thresholds[threshold_key]
+                    clear_limit = limit - ALERT_HYSTERESIS * abs(limit)
+                else:
+                    limit, clear_limit = limits[metric]
+                state = np.where(x > limit, _ACTIVE, np.where(x <= clear_limit, _CLEAR, _BAND))
+                episodes[condition].process(t, x, state)
+
+            if len(rows) < chunk_size:
+                break
+
+        alerts = []
+        counts = {}
+        for condition, tracker in episodes.items():
+            found = tracker.finish()
+            counts[condition] = len(found)
+            message, probability = CONDITIONS[condition]
+            for ep in found:
+                resolved = ep.get("resolved")
+                if resolved is not None:
+                    status = AlertStatus.resolved
+                elif ep["occurrences"] > 1:
+                    status = AlertStatus.ongoing
+                else:
+                    status = AlertStatus.open
+                alerts.append({
+                    "machine_id": machine_id,
+                    "alert_type": alert_type_for(probability),
+                    "probability": probability,
+                    "message": message,
+                    "status": status,
+                    "condition": condition,
+                    "created_at": _to_datetime(ep["start"]),
+                    "last_seen_at": _to_datetime(ep["last_seen"]),
+                    "occurrences": ep["occurrences"],
+                    "peak_value": ep["peak"],
+                    "resolved_at": _to_datetime(resolved) if resolved is not None else None,
+                })
+
+        report = {
+            "machine_id": machine_id,
+            "start": start,
+            "end": end,
+            "readings": readings,
+            "alerts": len(alerts),
+            "still_open": sum(1 for a in alerts if a["status"] != AlertStatus.resolved),
+            "by_condition": counts,
+            "deleted": 0,
+            "written": 0,
+        }
+        if dry_run:
+            return report
+
+        stale = [Alert.machine_id == machine_id, Alert.condition.isnot(None)]
+        if start is not None:
+            stale.append(Alert.created_at >= start)
+        if end is not None:
+            stale.append(Alert.created_at < end)
+        report["deleted"] = db.execute(delete(Alert).where(*stale)).rowcount
+        alerts.sort(key=lambda a: a["created_at"])
+        for i in range(0, len(alerts), INSERT_CHUNK_SIZE):
+            db.execute(insert(Alert), alerts[i:i + INSERT_CHUNK_SIZE])
+        db.commit()
+        report["written"] = len(alerts)
+        return report
+    finally:
+        db.close()
+
+
+# ============================
+# Flota completa (pool de procesos)
+# ============================
+def _init_worker():
+    # el proceso hijo hereda el pool de conexiones del padre: no se reutiliza
+    engine.dispose(close=False)
+
+
+def _rescore_task(args: tuple) -> dict:
+    machine_id, start, end, dry_run, chunk_size = args
+    try:
+        return rescore_machine(machine_id, start, end, dry_run, chunk_size)
+    except Exception as e:
+        return {"machine_id": machine_id, "error": str(e)}
+
+
+def rescore_history(
+    machine_ids: Optional[list] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dry_run: bool = True,
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    progress=None,
+) -> dict:
+    """
+    Re-evalúa una lista de máquinas (None → todas) repartidas entre `workers`
+    procesos. Devuelve el informe por máquina y los totales.
+    Conviene lanzarlo con la ingesta parada (o reiniciar la app después):
+    el AlertTracker en marcha no ve las alertas reescritas.
+    """
+    if machine_ids is None:
+        db = SessionLocal()
+        try:
+            machine_ids = db.execute(select(Machine.id).order_by(Machine.id)).scalars().all()
+        finally:
+            db.close()
+
+    tasks = [(machine_id, start, end, dry_run, chunk_size) for machine_id in machine_ids]
+    reports = []
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            reports.append(_rescore_task(task))
+            if progress:
+                progress(reports[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for report in pool.map(_rescore_task, tasks):
+                reports.append(report)
+                if progress:
+                    progress(report)
+
+    totals: Dict[str, object] = {"machines": len(reports), "errors": 0, "readings": 0, "alerts": 0, "deleted": 0, "written": 0}
+    by_condition = {condition: 0 for condition in RULES}
+    for report in reports:
+        if "error" in report:
+            totals["errors"] += 1
+            continue
+        for key in ("readings", "alerts", "deleted", "written"):
+            totals[key] += report[key]
+        for condition, n in report["by_condition"].items():
+            by_condition[condition] += n
+    totals["by_condition"] = by_condition
+    return {"mode": live_stats._stats_mode(), "dry_run": dry_run, "totals": totals, "machines": reports}
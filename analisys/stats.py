@@ -0,0 +1,333 @@
+# analysis/stats.py
+
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from bd.models import MachineData, MachineStats
+from crud.hot_window import hot_window
+
+
+METRICS = ("temperature", "vibration", "energy_consumption")
+
+
+# ============================
+# Configuración de la ventana
+# ============================
+# - STATS_WINDOW = None y STATS_EWMA_ALPHA = None → todo el historial
+#   (equivale al AVG/STDDEV sobre machine_data que se hacía antes)
+# - STATS_WINDOW = N → solo las últimas N lecturas (ventana deslizante)
+# - STATS_EWMA_ALPHA = a → media/varianza con decaimiento exponencial
+STATS_WINDOW: Optional[int] = None
+STATS_EWMA_ALPHA: Optional[float] = None
+
+# Cada cuántas lecturas por máquina se guarda el checkpoint en BD
+CHECKPOINT_EVERY = 50
+
+
+class RunningStats:
+    """
+    Media y varianza poblacional incremental (algoritmo de Welford).
+    Permite quitar valores para soportar ventanas deslizantes.
+    """
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x: float):
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.count -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+
+    def merge(self, count: int, mean: float, m2: float):
+        """Combina con otro bloque ya agregado (fórmula de Chan)."""
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    @property
+    def std(self) -> Optional[float]:
+        # Igual que STDDEV de MySQL: NULL sin filas, desviación poblacional con filas
+        if not self.count:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+
+class EwmaStats:
+    """
+    Media y varianza con decaimiento exponencial.
+    En m2 se guarda directamente la varianza (no la suma de cuadrados).
+    """
+    __slots__ = ("alpha", "count", "mean", "m2")
+
+    def __init__(self, alpha: float, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.alpha = alpha
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x: float):
+        self.count += 1
+        if self.count == 1:
+            self.mean, self.m2 = x, 0.0
+            return
+        diff = x - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.m2 = (1 - self.alpha) * (self.m2 + diff * incr)
+
+    @property
+    def std(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return math.sqrt(self.m2)
+
+
+def _stats_mode() -> str:
+    if STATS_EWMA_ALPHA is not None:
+        return f"ewma:{STATS_EWMA_ALPHA}"
+    if STATS_WINDOW is not None:
+        return f"window:{STATS_WINDOW}"
+    return "all"
+
+
+class MachineRunningStats:
+    """Estado estadístico de una máquina (una serie por métrica)."""
+
+    def __init__(self, machine_id: int):
+        self.machine_id = machine_id
+        self.mode = _stats_mode()
+        self.lock = threading.Lock()
+        self.warm = False
+        self.pending = 0
+        self.last_recorded_at = None
+        self.last_id = None
+        self.window = deque() if STATS_WINDOW is not None else None
+        if STATS_EWMA_ALPHA is not None:
+            self.series = {m: EwmaStats(STATS_EWMA_ALPHA) for m in METRICS}
+        else:
+            self.series = {m: RunningStats() for m in METRICS}
+
+    def push(self, values: tuple, recorded_at=None, row_id: Optional[int] = None):
+        for metric, x in zip(METRICS, values):
+            self.series[metric].add(x)
+        if self.window is not None:
+            self.window.append(values)
+            if len(self.window) > STATS_WINDOW:
+                old = self.window.popleft()
+                for metric, x in zip(METRICS, old):
+                    self.series[metric].remove(x)
+        if recorded_at is not None and (self.last_recorded_at is None or recorded_at > self.last_recorded_at):
+            self.last_recorded_at = recorded_at
+        if row_id is not None and (self.last_id is None or row_id > self.last_id):
+            self.last_id = row_id
+
+    def snapshot(self) -> Dict[str, tuple]:
+        """metric -> (mean, std) ; std es None si no hay datos."""
+        return {m: (s.mean, s.std) for m, s in self.series.items()}
+
+
+class StatsRegistry:
+    """
+    Estadísticas incrementales por máquina en memoria.
+    - Cada lectura se evalúa en O(1), sin consultar todo machine_data.
+    - Se hace checkpoint periódico en la tabla machine_stats para sobrevivir reinicios.
+    """
+
+    def __init__(self):
+        self._machines: Dict[int, MachineRunningStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, machine_id: int) -> MachineRunningStats:
+        with self._lock:
+            state = self._machines.get(machine_id)
+            if state is None:
+                state = MachineRunningStats(machine_id)
+                self._machines[machine_id] = state
+            return state
+
+    # ============================
+    # CARGA INICIAL
+    # ============================
+    def _warm(self, db: Session, state: MachineRunningStats, before_id: Optional[int]):
+        """
+        Reconstruye el estado de la máquina desde el checkpoint (o desde el
+        historial si no hay). before_id excluye las filas ya insertadas que se
+        van a analizar a continuación, para no contarlas dos veces.
+        """
+        base = db.query(MachineData).filter(MachineData.machine_id == state.machine_id)
+        if before_id is not None:
+            base = base.filter(MachineData.id < before_id)
+
+        # Ventana deslizante: basta con las últimas N filas (de la ventana
+        # caliente si las tiene todas)
+        if state.window is not None:
+            recent = hot_window.latest(state.machine_id, STATS_WINDOW, before_id)
+            if recent is not None:
+                for temperature, vibration, energy, recorded_at in recent:
+                    state.push((temperature, vibration, energy), recorded_at)
+                return
+            rows = (
+                base.order_by(MachineData.recorded_at.desc(), MachineData.id.desc())
+                .limit(STATS_WINDOW)
+                .all()
+            )
+            for row in reversed(rows):
+                state.push((row.temperature, row.vibration, row.energy_consumption), row.recorded_at, row.id)
+            return
+
+        checkpoint = db.get(MachineStats, state.machine_id)
+        if checkpoint is not None and checkpoint.mode == state.mode:
+            for metric in METRICS:
+                s = state.series[metric]
+                s.count = checkpoint.count
+                s.mean = getattr(checkpoint, f"{metric}_mean")
+                s.m2 = getattr(checkpoint, f"{metric}_m2")
+            state.last_recorded_at = checkpoint.last_recorded_at
+            state.last_id = checkpoint.last_id
+            if checkpoint.last_id is not None:
+                # por id: también entran las lecturas tardías (recorded_at
+                # anterior) y las del mismo segundo que el checkpoint
+                base = base.filter(MachineData.id > checkpoint.last_id)
+            elif checkpoint.last_recorded_at is not None:
+                # checkpoint anterior a last_id
+                base = base.filter(MachineData.recorded_at > checkpoint.last_recorded_at)
+
+        if STATS_EWMA_ALPHA is not None:
+            # El peso de las lecturas más antiguas que ~10/alpha es despreciable
+            limit = int(math.ceil(10 / STATS_EWMA_ALPHA))
+            if checkpoint is None or (checkpoint.last_id is None and checkpoint.last_recorded_at is None):
+                recent = hot_window.latest(state.machine_id, limit, before_id)
+                if recent is not None:
+                    for temperature, vibration, energy, recorded_at in recent:
+                        state.push((temperature, vibration, energy), recorded_at)
+                    return
+            rows = (
+                base.order_by(MachineData.recorded_at.desc(), MachineData.id.desc())
+                .limit(limit)
+                .all()
+            )
+            for row in reversed(rows):
+                state.push((row.temperature, row.vibration, row.energy_consumption), row.recorded_at, row.id)
+            return
+
+        # Todo el historial: un único agregado para las filas no cubiertas por el checkpoint
+        agg = base.with_entities(
+            func.count(MachineData.id),
+            func.max(MachineData.recorded_at),
+            func.max(MachineData.id),
+            func.avg(MachineData.temperature),
+            func.var_pop(MachineData.temperature),
+            func.avg(MachineData.vibration),
+            func.var_pop(MachineData.vibration),
+            func.avg(MachineData.energy_consumption),
+            func.var_pop(MachineData.energy_consumption),
+        ).first()
+
+        count, last_ts, last_id = agg[0], agg[1], agg[2]
+        if count:
+            for i, metric in enumerate(METRICS):
+                mean = float(agg[3 + 2 * i])
+                var = float(agg[4 + 2 * i] or 0.0)
+                state.series[metric].merge(count, mean, var * count)
+            if last_ts is not None and (state.last_recorded_at is None or last_ts > state.last_recorded_at):
+                state.last_recorded_at = last_ts
+            if state.last_id is None or last_id > state.last_id:
+                state.last_id = last_id
+
+    # ============================
+    # ACTUALIZACIÓN
+    # ============================
+    def update(self, db: Session, data_point: MachineData):
+        """
+        Añade el punto a las estadísticas de su máquina y devuelve
+        ({metric: (mean, std)}, checkpointed). Las estadísticas incluyen el
+        propio punto (igual que el AVG/STDDEV anterior, que se calculaba tras
+        insertar la lectura). Si checkpointed es True hay un checkpoint
+        pendiente de commit en la sesión.
+        """
+        state = self._get(data_point.machine_id)
+        with state.lock:
+            if not state.warm:
+                self._warm(db, state, data_point.id)
+                state.warm = True
+
+            state.push(
+                (data_point.temperature, data_point.vibration, data_point.energy_consumption),
+                data_point.recorded_at,
+                data_point.id,
+            )
+            state.pending += 1
+            # La ventana deslizante se recarga desde machine_data, no necesita checkpoint
+            checkpointed = state.window is None and state.pending >= CHECKPOINT_EVERY
+            if checkpointed:
+                self._checkpoint(db, state)
+            return state.snapshot(), checkpointed
+
+    # ============================
+    # CHECKPOINT
+    # ============================
+    def _checkpoint(self, db: Session, state: MachineRunningStats):
+        """Deja el checkpoint en la sesión; lo confirma quien llama (commit)."""
+        any_series = state.series[METRICS[0]]
+        values = {
+            "machine_id": state.machine_id,
+            "mode": state.mode,
+            "count": any_series.count,
+            "last_recorded_at": state.last_recorded_at,
+            "last_id": state.last_id,
+        }
+        for metric in METRICS:
+            values[f"{metric}_mean"] = state.series[metric].mean
+            values[f"{metric}_m2"] = state.series[metric].m2
+        db.merge(MachineStats(**values))
+        # autoflush está desactivado: sin flush, un segundo merge en la misma
+        # sesión (lotes) no vería el primero y duplicaría la fila
+        db.flush()
+        state.pending = 0
+
+    def checkpoint_all(self, db: Session):
+        """Guarda el checkpoint de todas las máquinas con cambios pendientes."""
+        with self._lock:
+            states = list(self._machines.values())
+        for state in states:
+            with state.lock:
+                if not (state.warm and state.pending and state.window is None):
+                    continue
+                # un savepoint por máquina: si una falla (p. ej. se borró y su
+                # FK ya no existe) no arrastra al resto ni al commit final
+                try:
+                    with db.begin_nested():
+                        self._checkpoint(db, state)
+                except Exception as e:
+                    print(f"Error guardando estadísticas de la máquina {state.machine_id}:", e)
+        db.commit()
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._machines.pop(machine_id, None)
+
+
+# instancia global
+stats_registry = StatsRegistry()
@@ -0,0 +1,123 @@
+# analysis/thresholds.py
+
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from bd.models import Machine, ThresholdProfile
+
+
+METRICS = ("temperature", "vibration", "energy_consumption")
+
+# Recarga periódica aunque nadie invalide: con varios procesos (workers de
+# uvicorn, scripts) la invalidación explícita solo llega al proceso que escribió
+THRESHOLD_CACHE_TTL = 60
+
+
+def profile_values(profile: Optional[ThresholdProfile]) -> Dict[str, float]:
+    """Métricas definidas en un perfil (las None se heredan)."""
+    if profile is None:
+        return {}
+    values = {}
+    for metric in METRICS:
+        value = getattr(profile, metric)
+        if value is not None:
+            values[metric] = value
+    return values
+
+
+def resolve_thresholds(defaults: dict, type_values: dict, machine_values: dict):
+    """Umbral efectivo por métrica (máquina → tipo → defecto) y de dónde sale."""
+    thresholds, source = {}, {}
+    for metric in METRICS:
+        if metric in machine_values:
+            thresholds[metric], source[metric] = machine_values[metric], "machine"
+        elif metric in type_values:
+            thresholds[metric], source[metric] = type_values[metric], "type"
+        else:
+            thresholds[metric], source[metric] = defaults[metric], "default"
+    return thresholds, source
+
+
+class ThresholdCache:
+    """
+    Umbrales efectivos por máquina en memoria para el análisis en caliente.
+    - la primera consulta (o tras invalidate / TTL) carga todos los perfiles
+      y el tipo de cada máquina; después, cada lectura es un acceso a dict.
+    - una máquina creada tras la carga cuesta una consulta, una sola vez.
+    - invalidate() no bloquea: sube la generación y el siguiente get recarga.
+    """
+
+    def __init__(self, defaults: dict, ttl: float = THRESHOLD_CACHE_TTL):
+        self.defaults = defaults
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._loaded_generation = -1
+        self._loaded_at = 0.0
+        self._machine_profiles: Dict[int, dict] = {}
+        self._type_profiles: Dict[str, dict] = {}
+        self._machine_types: Dict[int, Optional[str]] = {}
+        self._resolved: Dict[int, dict] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def invalidate(self):
+        self._generation += 1
+
+    def _load(self, db: Session):
+        machine_profiles, type_profiles = {}, {}
+        for profile in db.execute(select(ThresholdProfile)).scalars():
+            if profile.machine_id is not None:
+                machine_profiles[profile.machine_id] = profile_values(profile)
+            elif profile.machine_type is not None:
+                type_profiles[profile.machine_type] = profile_values(profile)
+        self._machine_profiles = machine_profiles
+        self._type_profiles = type_profiles
+        self._machine_types = dict(db.execute(select(Machine.id, Machine.machine_type)).all())
+        self._resolved = {}
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    def get(self, db: Session, machine_id: int) -> dict:
+        """Umbrales efectivos {métrica: valor} de la máquina."""
+        with self._lock:
+            generation = self._generation
+            if generation != self._loaded_generation or time.monotonic() - self._loaded_at > self.ttl:
+                self._load(db)
+                self._loaded_generation = generation
+
+            thresholds = self._resolved.get(machine_id)
+            if thresholds is not None:
+                self.hits += 1
+                return thresholds
+
+            self.misses += 1
+            if machine_id not in self._machine_types:
+                self._machine_types[machine_id] = db.execute(
+                    select(Machine.machine_type).where(Machine.id == machine_id)
+                ).scalar()
+            machine_type = self._machine_types[machine_id]
+            thresholds, _ = resolve_thresholds(
+                self.defaults,
+                self._type_profiles.get(machine_type, {}) if machine_type else {},
+                self._machine_profiles.get(machine_id, {}),
+            )
+            self._resolved[machine_id] = thresholds
+            return thresholds
+
+    def stats(self) -> dict:
+        return {
+            "machines_cached": len(self._resolved),
+            "machine_profiles": len(self._machine_profiles),
+            "type_profiles": len(self._type_profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "ttl": self.ttl,
+        }
@@ -1,17 +1,24 @@
 # 1
 
+import os
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-# Variables de conexion
+from bd import profiling
+
+# Variables de conexion (se pueden sobreescribir con variables de entorno)
 
-MYSQL_USER = "root"
-MYSQL_PASSWORD = ""
-MYSQL_HOST = "localhost"
-MYSQL_DB = "bdmaquinaria"
+MYSQL_USER = os.getenv("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
+MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
+MYSQL_DB = os.getenv("MYSQL_DB", "bdmaquinaria")
 
 # URL DE CONEXION
 DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+# URL DE CONEXION ASINCRONA (routers): mismo servidor con el driver aiomysql
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
 
 # OBJETO QUE MANEJA LA CONEXION
 engine = create_engine(DATABASE_URL)
@@ -22,6 +29,17 @@ engine = create_engine(DATABASE_URL)
 # - bind=engine → vincula la sesión al motor de base de datos creado antes.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor y sesiones asíncronas para los routers: las consultas no bloquean el
+# event loop (websockets y simulador siguen atendiéndose mientras tanto).
+# - expire_on_commit=False → los objetos siguen legibles tras el commit sin
+#   otra consulta (en async no hay carga perezosa de atributos).
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Perfilado de consultas por petición / tick (solo con SQL_PROFILE=1, ver bd/profiling.py)
+profiling.install(engine)
+profiling.install(async_engine.sync_engine)
+
 # Se crea la clase "Base" para declarar los modelos de la base de datos (tablas)
 Base = declarative_base()
 
@@ -34,4 +52,10 @@ def get_db():
         yield db
     finally:
         # Al terminar, se asegura que la sesión se cierre (libera recursos).
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Versión asíncrona de get_db para los routers
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
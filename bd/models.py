@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Date, DateTime, Enum, Float, ForeignKey, Integer, String, Text, DECIMAL, func
+from sqlalchemy import Column, Date, DateTime, Enum, Float, ForeignKey, Index, Integer, String, Text, DECIMAL, func
 from bd.database import Base
 from sqlalchemy.orm import relationship
 
@@ -11,6 +11,9 @@ TABLES
 - machine
 - machine_data
 - alerts
+- machine_stats
+- machine_data_rollups
+- threshold_profiles
 
 """
 
@@ -20,6 +23,8 @@ class Machine(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
+    # tipo de máquina (compresor, cinta...): agrupa umbrales en threshold_profiles
+    machine_type = Column(String(50), nullable=True)
     image_url = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=func.now())
 
@@ -41,12 +46,25 @@ class MachineData(Base):
     # Relación inversa
     machine = relationship("Machine", back_populates="data")
 
+    __table_args__ = (
+        # consultas por máquina y rango de tiempo + paginación keyset (recorded_at, id)
+        Index("ix_machine_data_machine_recorded", "machine_id", "recorded_at", "id"),
+        # purga por antigüedad (retention.py)
+        Index("ix_machine_data_recorded", "recorded_at"),
+    )
+
 class AlertType(str, enum.Enum):
     warning = "advertencia"
     critical = "critico"
     stable = "estable"
 
 
+class AlertStatus(str, enum.Enum):
+    open = "abierta"
+    ongoing = "en_curso"
+    resolved = "resuelta"
+
+
 class Alert(Base):
     __tablename__ = "alerts"
 
@@ -58,10 +76,91 @@ class Alert(Base):
     message = Column(Text)
     created_at = Column(DateTime, default=func.now())
 
+    # Ciclo de vida (analisys/alerting.py): una alerta por condición sostenida
+    status = Column(Enum(AlertStatus), nullable=False, default=AlertStatus.open)
+    condition = Column(String(50), nullable=True)  # None → alerta creada a mano
+    last_seen_at = Column(DateTime, default=func.now())
+    occurrences = Column(Integer, nullable=False, default=1)
+    peak_value = Column(Float, nullable=True)
+    resolved_at = Column(DateTime, nullable=True)
+
     # Relación inversa
     machine = relationship("Machine", back_populates="alerts")
 
+    __table_args__ = (
+        Index("ix_alerts_created", "created_at"),
+        # purga por antigüedad (retention.py): una alerta en curso no caduca
+        Index("ix_alerts_last_seen", "last_seen_at"),
+        # alertas abiertas por máquina (carga del AlertTracker)
+        Index("ix_alerts_machine_status", "machine_id", "status"),
+        # /alerts_machine/ de más nueva a más vieja (keyset), con o sin filtro de tipo
+        Index("ix_alerts_machine_created", "machine_id", "created_at", "id"),
+        Index("ix_alerts_machine_type_created", "machine_id", "alert_type", "created_at", "id"),
+    )
+
+
+class MachineStats(Base):
+    """Checkpoint de las estadísticas incrementales (analisys/stats.py) por máquina."""
+    __tablename__ = "machine_stats"
+
+    machine_id = Column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), primary_key=True)
+    mode = Column(String(30), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    # Float(53) → DOUBLE en MySQL (FLOAT simple pierde precisión en m2)
+    temperature_mean = Column(Float(53), nullable=False, default=0.0)
+    temperature_m2 = Column(Float(53), nullable=False, default=0.0)
+    vibration_mean = Column(Float(53), nullable=False, default=0.0)
+    vibration_m2 = Column(Float(53), nullable=False, default=0.0)
+    energy_consumption_mean = Column(Float(53), nullable=False, default=0.0)
+    energy_consumption_m2 = Column(Float(53), nullable=False, default=0.0)
+
+    last_recorded_at = Column(DateTime, nullable=True)
+    # mayor machine_data.id incluido: al arrancar se suman las filas con id mayor
+    last_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class MachineDataRollup(Base):
+    """
+    Agregados de machine_data por máquina y bucket de tiempo (crud/rollups.py).
+    resolution = segundos por bucket (60 → 1 minuto, 3600 → 1 hora).
+    """
+    __tablename__ = "machine_data_rollups"
+
+    machine_id = Column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    temperature_min = Column(Float(53), nullable=False)
+    temperature_max = Column(Float(53), nullable=False)
+    temperature_sum = Column(Float(53), nullable=False)
+    temperature_sumsq = Column(Float(53), nullable=False)
+    vibration_min = Column(Float(53), nullable=False)
+    vibration_max = Column(Float(53), nullable=False)
+    vibration_sum = Column(Float(53), nullable=False)
+    vibration_sumsq = Column(Float(53), nullable=False)
+    energy_consumption_min = Column(Float(53), nullable=False)
+    energy_consumption_max = Column(Float(53), nullable=False)
+    energy_consumption_sum = Column(Float(53), nullable=False)
+    energy_consumption_sumsq = Column(Float(53), nullable=False)
+
+
+class ThresholdProfile(Base):
+    """
+    Umbrales de alerta de una máquina (machine_id) o de un tipo de máquina
+    (machine_type); solo uno de los dos. Una métrica a None se hereda:
+    máquina → tipo → THRESHOLDS de analisys/predictive.py.
+    """
+    __tablename__ = "threshold_profiles"
 
+    id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=True, unique=True)
+    machine_type = Column(String(50), nullable=True, unique=True)
 
+    temperature = Column(Float, nullable=True)
+    vibration = Column(Float, nullable=True)
+    energy_consumption = Column(Float, nullable=True)
 
-
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
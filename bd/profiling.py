@@ -0,0 +1,243 @@
+# bd/profiling.py
+"""
+Perfilado de SQL por unidad de trabajo (petición HTTP, mensaje WebSocket,
+tick del simulador, lote de la ingesta) con eventos del engine.
+
+Se activa con SQL_PROFILE=1 (por defecto apagado: sin listeners ni middleware).
+- profile_scope(etiqueta) abre una unidad; las consultas que se ejecuten
+  dentro (también en hilos de asyncio.to_thread y en el AsyncSession, que
+  heredan el contexto) se suman a ella mediante un ContextVar.
+- por unidad: nº de consultas, tiempo total en BD, la más lenta y las
+  sentencias repetidas (pista de N+1 y de round trips redundantes).
+- las consultas de más de SQL_SLOW_MS van al logger "sql.slow" (y a
+  SQL_SLOW_LOG si se indica un fichero), con o sin unidad abierta.
+- en HTTP se añaden las cabeceras X-DB-Queries / X-DB-Time-Ms / X-DB-Slowest-Ms
+  y GET /debug/sql muestra el resumen por etiqueta y las últimas unidades.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "200"))
+SQL_SLOW_LOG = os.getenv("SQL_SLOW_LOG")
+# Unidades y consultas lentas recientes que se guardan para /debug/sql
+SQL_PROFILE_RECENT = int(os.getenv("SQL_PROFILE_RECENT", "200"))
+
+# Longitud máxima de una sentencia en informes y log
+STATEMENT_MAX_CHARS = 500
+
+slow_log = logging.getLogger("sql.slow")
+if SQL_SLOW_LOG:
+    _handler = logging.FileHandler(SQL_SLOW_LOG)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.INFO)
+
+
+def _short(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > STATEMENT_MAX_CHARS:
+        return statement[:STATEMENT_MAX_CHARS] + "…"
+    return statement
+
+
+class QueryProfile:
+    """Consultas de una unidad de trabajo."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.queries = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql: Optional[str] = None
+        # sentencia -> veces (mismo texto parametrizado = misma consulta)
+        self.statements: Dict[str, int] = {}
+
+    def add(self, statement: str, elapsed_ms: float):
+        self.queries += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_sql = statement
+
+    def repeated(self, limit: int = 5) -> list:
+        items = sorted(
+            ((sql, n) for sql, n in self.statements.items() if n > 1),
+            key=lambda item: item[1], reverse=True,
+        )
+        return [{"count": n, "sql": _short(sql)} for sql, n in items[:limit]]
+
+    def summary(self) -> dict:
+        return {
+            "label": self.label,
+            "queries": self.queries,
+            "db_ms": round(self.total_ms, 3),
+            "slowest_ms": round(self.slowest_ms, 3),
+            "slowest_sql": _short(self.slowest_sql) if self.slowest_sql else None,
+            "repeated": self.repeated(),
+        }
+
+
+class ProfileStats:
+    """Agregado por etiqueta y últimas unidades / consultas lentas (para /debug/sql)."""
+
+    def __init__(self, recent: int = SQL_PROFILE_RECENT):
+        self._lock = threading.Lock()
+        self.by_label: Dict[str, dict] = {}
+        self.recent = deque(maxlen=recent)
+        self.slow = deque(maxlen=recent)
+
+    def finish(self, profile: QueryProfile):
+        with self._lock:
+            agg = self.by_label.get(profile.label)
+            if agg is None:
+                agg = {"units": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0, "max_db_ms": 0.0}
+                self.by_label[profile.label] = agg
+            agg["units"] += 1
+            agg["queries"] += profile.queries
+            agg["db_ms"] += profile.total_ms
+            agg["max_queries"] = max(agg["max_queries"], profile.queries)
+            agg["max_db_ms"] = max(agg["max_db_ms"], profile.total_ms)
+            if profile.queries:
+                self.recent.append(profile.summary())
+
+    def slow_query(self, label: Optional[str], statement: str, elapsed_ms: float):
+        with self._lock:
+            self.slow.append({
+                "label": label,
+                "ms": round(elapsed_ms, 3),
+                "sql": _short(statement),
+                "at": time.time(),
+            })
+
+    def report(self) -> dict:
+        with self._lock:
+            by_label = {
+                label: {
+                    "units": agg["units"],
+                    "avg_queries": round(agg["queries"] / agg["units"], 2),
+                    "avg_db_ms": round(agg["db_ms"] / agg["units"], 3),
+                    "max_queries": agg["max_queries"],
+                    "max_db_ms": round(agg["max_db_ms"], 3),
+                }
+                for label, agg in sorted(self.by_label.items(), key=lambda item: -item[1]["db_ms"])
+            }
+            return {
+                "enabled": SQL_PROFILE,
+                "slow_ms": SQL_SLOW_MS,
+                "by_label": by_label,
+                "recent": list(self.recent),
+                "slow_queries": list(self.slow),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.by_label.clear()
+            self.recent.clear()
+            self.slow.clear()
+
+
+_current: ContextVar[Optional[QueryProfile]] = ContextVar("sql_profile", default=None)
+profile_stats = ProfileStats()
+
+
+# ============================
+# UNIDADES DE TRABAJO
+# ============================
+@contextmanager
+def profile_scope(label: str):
+    """Abre una unidad de trabajo; con el perfilado apagado no hace nada (devuelve None)."""
+    if not SQL_PROFILE:
+        yield None
+        return
+    profile = QueryProfile(label)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile_stats.finish(profile)
+
+
+# ============================
+# EVENTOS DEL ENGINE
+# ============================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    profile = _current.get()
+    if profile is not None:
+        profile.add(statement, elapsed_ms)
+    if elapsed_ms >= SQL_SLOW_MS:
+        label = profile.label if profile is not None else None
+        profile_stats.slow_query(label, statement, elapsed_ms)
+        slow_log.warning("%.1f ms [%s] %s", elapsed_ms, label or "-", _short(statement))
+
+
+def _handle_error(exception_context):
+    # la consulta falló: se descarta su inicio para no desalinear la pila
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def install(engine):
+    """Engancha el perfilado a un engine (para el asíncrono, su sync_engine)."""
+    if not SQL_PROFILE:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ============================
+# HTTP
+# ============================
+class SQLProfileMiddleware:
+    """
+    Una unidad por petición HTTP (etiqueta "MÉTODO /ruta") y cabeceras con su
+    resumen. Las consultas que se hagan mientras se envía un cuerpo en
+    streaming ya no caben en las cabeceras, pero sí cuentan en /debug/sql.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_PROFILE:
+            await self.app(scope, receive, send)
+            return
+
+        with profile_scope(f"{scope['method']} {scope['path']}") as profile:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers += [
+                        (b"x-db-queries", str(profile.queries).encode()),
+                        (b"x-db-time-ms", f"{profile.total_ms:.3f}".encode()),
+                        (b"x-db-slowest-ms", f"{profile.slowest_ms:.3f}".encode()),
+                    ]
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # agrupa por plantilla de ruta, no por URL concreta
+                route = scope.get("route")
+                if route is not None:
+                    profile.label = f"{scope['method']} {route.path}"
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
-from bd.models import AlertType
+from typing import Dict, List, Optional
+from bd.models import AlertStatus, AlertType
 
 
 # ============================================================
@@ -11,17 +11,22 @@ from bd.models import AlertType
 class MachineCreate(BaseModel):
     name: str = Field(..., min_length=2, max_length=100)
     description: Optional[str] = None
+    machine_type: Optional[str] = Field(None, max_length=50)
 
 
 class MachineUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=2, max_length=100)
     description: Optional[str] = None
+    machine_type: Optional[str] = Field(None, max_length=50)
 
 
 class MachineResponse(BaseModel):
     id: int
     name: str
     description: Optional[str] = None
+    machine_type: Optional[str] = None
+    # /machine_images/<sha256>.<ext>; la miniatura está en <image_url>/thumbnail
+    image_url: Optional[str] = None
     created_at: datetime
 
     class Config:
@@ -48,6 +53,41 @@ class MachineDataResponse(MachineDataBase):
         from_attributes = True
 
 
+class MachineDataBatchError(BaseModel):
+    index: int
+    error: str
+
+
+class MachineDataBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    # aceptadas que quedaron en el spool local (BD no disponible)
+    spooled: int = 0
+    errors: List[MachineDataBatchError] = []
+
+
+class SeriesStats(BaseModel):
+    min: float
+    max: float
+    avg: float
+    std: float
+
+
+class SeriesPoint(BaseModel):
+    ts: datetime
+    count: int
+    temperature: SeriesStats
+    vibration: SeriesStats
+    energy_consumption: SeriesStats
+
+
+class SeriesResponse(BaseModel):
+    machine_id: int
+    # segundos por punto; None → lecturas crudas
+    resolution: Optional[int] = None
+    points: List[SeriesPoint]
+
+
 # ============================================================
 # ALERT SCHEMAS
 # ============================================================
@@ -62,8 +102,80 @@ class AlertCreate(BaseModel):
 class AlertResponse(AlertCreate):
     id: int
     created_at: datetime
+    status: AlertStatus = AlertStatus.open
+    condition: Optional[str] = None
+    last_seen_at: Optional[datetime] = None
+    occurrences: int = 1
+    peak_value: Optional[float] = None
+    resolved_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class AlertCount(BaseModel):
+    # solo vienen los campos por los que se agrupa
+    machine_id: Optional[int] = None
+    alert_type: Optional[AlertType] = None
+    bucket: Optional[datetime] = None
+    count: int
+    occurrences: int
+
+
+# ============================================================
+# THRESHOLD SCHEMAS
+# ============================================================
+
+class ThresholdValues(BaseModel):
+    # None → se hereda del tipo de máquina o de los valores por defecto
+    temperature: Optional[float] = Field(None, gt=0)
+    vibration: Optional[float] = Field(None, gt=0)
+    energy_consumption: Optional[float] = Field(None, gt=0)
+
+
+class ThresholdProfileResponse(ThresholdValues):
+    id: int
+    machine_id: Optional[int] = None
+    machine_type: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class EffectiveThresholds(BaseModel):
+    machine_id: int
+    machine_type: Optional[str] = None
+    thresholds: Dict[str, float]
+    # métrica -> "machine" | "type" | "default"
+    source: Dict[str, str]
+
+
+# ============================================================
+# FLEET SNAPSHOT SCHEMAS
+# ============================================================
+
+class FleetAlert(BaseModel):
+    alert_id: int
+    condition: str
+    alert_type: AlertType
+    status: AlertStatus
+    last_seen_at: datetime
+    occurrences: int
+    peak_value: Optional[float] = None
+
+
+class FleetMachineStatus(BaseModel):
+    id: int
+    name: str
+    machine_type: Optional[str] = None
+    # "critical" | "warning" | "ok" | "no_data"
+    status: str
+    last_reading: Optional[MachineDataResponse] = None
+    alerts: List[FleetAlert] = []
+
+
+class FleetSnapshot(BaseModel):
+    generated_at: datetime
+    counts: Dict[str, int]
+    machines: List[FleetMachineStatus]
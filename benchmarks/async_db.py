@@ -0,0 +1,110 @@
+# benchmarks/async_db.py
+"""
+Latencia de peticiones concurrentes contra un servidor en marcha.
+
+Mide p50/p95/p99 de /machines, /datas_machine/ y /alerts_machine/ con
+N clientes concurrentes, y a la vez el ping/pong de un WebSocket de
+/realtime/machine/ (si el event loop se bloquea en una consulta, el pong
+llega tarde).
+
+Antes/después:
+
+    # con el servidor de la versión anterior en marcha
+    python -m benchmarks.async_db --out before.json
+    # con el servidor de esta versión
+    python -m benchmarks.async_db --out after.json
+    python -m benchmarks.async_db --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import websockets
+
+from benchmarks.common import compare, summarize, write_result
+
+
+async def http_worker(client: httpx.AsyncClient, paths: list, deadline: float, samples: dict, errors: dict):
+    i = 0
+    while time.perf_counter() < deadline:
+        name, path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            r = await client.get(path)
+            ok = r.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok:
+            samples[name].append(elapsed)
+        else:
+            errors[name] = errors.get(name, 0) + 1
+
+
+async def ws_probe(ws_url: str, deadline: float, interval: float, samples: list):
+    async with websockets.connect(ws_url) as ws:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await ws.send("ping")
+            while await ws.recv() != "pong":
+                pass
+            samples.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(interval)
+
+
+async def run(args) -> dict:
+    paths = [
+        ("GET /machines", "/machines"),
+        ("GET /datas_machine/", f"/datas_machine/?machine_id={args.machine_id}&limit={args.limit}"),
+        ("GET /alerts_machine/", f"/alerts_machine/?machine_id={args.machine_id}"),
+    ]
+    samples = {name: [] for name, _ in paths}
+    errors = {}
+    ws_samples = []
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        # calentamiento (pool de conexiones, cachés)
+        await client.get("/machines")
+        deadline = time.perf_counter() + args.duration
+        ws_url = args.url.replace("http", "ws", 1) + f"/realtime/machine/?machine_id={args.machine_id}"
+        tasks = [http_worker(client, paths, deadline, samples, errors) for _ in range(args.concurrency)]
+        tasks.append(ws_probe(ws_url, deadline, 0.05, ws_samples))
+        await asyncio.gather(*tasks)
+
+    results = {name: summarize(s) for name, s in samples.items()}
+    results["WS ping/pong"] = summarize(ws_samples)
+    for name, n in errors.items():
+        results[name]["errors"] = n
+    total = sum(len(s) for s in samples.values())
+    results["throughput_rps"] = round(total / args.duration, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--machine-id", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--out", default="async_db.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = asyncio.run(run(args))
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    write_result(args.out, "async_db", config, results)
+    for name, r in results.items():
+        print(name, r)
+
+
+if __name__ == "__main__":
+    main()
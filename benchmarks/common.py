@@ -0,0 +1,75 @@
+# benchmarks/common.py
+# Utilidades compartidas por los benchmarks (percentiles y ficheros de resultado).
+
+import json
+import math
+import platform
+import subprocess
+import time
+
+
+def percentile(sorted_samples: list, p: float):
+    """Percentil p (0-100) por rango más cercano; None si no hay muestras."""
+    if not sorted_samples:
+        return None
+    k = max(0, min(len(sorted_samples) - 1, math.ceil(p / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[k]
+
+
+def summarize(samples_ms: list) -> dict:
+    """Resumen de una serie de latencias en milisegundos."""
+    s = sorted(samples_ms)
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s), 3) if s else None,
+        "p50_ms": _round(percentile(s, 50)),
+        "p95_ms": _round(percentile(s, 95)),
+        "p99_ms": _round(percentile(s, 99)),
+        "max_ms": _round(s[-1] if s else None),
+    }
+
+
+def _round(x):
+    return round(x, 3) if x is not None else None
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def write_result(path: str, name: str, config: dict, results: dict):
+    """Escribe el resultado como JSON (para comparar entre versiones)."""
+    doc = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+    return doc
+
+
+def compare(before_path: str, after_path: str, keys=("p50_ms", "p95_ms", "p99_ms")):
+    """Imprime una tabla antes/después para cada serie con latencias."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'serie':40} " + " ".join(f"{k:>22}" for k in keys))
+    for name, a in sorted(after["results"].items()):
+        b = before["results"].get(name)
+        if not isinstance(a, dict) or not isinstance(b, dict):
+            continue
+        cells = []
+        for k in keys:
+            if a.get(k) is None or b.get(k) is None:
+                cells.append(f"{'-':>22}")
+            else:
+                cells.append(f"{b[k]:>9.2f} → {a[k]:>9.2f}".rjust(22))
+        print(f"{name:40} " + " ".join(cells))
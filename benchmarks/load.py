@@ -0,0 +1,299 @@
+# benchmarks/load.py
+"""
+Prueba de carga de extremo a extremo con la app arrancada en el propio proceso.
+
+Levanta `main.app` con uvicorn contra la BD configurada (MYSQL_* en el
+entorno; usar una base de datos de pruebas con MYSQL_DB), crea --machines máquinas y
+durante --duration segundos, a la vez:
+- el simulador genera lecturas de esas máquinas cada --sim-interval segundos
+- se hacen POST /new_machine_data a --ingest-rate peticiones/s
+- se leen /datas_machine/, /alerts_machine/ y /machines a --read-rate peticiones/s
+- --ws-subscribers clientes siguen las máquinas por /realtime/fleet/
+
+Las peticiones HTTP van en bucle abierto: la latencia se mide desde el
+instante en que tocaba lanzarlas, así un servidor saturado no esconde su
+cola (coordinated omission). El retraso de WebSocket es la diferencia entre
+recorded_at de la lectura y su llegada al cliente.
+
+El resultado (throughput, p50/p95/p99, retraso WS y filas escritas en BD)
+se guarda como JSON para comparar versiones:
+
+    python -m benchmarks.load --machines 500 --sim-interval 1 --out before.json
+    python -m benchmarks.load --machines 500 --sim-interval 1 --out after.json
+    python -m benchmarks.load --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+import uvicorn
+import websockets
+from sqlalchemy import func, select
+
+from benchmarks.common import compare, summarize, write_result
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Series:
+    """Latencias y errores de un tipo de petición."""
+
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+
+    def result(self, duration: float) -> dict:
+        r = summarize(self.samples)
+        r["errors"] = self.errors
+        r["achieved_rps"] = round(len(self.samples) / duration, 1)
+        return r
+
+
+async def open_loop(rate: float, duration: float, request, max_in_flight: int):
+    """
+    Lanza request(scheduled) a ritmo fijo sin esperar respuestas. Si hay
+    max_in_flight peticiones pendientes, la siguiente se cuenta como skipped.
+    """
+    if rate <= 0:
+        return
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    end = start + duration
+    pending = set()
+    n = 0
+    while True:
+        scheduled = start + n * interval
+        if scheduled >= end:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        n += 1
+        if len(pending) >= max_in_flight:
+            request.skipped += 1
+            continue
+        task = asyncio.create_task(request(scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+class HttpRequests:
+    """Genera peticiones (nombre, método, ruta, cuerpo) y anota su latencia."""
+
+    def __init__(self, client: httpx.AsyncClient, choose):
+        self.client = client
+        self.choose = choose
+        self.series = {}
+        # peticiones no lanzadas por haber max_in_flight pendientes
+        self.skipped = 0
+
+    async def __call__(self, scheduled: float):
+        name, method, path, kwargs = self.choose()
+        series = self.series.setdefault(name, Series())
+        try:
+            r = await self.client.request(method, path, **kwargs)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            series.samples.append((time.perf_counter() - scheduled) * 1000)
+        else:
+            series.errors += 1
+
+
+async def ws_subscriber(ws_url: str, machine_ids: list, deadline: float, lags: list, counter: dict):
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        await ws.send(json.dumps({"action": "subscribe", "machine_ids": machine_ids}))
+        while True:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout)
+            except asyncio.TimeoutError:
+                return
+            now = datetime.utcnow()
+            frame = json.loads(message)
+            data = frame.get("data")
+            if not data:
+                continue
+            counter["frames"] += 1
+            lags.append((now - datetime.fromisoformat(data["recorded_at"])).total_seconds() * 1000)
+
+
+def count_rows(machine_ids: list) -> dict:
+    from bd.database import SessionLocal
+    from bd.models import Alert, MachineData
+
+    db = SessionLocal()
+    try:
+        return {
+            "machine_data": db.execute(
+                select(func.count(MachineData.id)).where(MachineData.machine_id.in_(machine_ids))
+            ).scalar(),
+            "alerts": db.execute(
+                select(func.count(Alert.id)).where(Alert.machine_id.in_(machine_ids))
+            ).scalar(),
+        }
+    finally:
+        db.close()
+
+
+async def wait_ingestion_drained(pipeline, timeout: float = 60.0):
+    """Espera a que la cola de ingesta se vacíe y el último lote se escriba."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if pipeline.stats()["queue_depth"] == 0:
+            await asyncio.sleep(pipeline.max_delay * 2 + 0.2)
+            if pipeline.stats()["queue_depth"] == 0:
+                return
+        await asyncio.sleep(0.1)
+
+
+async def run(args) -> dict:
+    # importa la app aquí: create_all y las conexiones usan la BD del entorno
+    import main
+    from ingestion import ingestion_pipeline
+    from simulator import simulator
+
+    port = args.port or free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            # máquinas propias de esta ejecución
+            run_id = uuid.uuid4().hex[:8]
+            machine_ids = []
+            for i in range(args.machines):
+                r = await client.post("/new_machine", data={"name": f"bench-{run_id}-{i}"})
+                r.raise_for_status()
+                machine_ids.append(r.json()["id"])
+            before = await asyncio.to_thread(count_rows, machine_ids)
+
+            def choose_ingest():
+                reading = {
+                    "machine_id": random.choice(machine_ids),
+                    "temperature": round(random.uniform(50.0, 70.0), 2),
+                    "vibration": round(random.uniform(0.5, 1.5), 3),
+                    "energy_consumption": round(random.uniform(200.0, 450.0), 2),
+                    "recorded_at": datetime.utcnow().isoformat(),
+                }
+                return "POST /new_machine_data", "POST", "/new_machine_data", {"json": reading}
+
+            def choose_read():
+                machine_id = random.choice(machine_ids)
+                return random.choice((
+                    ("GET /datas_machine/", "GET", f"/datas_machine/?machine_id={machine_id}&limit={args.limit}", {}),
+                    ("GET /alerts_machine/", "GET", f"/alerts_machine/?machine_id={machine_id}", {}),
+                    ("GET /machines", "GET", "/machines", {}),
+                ))
+
+            ingest = HttpRequests(client, choose_ingest)
+            reads = HttpRequests(client, choose_read)
+
+            ws_lags, ws_counter = [], {"frames": 0}
+            ws_url = base_url.replace("http", "ws", 1) + "/realtime/fleet/"
+            deadline = time.perf_counter() + args.duration
+
+            # suscriptores antes del simulador para no perder las primeras lecturas
+            subscribers = [
+                asyncio.create_task(ws_subscriber(ws_url, machine_ids, deadline + 1.0, ws_lags, ws_counter))
+                for _ in range(args.ws_subscribers)
+            ]
+            await asyncio.sleep(0.2)
+            if args.sim_interval > 0:
+                await simulator.start_all(machine_ids, interval=args.sim_interval, jitter=args.sim_jitter)
+
+            started = time.perf_counter()
+            await asyncio.gather(
+                open_loop(args.ingest_rate, args.duration, ingest, args.max_in_flight),
+                open_loop(args.read_rate, args.duration, reads, args.max_in_flight),
+            )
+            for mid in machine_ids:
+                await simulator.stop_machine(mid)
+            elapsed = time.perf_counter() - started
+            await asyncio.gather(*subscribers, return_exceptions=True)
+
+            await wait_ingestion_drained(ingestion_pipeline)
+            after = await asyncio.to_thread(count_rows, machine_ids)
+            realtime = (await client.get("/realtime/stats")).json()
+            realtime.pop("per_connection", None)
+    finally:
+        server.should_exit = True
+        await server_task
+
+    results = {}
+    for requests in (ingest, reads):
+        for name, series in requests.series.items():
+            results[name] = series.result(elapsed)
+    results["WS delivery lag"] = summarize(ws_lags)
+    results["WS delivery lag"]["frames"] = ws_counter["frames"]
+
+    rows_added = after["machine_data"] - before["machine_data"]
+    http_ok = sum(len(s.samples) for r in (ingest, reads) for s in r.series.values())
+    results["throughput"] = {
+        "http_rps": round(http_ok / elapsed, 1),
+        "readings_written_per_s": round(rows_added / elapsed, 1),
+        "ws_frames_per_s": round(ws_counter["frames"] / elapsed, 1),
+        "skipped_ingest": ingest.skipped,
+        "skipped_reads": reads.skipped,
+    }
+    results["db"] = {
+        "machine_data_rows_added": rows_added,
+        "alerts_added": after["alerts"] - before["alerts"],
+    }
+    results["ingestion"] = ingestion_pipeline.stats()
+    results["simulator"] = simulator.stats()
+    results["realtime"] = realtime
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0, help="0 → puerto libre")
+    parser.add_argument("--machines", type=int, default=100)
+    parser.add_argument("--sim-interval", type=float, default=1.0, help="0 → sin simulador")
+    parser.add_argument("--sim-jitter", type=float, default=0.1)
+    parser.add_argument("--ingest-rate", type=float, default=50.0, help="POST /new_machine_data por segundo")
+    parser.add_argument("--read-rate", type=float, default=50.0, help="lecturas HTTP por segundo")
+    parser.add_argument("--ws-subscribers", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--out", default="load.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = asyncio.run(run(args))
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare", "port")}
+    write_result(args.out, "load", config, results)
+    for name, r in results.items():
+        print(name, r)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# broadcast.py
+"""
+Difusión entre workers (uvicorn --workers N) para lo que cada proceso tiene
+en memoria: conexiones WebSocket y órdenes al simulador.
+
+Cada backend reparte mensajes (texto) por canales a los demás workers; la
+entrega local la hace quien publica, así el camino de un solo proceso no
+paga serialización extra.
+- "inprocess" (por defecto): un solo worker, publish no hace nada.
+- "unix": un socket Unix de datagramas por worker en BROADCAST_DIR; los
+  mensajes de una vuelta del event loop se agrupan en un datagrama por par.
+  Enviar nunca bloquea: si el buffer de un worker está lleno (no lee), sus
+  datagramas se descartan y se cuentan, igual que con un cliente WS lento.
+"""
+
+import asyncio
+import errno
+import os
+import socket
+import time
+from typing import Callable, Dict, List, Optional
+
+
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "inprocess")
+BROADCAST_DIR = os.getenv("BROADCAST_DIR", "/tmp/smaquina-broadcast")
+
+# Tamaño máximo de un datagrama (bytes); los mensajes se agrupan hasta este tamaño
+MAX_DATAGRAM = 60000
+# Buffer de recepción pedido al kernel (lo limita net.core.rmem_max)
+RECV_BUFFER = 4 * 1024 * 1024
+# Cada cuánto se vuelve a listar BROADCAST_DIR para ver workers nuevos (segundos)
+PEER_REFRESH = 1.0
+
+# separadores: entre mensajes de un datagrama y entre canal y mensaje
+_RECORD = "\x1e"
+_CHANNEL = "\x1f"
+
+
+class InProcessBroadcast:
+    """Un único proceso: no hay a quién reenviar."""
+
+    multiprocess = False
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]):
+        """handler(mensaje) se llama con lo que publiquen los demás workers en channel."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, channel: str, message: str):
+        """Envía message a los demás workers (aquí no hay ninguno)."""
+
+    def stats(self) -> dict:
+        return {"backend": "inprocess"}
+
+
+class UnixSocketBroadcast(InProcessBroadcast):
+    """
+    Datagramas Unix entre los workers de una máquina. Cada worker se
+    registra como <directorio>/<pid>.sock; publicar es sendto() a cada
+    socket del directorio. Los sockets de workers muertos (ECONNREFUSED)
+    se borran al detectarlos.
+    """
+
+    multiprocess = True
+
+    def __init__(self, directory: str = BROADCAST_DIR):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._flush_scheduled = False
+
+        # contadores
+        self.sent = 0
+        self.received = 0
+        self.datagrams_sent = 0
+        self.datagrams_received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    async def start(self):
+        if self._sock is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            # restos de un proceso anterior con el mismo pid
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+        self._refresh_peers()
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        self._flush()
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    # ============================
+    # ENVÍO
+    # ============================
+    def publish(self, channel: str, message: str):
+        if self._sock is None:
+            return
+        record = channel + _CHANNEL + message
+        self._pending.append(record)
+        self._pending_bytes += len(record) + 1
+        self.sent += 1
+        if self._pending_bytes >= MAX_DATAGRAM:
+            self._flush()
+        elif not self._flush_scheduled:
+            # lo publicado en esta vuelta del loop (un tick del simulador) sale junto
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _refresh_peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        own = os.path.basename(self.path)
+        self._peers = [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(".sock") and name != own
+        ]
+        self._peers_at = time.monotonic()
+
+    def _datagrams(self, records: List[str]):
+        chunk: List[str] = []
+        size = 0
+        for record in records:
+            length = len(record.encode()) + 1
+            if chunk and size + length > MAX_DATAGRAM:
+                yield _RECORD.join(chunk).encode()
+                chunk, size = [], 0
+            chunk.append(record)
+            size += length
+        if chunk:
+            yield _RECORD.join(chunk).encode()
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self._pending or self._sock is None:
+            return
+        records = self._pending
+        self._pending = []
+        self._pending_bytes = 0
+        if time.monotonic() - self._peers_at > PEER_REFRESH:
+            self._refresh_peers()
+        if not self._peers:
+            return
+
+        datagrams = list(self._datagrams(records))
+        gone = []
+        for peer in self._peers:
+            for data in datagrams:
+                try:
+                    self._sock.sendto(data, peer)
+                    self.datagrams_sent += 1
+                except BlockingIOError:
+                    # el worker no está leyendo: se pierde este datagrama, no se espera
+                    self.dropped += 1
+                except (ConnectionRefusedError, FileNotFoundError):
+                    gone.append(peer)
+                    break
+                except OSError as e:
+                    self.errors += 1
+                    if e.errno != errno.EMSGSIZE:
+                        break
+        for peer in gone:
+            self._peers.remove(peer)
+            try:
+                # nadie escucha en ese socket: el worker murió sin borrarlo
+                os.unlink(peer)
+            except OSError:
+                pass
+
+    # ============================
+    # RECEPCIÓN
+    # ============================
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.errors += 1
+                return
+            self.datagrams_received += 1
+            for record in data.decode().split(_RECORD):
+                channel, _, message = record.partition(_CHANNEL)
+                self.received += 1
+                for handler in self._handlers.get(channel, ()):
+                    try:
+                        handler(message)
+                    except Exception:
+                        # un mensaje malformado no debe parar la recepción
+                        self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "unix",
+            "socket": self.path,
+            "peers": len(self._peers),
+            "sent": self.sent,
+            "received": self.received,
+            "datagrams_sent": self.datagrams_sent,
+            "datagrams_received": self.datagrams_received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+BACKENDS = {
+    "inprocess": InProcessBroadcast,
+    "unix": UnixSocketBroadcast,
+}
+
+
+def create_backend(name: str = BROADCAST_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"BROADCAST_BACKEND debe ser uno de {list(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+# instancia global (la comparten WSManager y el líder del simulador)
+broadcast = create_backend()
@@ -0,0 +1,65 @@
+# crud/aio/alerts.py
+# Versión asíncrona de crud/alerts.py (AsyncSession) para los routers.
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from bd.models import Alert
+from bd.schemas import AlertCreate
+from crud.alerts import alert_counts_statement, alerts_page_statement, count_rows, split_alerts_page
+
+
+# ============================
+# CREATE ALERT
+# ============================
+async def create_alert(db: AsyncSession, data: AlertCreate):
+    new_alert = Alert(
+        machine_id=data.machine_id,
+        alert_type=data.alert_type,
+        probability=data.probability,
+        message=data.message
+    )
+
+    db.add(new_alert)
+    await db.commit()
+    # created_at lo pone la BD (func.now())
+    await db.refresh(new_alert)
+    return new_alert
+
+
+# ============================
+# GET ALERTS BY MACHINE
+# ============================
+async def get_alerts_page(db: AsyncSession, machine_id: int, limit: int = 100, alert_type=None, start=None, end=None, cursor=None):
+    """Página de alertas de una máquina: (alertas, next_cursor)."""
+    result = await db.execute(alerts_page_statement(machine_id, limit, alert_type, start, end, cursor))
+    return split_alerts_page(result.scalars().all(), limit)
+
+
+async def get_alerts_by_machine(db: AsyncSession, machine_id: int, limit: int = 100, alert_type=None, start=None, end=None, cursor=None):
+    rows, _ = await get_alerts_page(db, machine_id, limit, alert_type, start, end, cursor)
+    return rows
+
+
+# ============================
+# ALERT COUNTS
+# ============================
+async def get_alert_counts(db: AsyncSession, group_by=("machine", "type"), bucket: str = "day", machine_ids=None, alert_type=None, start=None, end=None):
+    """Ver crud.alerts.alert_counts_statement."""
+    result = await db.execute(alert_counts_statement(group_by, bucket, machine_ids, alert_type, start, end))
+    return count_rows(result)
+
+
+# ============================
+# GET ONE ALERT
+# ============================
+async def get_alert(db: AsyncSession, alert_id: int):
+    return await db.get(Alert, alert_id)
+
+
+# ============================
+# DELETE ALERT
+# ============================
+async def delete_alert(db: AsyncSession, alert_id: int):
+    result = await db.execute(delete(Alert).where(Alert.id == alert_id))
+    await db.commit()
+    return result.rowcount > 0
@@ -0,0 +1,125 @@
+# crud/aio/machine_data.py
+# Versión asíncrona de crud/machine_data.py (AsyncSession) para los routers.
+
+import time
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from bd.models import MachineData
+from bd.schemas import MachineDataBase
+from crud.machine_data import (
+    BULK_CHUNK_SIZE, EXPORT_BATCH_SIZE, LAST_INSERT_ID_SQL, READ_VIEW_STMT, bulk_ids,
+    bulk_rows_written, bulk_write_latency, single_rows_written, single_write_latency,
+    export_statement, page_statement, split_page,
+)
+from crud.aio.rollups import apply_rollups
+from crud.last_values import last_values
+from crud.hot_window import hot_window
+
+
+# ============================
+# CREATE
+# ============================
+async def create_machine_data(db: AsyncSession, data: MachineDataBase):
+    new_data = MachineData(
+        machine_id=data.machine_id,
+        vibration=data.vibration,
+        temperature=data.temperature,
+        energy_consumption=data.energy_consumption,
+        recorded_at=data.recorded_at
+    )
+
+    start = time.perf_counter()
+    db.add(new_data)
+    await apply_rollups(db, [data.model_dump()])
+    # todos los campos se conocen y el id llega con el INSERT: no hace falta refresh
+    await db.commit()
+    single_write_latency.observe(time.perf_counter() - start)
+    single_rows_written.inc()
+    row = {"id": new_data.id, **data.model_dump()}
+    last_values.record([row])
+    hot_window.record([row])
+    return new_data
+
+
+# ============================
+# CREATE (BULK)
+# ============================
+async def create_machine_data_bulk(db: AsyncSession, rows: list, commit: bool = True):
+    """Ver crud.machine_data.create_machine_data_bulk."""
+    started = time.perf_counter()
+    readback = not bulk_ids.consecutive
+    if readback and rows:
+        await db.execute(READ_VIEW_STMT)
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        await db.execute(insert(MachineData.__table__), chunk)
+        first_id, step = (await db.execute(LAST_INSERT_ID_SQL)).one()
+        if readback:
+            ids = (await db.execute(bulk_ids.ids_statement(first_id, len(chunk)))).scalars().all()
+        else:
+            ids = range(first_id, first_id + len(chunk) * step, step)
+        for row, row_id in zip(chunk, ids):
+            row["id"] = row_id
+
+    await apply_rollups(db, rows)
+    if commit:
+        await db.commit()
+        bulk_write_latency.observe(time.perf_counter() - started)
+        bulk_rows_written.inc(len(rows))
+        # con commit=False lo registra quien confirme
+        last_values.record(rows)
+        hot_window.record(rows)
+    return rows
+
+
+# ============================
+# GET DATA BY MACHINE
+# ============================
+async def get_machine_data_page(
+    db: AsyncSession,
+    machine_id: int,
+    limit: int = 100,
+    start=None,
+    end=None,
+    cursor=None,
+):
+    """Página de lecturas de una máquina: (filas, next_cursor); las recientes salen de la ventana caliente."""
+    rows = hot_window.page(machine_id, limit, start, end, cursor)
+    if rows is not None:
+        return split_page(rows, limit)
+    result = await db.execute(page_statement(machine_id, limit, start, end, cursor))
+    return split_page(result.scalars().all(), limit)
+
+
+async def get_machine_data_by_machine(db: AsyncSession, machine_id: int, limit: int = 100, start=None, end=None, cursor=None):
+    rows, _ = await get_machine_data_page(db, machine_id, limit, start, end, cursor)
+    return rows
+
+
+# ============================
+# EXPORT (STREAMING)
+# ============================
+async def stream_machine_data(db: AsyncSession, machine_ids: list, start=None, end=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Ver crud.machine_data.iter_machine_data (db.stream → cursor del servidor)."""
+    for machine_id in machine_ids:
+        result = await db.stream(export_statement(machine_id, start, end, batch_size))
+        async for batch in result.partitions():
+            yield batch
+
+
+# ============================
+# GET ONE ENTRY
+# ============================
+async def get_machine_data(db: AsyncSession, data_id: int):
+    return await db.get(MachineData, data_id)
+
+
+# ============================
+# DELETE ENTRY
+# ============================
+async def delete_machine_data(db: AsyncSession, data_id: int):
+    result = await db.execute(delete(MachineData).where(MachineData.id == data_id))
+    await db.commit()
+    hot_window.discard_row(data_id)
+    return result.rowcount > 0
@@ -0,0 +1,94 @@
+# crud/aio/machines.py
+# Versión asíncrona de crud/machines.py (AsyncSession) para los routers.
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from bd.models import Machine
+from bd.schemas import MachineCreate, MachineUpdate
+from analisys.predictive import threshold_cache
+from analisys.stats import stats_registry
+from analisys.alerting import alert_tracker
+from crud.machine_cache import machine_cache
+from crud.last_values import last_values
+from crud.hot_window import hot_window
+
+
+# ============================
+# CREATE
+# ============================
+async def create_machine(db: AsyncSession, machine_data: MachineCreate, image_url: str = None):
+    new_machine = Machine(
+        name=machine_data.name,
+        description=machine_data.description,
+        machine_type=machine_data.machine_type,
+        image_url=image_url
+    )
+    db.add(new_machine)
+    await db.commit()
+    # created_at lo pone la BD (func.now())
+    await db.refresh(new_machine)
+    machine_cache.invalidate()
+    last_values.set_machine(new_machine)
+    hot_window.add_machine(new_machine.id)
+    return new_machine
+
+
+
+# ============================
+# READ (GET ALL)
+# ============================
+async def get_machines(db: AsyncSession):
+    result = await db.execute(select(Machine))
+    return result.scalars().all()
+
+
+# ============================
+# READ (GET ONE)
+# ============================
+async def get_machine(db: AsyncSession, machine_id: int):
+    return await db.get(Machine, machine_id)
+
+
+# ============================
+# UPDATE
+# ============================
+async def update_machine(db: AsyncSession, machine_id: int, machine_data: MachineUpdate):
+    machine = await db.get(Machine, machine_id)
+
+    if not machine:
+        return None
+
+    if machine_data.name is not None:
+        machine.name = machine_data.name
+
+    if machine_data.description is not None:
+        machine.description = machine_data.description
+
+    type_changed = machine_data.machine_type is not None and machine_data.machine_type != machine.machine_type
+    if type_changed:
+        machine.machine_type = machine_data.machine_type
+
+    await db.commit()
+    if type_changed:
+        # cambia qué perfil de umbrales por tipo le corresponde
+        threshold_cache.invalidate()
+    machine_cache.invalidate()
+    last_values.set_machine(machine)
+    return machine
+
+
+# ============================
+# DELETE
+# ============================
+async def delete_machine(db: AsyncSession, machine_id: int):
+    # DELETE directo: las lecturas y alertas se borran por el ON DELETE CASCADE
+    # de sus FKs (el cascade del ORM cargaría todas las filas hijas en memoria)
+    result = await db.execute(delete(Machine).where(Machine.id == machine_id))
+    await db.commit()
+    threshold_cache.invalidate()
+    machine_cache.invalidate()
+    last_values.forget(machine_id)
+    hot_window.forget(machine_id)
+    stats_registry.forget(machine_id)
+    alert_tracker.forget(machine_id)
+    return result.rowcount > 0
@@ -0,0 +1,27 @@
+# crud/aio/rollups.py
+# Versión asíncrona de crud/rollups.py (AsyncSession) para los routers.
+
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud.rollups import (
+    MAX_RAW_POINTS, ROLLUP_RESOLUTIONS, choose_resolution, raw_count_statement, series_points, series_statement,
+    upsert_statements,
+)
+
+
+async def apply_rollups(db: AsyncSession, rows: list):
+    """Actualiza los rollups con nuevas lecturas; lo confirma quien llama."""
+    for stmt in upsert_statements(rows):
+        await db.execute(stmt)
+
+
+async def get_series(db: AsyncSession, machine_id: int, start: datetime, end: datetime, points: int):
+    """Serie de la máquina en [start, end) con la resolución elegida automáticamente."""
+    resolution = choose_resolution(start, end, points)
+    if resolution is None and (await db.execute(raw_count_statement(machine_id, start, end))).scalar() > MAX_RAW_POINTS:
+        # las lecturas crudas no caben: el rollup más fino, con menos puntos pero completo
+        resolution = min(ROLLUP_RESOLUTIONS)
+    result = await db.execute(series_statement(machine_id, resolution, start, end))
+    return resolution, series_points(result.scalars().all(), resolution)
@@ -0,0 +1,75 @@
+# crud/aio/thresholds.py
+# Versión asíncrona de crud/thresholds.py (AsyncSession) para los routers.
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from bd.models import Machine, ThresholdProfile
+from bd.schemas import ThresholdValues
+from analisys.predictive import THRESHOLDS, threshold_cache
+from analisys.thresholds import profile_values, resolve_thresholds
+from crud.thresholds import profile_filter
+
+
+# ============================
+# GET PROFILES
+# ============================
+async def get_profiles(db: AsyncSession):
+    result = await db.execute(select(ThresholdProfile))
+    return result.scalars().all()
+
+
+async def get_profile(db: AsyncSession, machine_id: int = None, machine_type: str = None):
+    result = await db.execute(select(ThresholdProfile).where(profile_filter(machine_id, machine_type)))
+    return result.scalars().first()
+
+
+# ============================
+# EFFECTIVE THRESHOLDS
+# ============================
+async def get_effective(db: AsyncSession, machine_id: int):
+    """Umbrales que aplica el análisis a la máquina y de dónde sale cada uno."""
+    machine = await db.get(Machine, machine_id)
+    if machine is None:
+        return None
+    machine_profile = await get_profile(db, machine_id=machine_id)
+    type_profile = await get_profile(db, machine_type=machine.machine_type) if machine.machine_type else None
+    thresholds, source = resolve_thresholds(
+        THRESHOLDS, profile_values(type_profile), profile_values(machine_profile)
+    )
+    return {
+        "machine_id": machine_id,
+        "machine_type": machine.machine_type,
+        "thresholds": thresholds,
+        "source": source,
+    }
+
+
+# ============================
+# UPSERT PROFILE
+# ============================
+async def set_profile(db: AsyncSession, values: ThresholdValues, machine_id: int = None, machine_type: str = None):
+    profile = await get_profile(db, machine_id, machine_type)
+    if profile is None:
+        profile = ThresholdProfile(machine_id=machine_id, machine_type=machine_type)
+        db.add(profile)
+
+    profile.temperature = values.temperature
+    profile.vibration = values.vibration
+    profile.energy_consumption = values.energy_consumption
+
+    await db.commit()
+    # updated_at lo pone la BD (func.now())
+    await db.refresh(profile)
+    # el análisis recarga los umbrales en la siguiente lectura
+    threshold_cache.invalidate()
+    return profile
+
+
+# ============================
+# DELETE PROFILE
+# ============================
+async def delete_profile(db: AsyncSession, machine_id: int = None, machine_type: str = None):
+    result = await db.execute(delete(ThresholdProfile).where(profile_filter(machine_id, machine_type)))
+    await db.commit()
+    threshold_cache.invalidate()
+    return result.rowcount > 0
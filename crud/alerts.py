@@ -1,6 +1,20 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from bd.models import Alert
 from bd.schemas import AlertCreate
+from crud.pagination import encode_cursor, keyset_before
+
+
+# Agrupaciones por tiempo para alert_counts: formato de DATE_FORMAT (MySQL)
+# que lleva created_at al inicio de su bucket
+COUNT_BUCKETS = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+    "month": "%Y-%m-01 00:00:00",
+}
+COUNT_GROUPS = ("machine", "type", "bucket")
 
 
 # ============================
@@ -23,8 +37,113 @@ def create_alert(db: Session, data: AlertCreate):
 # ============================
 # GET ALERTS BY MACHINE
 # ============================
-def get_alerts_by_machine(db: Session, machine_id: int):
-    return db.query(Alert).filter(Alert.machine_id == machine_id).all()
+def alerts_page_statement(
+    machine_id: int,
+    limit: int = 100,
+    alert_type=None,
+    start=None,
+    end=None,
+    cursor=None,
+):
+    """
+    SELECT de una página de alertas de una máquina, de más nueva a más vieja
+    (compartido por la versión sync y la async en crud/aio).
+    - alert_type: solo ese tipo (opcional)
+    - start/end: rango [start, end) sobre created_at (opcionales)
+    - cursor: (created_at, id) de la última alerta de la página anterior
+    Pide limit + 1 filas para saber si hay página siguiente (ver split_alerts_page).
+    Usa (machine_id, created_at, id) o (machine_id, alert_type, created_at, id).
+    """
+    stmt = select(Alert).where(Alert.machine_id == machine_id)
+    if alert_type is not None:
+        stmt = stmt.where(Alert.alert_type == alert_type)
+    if start is not None:
+        stmt = stmt.where(Alert.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Alert.created_at < end)
+    if cursor is not None:
+        stmt = stmt.where(keyset_before(Alert.created_at, Alert.id, cursor))
+    return stmt.order_by(Alert.created_at.desc(), Alert.id.desc()).limit(limit + 1)
+
+
+def split_alerts_page(rows: list, limit: int):
+    """Devuelve (alertas, next_cursor); next_cursor es None si no hay más."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def get_alerts_page(db: Session, machine_id: int, limit: int = 100, alert_type=None, start=None, end=None, cursor=None):
+    """Página de alertas de una máquina: (alertas, next_cursor)."""
+    rows = db.execute(alerts_page_statement(machine_id, limit, alert_type, start, end, cursor)).scalars().all()
+    return split_alerts_page(rows, limit)
+
+
+def get_alerts_by_machine(db: Session, machine_id: int, limit: int = 100, alert_type=None, start=None, end=None, cursor=None):
+    rows, _ = get_alerts_page(db, machine_id, limit, alert_type, start, end, cursor)
+    return rows
+
+
+# ============================
+# ALERT COUNTS
+# ============================
+def alert_counts_statement(
+    group_by=("machine", "type"),
+    bucket: str = "day",
+    machine_ids=None,
+    alert_type=None,
+    start=None,
+    end=None,
+):
+    """
+    Nº de alertas (y suma de ocurrencias) agrupado en la BD por máquina,
+    tipo y/o bucket de tiempo (COUNT_BUCKETS) de created_at.
+    """
+    columns, keys = [], []
+    if "machine" in group_by:
+        columns.append(Alert.machine_id.label("machine_id"))
+        keys.append(Alert.machine_id)
+    if "type" in group_by:
+        columns.append(Alert.alert_type.label("alert_type"))
+        keys.append(Alert.alert_type)
+    if "bucket" in group_by:
+        bucket_expr = func.date_format(Alert.created_at, COUNT_BUCKETS[bucket])
+        columns.append(bucket_expr.label("bucket"))
+        keys.append(bucket_expr)
+
+    stmt = select(
+        *columns,
+        func.count(Alert.id).label("count"),
+        func.coalesce(func.sum(Alert.occurrences), 0).label("occurrences"),
+    )
+    if machine_ids:
+        stmt = stmt.where(Alert.machine_id.in_(machine_ids))
+    if alert_type is not None:
+        stmt = stmt.where(Alert.alert_type == alert_type)
+    if start is not None:
+        stmt = stmt.where(Alert.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Alert.created_at < end)
+    if keys:
+        stmt = stmt.group_by(*keys).order_by(*keys)
+    return stmt
+
+
+def count_rows(rows) -> list:
+    """Filas de alert_counts_statement como dicts (bucket como datetime)."""
+    result = []
+    for row in rows:
+        item = dict(row._mapping)
+        if item.get("bucket") is not None:
+            item["bucket"] = datetime.fromisoformat(str(item["bucket"]))
+        item["occurrences"] = int(item["occurrences"])
+        result.append(item)
+    return result
+
+
+def get_alert_counts(db: Session, group_by=("machine", "type"), bucket: str = "day", machine_ids=None, alert_type=None, start=None, end=None):
+    return count_rows(db.execute(alert_counts_statement(group_by, bucket, machine_ids, alert_type, start, end)))
 
 
 # ============================
@@ -0,0 +1,346 @@
+# crud/hot_window.py
+
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from bd.models import Machine, MachineData
+from broadcast import broadcast
+from metrics import metrics
+
+
+# Lecturas recientes que se guardan por máquina (0 → desactivado)
+HOT_WINDOW_SIZE = int(os.getenv("HOT_WINDOW_SIZE", "256"))
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_SECOND = 1_000_000
+
+# Columnas de valores, en orden (una columna por métrica en MachineRing.values)
+VALUE_COLUMNS = ("temperature", "vibration", "energy_consumption")
+
+
+def to_micros(ts: datetime) -> int:
+    """Microsegundos desde epoch de un recorded_at (las fechas con zona se pasan a UTC sin zona, como en la BD)."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - EPOCH) // _MICROSECOND
+
+
+def to_column_micros(ts: datetime) -> int:
+    """
+    to_micros de recorded_at tal como queda en la columna: DATETIME sin
+    fracciones, MySQL redondea al segundo (la mitad hacia arriba). Así la
+    ventana devuelve las mismas fechas y cursores que la BD.
+    """
+    return (to_micros(ts) + _SECOND // 2) // _SECOND * _SECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class MachineRing:
+    """
+    Últimas `capacity` lecturas de una máquina en arrays de NumPy de tamaño
+    fijo (40 bytes por lectura: id, recorded_at en µs y tres float64).
+    Invariante: contiene todas las lecturas de la máquina con
+    (recorded_at, id) >= floor; floor None → todo el historial.
+    """
+    __slots__ = ("capacity", "ids", "ts", "values", "start", "count", "floor")
+
+    def __init__(self, capacity: int, floor: Optional[tuple] = None):
+        self.capacity = capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(VALUE_COLUMNS)), dtype=np.float64)
+        self.start = 0
+        self.count = 0
+        self.floor = floor
+
+    @staticmethod
+    def bytes_for(capacity: int) -> int:
+        return capacity * 8 * (2 + len(VALUE_COLUMNS))
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.ts.nbytes + self.values.nbytes
+
+    @property
+    def complete(self) -> bool:
+        return self.floor is None
+
+    def _key(self, i: int) -> tuple:
+        j = (self.start + i) % self.capacity
+        return int(self.ts[j]), int(self.ids[j])
+
+    def append(self, row_id: int, ts: int, values: tuple):
+        """Añade una lectura; si no es la más nueva se inserta en su sitio (caso raro)."""
+        if self.count and (ts, row_id) <= self._key(self.count - 1):
+            self._insert(row_id, ts, values)
+            return
+        if self.floor is not None and (ts, row_id) < self.floor:
+            return
+        evict = self.count == self.capacity
+        if evict:
+            # se pisa la más antigua
+            j = self.start
+            self.start = (self.start + 1) % self.capacity
+        else:
+            j = (self.start + self.count) % self.capacity
+            self.count += 1
+        self.ids[j] = row_id
+        self.ts[j] = ts
+        self.values[j] = values
+        if evict:
+            # la ventana empieza ahora en la siguiente
+            self.floor = self._key(0)
+
+    def _insert(self, row_id: int, ts: int, values: tuple):
+        if self.floor is not None and (ts, row_id) < self.floor:
+            # anterior a la ventana: no se guarda (ni se necesita)
+            return
+        ids, tss, vals = self.ordered()
+        key = int(np.searchsorted(tss, ts, side="left"))
+        while key < self.count and tss[key] == ts and ids[key] < row_id:
+            key += 1
+        if key < self.count and tss[key] == ts and ids[key] == row_id:
+            return
+        self._load(
+            np.insert(ids, key, row_id),
+            np.insert(tss, key, ts),
+            np.insert(vals, key, values, axis=0),
+        )
+
+    def _load(self, ids, tss, vals):
+        """Reescribe el buffer desde arrays en orden (se quedan las más nuevas)."""
+        if len(ids) > self.capacity:
+            ids, tss, vals = ids[-self.capacity:], tss[-self.capacity:], vals[-self.capacity:]
+            self.floor = (int(tss[0]), int(ids[0]))
+        n = len(ids)
+        self.ids[:n] = ids
+        self.ts[:n] = tss
+        self.values[:n] = vals
+        self.start = 0
+        self.count = n
+
+    def ordered(self):
+        """(ids, ts, values) de más antigua a más nueva (copias si el buffer da la vuelta)."""
+        end = self.start + self.count
+        if end <= self.capacity:
+            return self.ids[self.start:end], self.ts[self.start:end], self.values[self.start:end]
+        tail = end - self.capacity
+        return (
+            np.concatenate((self.ids[self.start:], self.ids[:tail])),
+            np.concatenate((self.ts[self.start:], self.ts[:tail])),
+            np.concatenate((self.values[self.start:], self.values[:tail])),
+        )
+
+    def remove(self, mask):
+        """Quita lecturas borradas de la BD (mask sobre ordered()); floor no cambia."""
+        ids, tss, vals = self.ordered()
+        keep = ~mask
+        self._load(ids[keep].copy(), tss[keep].copy(), vals[keep].copy())
+
+
+class HotWindowCache:
+    """
+    Ventana caliente: las últimas HOT_WINDOW_SIZE lecturas de cada máquina
+    en memoria, para servir las lecturas recientes sin ir a MySQL
+    (/datas_machine/ de los sparklines y la recarga de la ventana de
+    estadísticas de analisys/stats.py).
+    - warm(): al arrancar, una consulta por máquina (últimas N filas por el
+      índice (machine_id, recorded_at, id)).
+    - los create de crud/machine_data.py llaman a record() tras el commit.
+    - page() devuelve None si la respuesta podría incluir filas que ya no
+      están en la ventana; entonces se consulta la BD como siempre.
+    Como last_values, solo ve lo que escribe su propio proceso tras el
+    arranque; con varios workers (broadcast multiproceso) las ventanas de los
+    demás quedarían congeladas, así que se desactiva (capacity 0).
+    """
+
+    def __init__(self, capacity: int = HOT_WINDOW_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[int, MachineRing] = {}
+        self.warmed_at: Optional[datetime] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def warm(self, db: Session):
+        if not self.enabled:
+            return
+        machine_ids = db.execute(select(Machine.id)).scalars().all()
+        table = MachineData.__table__
+        for machine_id in machine_ids:
+            rows = db.execute(
+                select(table.c.id, table.c.recorded_at, *(table.c[c] for c in VALUE_COLUMNS))
+                .where(table.c.machine_id == machine_id)
+                .order_by(table.c.recorded_at.desc(), table.c.id.desc())
+                .limit(self.capacity)
+            ).all()
+            ring = MachineRing(self.capacity)
+            for row in reversed(rows):
+                ring.append(row[0], to_micros(row[1]), tuple(row[2:]))
+            if len(rows) == self.capacity:
+                # puede haber lecturas anteriores a la más antigua cargada
+                ring.floor = ring._key(0)
+            with self._lock:
+                current = self._rings.get(machine_id)
+                if current is not None and current.count:
+                    # lo escrito mientras se cargaba
+                    ids, tss, vals = current.ordered()
+                    for row_id, ts, values in zip(ids.tolist(), tss.tolist(), vals.tolist()):
+                        ring.append(row_id, ts, tuple(values))
+                self._rings[machine_id] = ring
+        self.warmed_at = datetime.utcnow()
+
+    # ============================
+    # ESCRITURA
+    # ============================
+    def record(self, rows):
+        """Lecturas ya confirmadas (dicts con las columnas de MachineData e id)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            rings = self._rings
+            for row in rows:
+                ring = rings.get(row["machine_id"])
+                key = (to_column_micros(row["recorded_at"]), row["id"])
+                if ring is None:
+                    # máquina que no estaba al arrancar ni se creó aquí: la
+                    # ventana vale desde la primera lectura que se ve
+                    ring = rings[row["machine_id"]] = MachineRing(self.capacity, floor=key)
+                ring.append(key[1], key[0], (row["temperature"], row["vibration"], row["energy_consumption"]))
+
+    def add_machine(self, machine_id: int):
+        """Máquina recién creada: sin lecturas, su ventana es todo el historial."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._rings.setdefault(machine_id, MachineRing(self.capacity))
+
+    def discard_row(self, data_id: int):
+        """Quita una lectura borrada (no se sabe de qué máquina: se busca en todas)."""
+        with self._lock:
+            for ring in self._rings.values():
+                ids, _, _ = ring.ordered()
+                mask = ids == data_id
+                if mask.any():
+                    ring.remove(mask)
+                    return
+
+    def evict_before(self, cutoff: datetime):
+        """Quita lo anterior a cutoff (purga de retención): ya no está en la BD."""
+        limit = to_micros(cutoff)
+        with self._lock:
+            for ring in self._rings.values():
+                if ring.count and ring.ts[ring.start] < limit:
+                    _, tss, _ = ring.ordered()
+                    ring.remove(tss < limit)
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._rings.pop(machine_id, None)
+
+    # ============================
+    # LECTURA
+    # ============================
+    def page(self, machine_id: int, limit: int, start=None, end=None, cursor=None) -> Optional[list]:
+        """
+        Como crud.machine_data.page_statement (de más nueva a más vieja, hasta
+        limit + 1 filas, [start, end) y keyset cursor) pero desde la ventana;
+        lista de dicts, o None si hay que ir a la BD.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            ring = self._rings.get(machine_id)
+            if ring is None:
+                self.misses += 1
+                return None
+            ids, tss, vals = ring.ordered()
+            mask = np.ones(len(ids), dtype=bool)
+            if start is not None:
+                mask &= tss >= to_micros(start)
+            if end is not None:
+                mask &= tss < to_micros(end)
+            if cursor is not None:
+                cursor_ts, cursor_id = to_micros(cursor[0]), cursor[1]
+                mask &= (tss < cursor_ts) | ((tss == cursor_ts) & (ids < cursor_id))
+            found = np.flatnonzero(mask)[::-1][:limit + 1]
+            # con menos de limit + 1 filas podría haber más anteriores a la
+            # ventana, salvo que sea todo el historial o from quede dentro
+            if len(found) <= limit and ring.floor is not None and (start is None or to_micros(start) <= ring.floor[0]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            ids = ids[found].tolist()
+            tss = tss[found].tolist()
+            vals = vals[found].tolist()
+        return [
+            {
+                "id": row_id,
+                "machine_id": machine_id,
+                "recorded_at": from_micros(ts),
+                "temperature": values[0],
+                "vibration": values[1],
+                "energy_consumption": values[2],
+            }
+            for row_id, ts, values in zip(ids, tss, vals)
+        ]
+
+    def latest(self, machine_id: int, limit: int, before_id: Optional[int] = None) -> Optional[list]:
+        """
+        Últimas limit lecturas (id < before_id) como [(temperature, vibration,
+        energy_consumption, recorded_at)] de más vieja a más nueva, o None si
+        la ventana no las tiene todas.
+        """
+        with self._lock:
+            ring = self._rings.get(machine_id)
+            if ring is None:
+                return None
+            ids, tss, vals = ring.ordered()
+            if before_id is not None:
+                keep = ids < before_id
+                tss, vals = tss[keep], vals[keep]
+            if len(tss) < limit and not ring.complete:
+                return None
+            tss = tss[-limit:].tolist()
+            vals = vals[-limit:].tolist()
+        return [(v[0], v[1], v[2], from_micros(ts)) for ts, v in zip(tss, vals)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rings = list(self._rings.values())
+        readings = sum(ring.count for ring in rings)
+        total_bytes = sum(ring.nbytes for ring in rings)
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "machines": len(rings),
+            "readings": readings,
+            "bytes_per_machine": MachineRing.bytes_for(self.capacity),
+            "total_bytes": total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "warmed_at": self.warmed_at,
+        }
+
+
+# instancia global
+hot_window = HotWindowCache(0 if broadcast.multiprocess else HOT_WINDOW_SIZE)
+
+metrics.callback("hot_window_bytes", "Memoria de la ventana caliente (arrays de todas las máquinas)",
+                 lambda: hot_window.stats()["total_bytes"])
+metrics.callback("hot_window_reads_total", "Lecturas recientes pedidas a la ventana caliente por resultado",
+                 lambda: {"hit": hot_window.hits, "miss": hot_window.misses}, ("result",), kind="counter")
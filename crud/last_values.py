@@ -0,0 +1,133 @@
+# crud/last_values.py
+
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from bd.models import Machine, MachineData
+from broadcast import broadcast
+
+
+class LastValueCache:
+    """
+    Última lectura de cada máquina (y su nombre/tipo) en memoria para la
+    vista de flota, sin una consulta por máquina.
+    - warm(): al arrancar, una consulta agrupada con la lectura más reciente
+      de cada máquina (el índice (machine_id, recorded_at, id) la resuelve
+      sin recorrer la tabla) y otra con el catálogo.
+    - los create de crud/machine_data.py (simulador, /new_machine_data,
+      ingesta en lote) llaman a record() tras el commit.
+    - los create/update/delete de crud/machines.py mantienen el catálogo.
+    Solo ve lo que escribe su propio proceso tras el arranque: con varios
+    workers (broadcast multiproceso) enabled es False y /fleet_snapshot lee
+    de la BD con load_snapshot().
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._machines: Dict[int, dict] = {}
+        self._readings: Dict[int, dict] = {}
+        self.warmed_at: Optional[datetime] = None
+
+    def _load(self, db: Session) -> tuple:
+        """(catálogo, última lectura de cada máquina) desde la BD."""
+        machines = {
+            row.id: {"id": row.id, "name": row.name, "machine_type": row.machine_type}
+            for row in db.execute(select(Machine.id, Machine.name, Machine.machine_type))
+        }
+
+        latest = (
+            select(MachineData.machine_id, func.max(MachineData.recorded_at).label("recorded_at"))
+            .group_by(MachineData.machine_id)
+            .subquery()
+        )
+        table = MachineData.__table__
+        rows = db.execute(
+            select(table).join(
+                latest,
+                and_(table.c.machine_id == latest.c.machine_id, table.c.recorded_at == latest.c.recorded_at),
+            )
+        ).mappings()
+        readings = {}
+        for row in rows:
+            # empate en recorded_at: vale la de mayor id
+            current = readings.get(row["machine_id"])
+            if current is None or row["id"] > current["id"]:
+                readings[row["machine_id"]] = dict(row)
+        return machines, readings
+
+    def warm(self, db: Session):
+        machines, readings = self._load(db)
+        with self._lock:
+            self._machines = machines
+            # lo escrito mientras se cargaba se conserva si es más reciente
+            for machine_id, reading in self._readings.items():
+                if machine_id not in readings or reading["recorded_at"] >= readings[machine_id]["recorded_at"]:
+                    readings[machine_id] = reading
+            self._readings = readings
+            self.warmed_at = datetime.utcnow()
+
+    # ============================
+    # ESCRITURA
+    # ============================
+    def record(self, rows: Iterable[dict]):
+        """Lecturas ya confirmadas (dicts con las columnas de MachineData e id)."""
+        with self._lock:
+            readings = self._readings
+            for row in rows:
+                recorded_at = row["recorded_at"]
+                if recorded_at.tzinfo is not None:
+                    # la BD guarda UTC sin zona: así se compara con lo cargado en warm()
+                    row = {**row, "recorded_at": recorded_at.astimezone(timezone.utc).replace(tzinfo=None)}
+                current = readings.get(row["machine_id"])
+                if current is None or row["recorded_at"] >= current["recorded_at"]:
+                    readings[row["machine_id"]] = row
+
+    def set_machine(self, machine: Machine):
+        with self._lock:
+            self._machines[machine.id] = {
+                "id": machine.id,
+                "name": machine.name,
+                "machine_type": machine.machine_type,
+            }
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._machines.pop(machine_id, None)
+            self._readings.pop(machine_id, None)
+
+    # ============================
+    # LECTURA
+    # ============================
+    def snapshot(self) -> list:
+        """[(máquina, última lectura o None)] ordenado por id."""
+        with self._lock:
+            return [
+                (machine, self._readings.get(machine_id))
+                for machine_id, machine in sorted(self._machines.items())
+            ]
+
+    def load_snapshot(self, db: Session) -> list:
+        """Como snapshot() pero consultando la BD (sin caché)."""
+        machines, readings = self._load(db)
+        return [(machine, readings.get(machine_id)) for machine_id, machine in sorted(machines.items())]
+
+    def machine_ids(self) -> set:
+        with self._lock:
+            return set(self._machines)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "machines": len(self._machines),
+            "machines_with_readings": len(self._readings),
+            "warmed_at": self.warmed_at,
+        }
+
+
+# instancia global
+last_values = LastValueCache(enabled=not broadcast.multiprocess)
@@ -0,0 +1,131 @@
+# crud/machine_cache.py
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+
+# Recarga periódica aunque nadie invalide: con varios procesos la
+# invalidación solo llega al proceso que hizo el cambio
+MACHINE_CACHE_TTL = 30
+
+
+class CachedBody:
+    """Respuesta ya serializada (JSON) con sus validadores HTTP."""
+    __slots__ = ("body", "etag", "last_modified", "loaded_at")
+
+    def __init__(self, body: bytes, etag: str, last_modified: datetime):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.loaded_at = time.monotonic()
+
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            # el cliente puede guardarla pero debe revalidar (If-None-Match) cada vez
+            "Cache-Control": "no-cache",
+        }
+
+
+class MachineCatalogCache:
+    """
+    Respuestas JSON de /machines y /get_machine/ en memoria.
+    - clave "all" para el catálogo completo, el id para cada máquina.
+    - el ETag es un hash del cuerpo: estable entre recargas y entre procesos.
+    - create/update/delete de crud/machines.py invalidan todo el catálogo
+      (cambia unas pocas veces al día; no merece la pena afinar más).
+    - si se invalida mientras una petición consulta la BD, su resultado no se guarda.
+    """
+
+    def __init__(self, ttl: float = MACHINE_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._entries: Dict[object, CachedBody] = {}
+        # último ETag visto por clave: si una recarga da el mismo cuerpo
+        # se conserva su Last-Modified
+        self._validators: Dict[object, tuple] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.loaded_at <= self.ttl:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, body: bytes, generation: int) -> CachedBody:
+        """Guarda el cuerpo leído con `generation` (la de antes de consultar la BD)."""
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        with self._lock:
+            previous = self._validators.get(key)
+            if previous is not None and previous[0] == etag:
+                last_modified = previous[1]
+            else:
+                # resolución de segundos, como la cabecera HTTP
+                last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+                self._validators[key] = (etag, last_modified)
+            entry = CachedBody(body, etag, last_modified)
+            if generation == self._generation:
+                self._entries[key] = entry
+            return entry
+
+    def discard(self, key):
+        """Olvida una clave que ya no existe (p. ej. máquina borrada → 404)."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._validators.pop(key, None)
+
+    def is_fresh(self, entry: CachedBody, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """True si la copia del cliente sigue valiendo (→ 304). If-None-Match manda sobre If-Modified-Since."""
+        fresh = False
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            # comparación débil: W/"x" vale igual que "x"
+            fresh = "*" in tags or any(t.removeprefix("W/") == entry.etag for t in tags)
+        elif if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                since = None
+            if since is not None and since.tzinfo is not None:
+                fresh = entry.last_modified <= since
+        if fresh:
+            with self._lock:
+                self.not_modified += 1
+        return fresh
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "ttl": self.ttl,
+        }
+
+
+# instancia global
+machine_cache = MachineCatalogCache()
@@ -1,6 +1,75 @@
+import time
+
+from sqlalchemy import insert, select, text
 from sqlalchemy.orm import Session
 from bd.models import MachineData
 from bd.schemas import MachineDataBase
+from crud.pagination import encode_cursor, keyset_before
+from crud.rollups import apply_rollups
+from crud.last_values import last_values
+from crud.hot_window import hot_window
+from metrics import metrics
+
+
+# Filas por sentencia INSERT multi-fila. Debe quedar por debajo del límite
+# con el que pymysql parte un executemany (~1MB) para que cada bloque sea
+# una única sentencia y LAST_INSERT_ID() corresponda a su primera fila.
+BULK_CHUNK_SIZE = 1000
+
+LAST_INSERT_ID_SQL = text("SELECT LAST_INSERT_ID(), @@auto_increment_increment")
+AUTOINC_MODE_SQL = text("SELECT @@innodb_autoinc_lock_mode, @@transaction_isolation")
+# Cualquier lectura consistente abre la vista de lectura de la transacción
+READ_VIEW_STMT = select(MachineData.id).limit(1)
+
+
+class BulkIds:
+    """
+    Cómo se conocen los ids de un INSERT multi-fila.
+    - innodb_autoinc_lock_mode 0/1: el bloque recibe ids consecutivos
+      (separados por @@auto_increment_increment); se calculan desde LAST_INSERT_ID().
+    - 2 (por defecto en MySQL 8.0): los INSERT concurrentes (batch, ingesta,
+      spool) pueden intercalar sus ids; se leen de vuelta los n primeros
+      ids >= LAST_INSERT_ID(). La vista de lectura se abre antes del INSERT
+      y con REPEATABLE READ las filas de otras transacciones con ids
+      intercalados no se ven: los ids leídos son exactamente los propios.
+    Hasta comprobar el modo (detect, al arrancar) se lee de vuelta.
+    """
+
+    def __init__(self):
+        self.lock_mode = None
+        self.consecutive = False
+
+    def detect(self, db: Session):
+        try:
+            mode, isolation = db.execute(AUTOINC_MODE_SQL).one()
+        except Exception:
+            # otra BD o sin permisos: se queda en leer de vuelta
+            db.rollback()
+            return
+        self.lock_mode = int(mode)
+        self.consecutive = self.lock_mode in (0, 1)
+        if not self.consecutive and isolation not in ("REPEATABLE-READ", "SERIALIZABLE"):
+            print(
+                f"Aviso: innodb_autoinc_lock_mode={mode} con {isolation}: los ids de "
+                "las lecturas insertadas en lote pueden no ser los suyos (usa REPEATABLE READ)"
+            )
+
+    def ids_statement(self, first_id: int, n: int):
+        return select(MachineData.id).where(MachineData.id >= first_id).order_by(MachineData.id).limit(n)
+
+
+# instancia global
+bulk_ids = BulkIds()
+
+# Escritura de lecturas hasta el commit incluido (series fijas, compartidas con crud/aio)
+write_latency = metrics.histogram(
+    "machine_data_write_seconds", "Duración de INSERT + rollups + commit de lecturas", ("mode",)
+)
+rows_written = metrics.counter("machine_data_rows_written_total", "Lecturas escritas en machine_data", ("mode",))
+single_write_latency = write_latency.labels("single")
+single_rows_written = rows_written.labels("single")
+bulk_write_latency = write_latency.labels("bulk")
+bulk_rows_written = rows_written.labels("bulk")
 
 
 # ============================
@@ -15,25 +84,146 @@ def create_machine_data(db: Session, data: MachineDataBase):
         recorded_at=data.recorded_at
     )
 
+    start = time.perf_counter()
     db.add(new_data)
+    apply_rollups(db, [data.model_dump()])
     db.commit()
+    single_write_latency.observe(time.perf_counter() - start)
+    single_rows_written.inc()
     db.refresh(new_data)
+    row = {"id": new_data.id, **data.model_dump()}
+    last_values.record([row])
+    hot_window.record([row])
     return new_data
 
 
+# ============================
+# CREATE (BULK)
+# ============================
+def create_machine_data_bulk(db: Session, rows: list, commit: bool = True):
+    """
+    Inserta muchas lecturas con INSERT multi-fila, un bloque por sentencia.
+    rows es una lista de dicts con las columnas de MachineData; a cada dict
+    se le asigna su "id" (calculado o leído de vuelta, ver BulkIds).
+    Los rollups se actualizan en la misma transacción.
+    """
+    started = time.perf_counter()
+    readback = not bulk_ids.consecutive
+    if readback and rows:
+        db.execute(READ_VIEW_STMT)
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        db.execute(insert(MachineData.__table__), chunk)
+        first_id, step = db.execute(LAST_INSERT_ID_SQL).one()
+        if readback:
+            ids = db.execute(bulk_ids.ids_statement(first_id, len(chunk))).scalars().all()
+        else:
+            ids = range(first_id, first_id + len(chunk) * step, step)
+        for row, row_id in zip(chunk, ids):
+            row["id"] = row_id
+
+    apply_rollups(db, rows)
+    if commit:
+        db.commit()
+        bulk_write_latency.observe(time.perf_counter() - started)
+        bulk_rows_written.inc(len(rows))
+        # con commit=False lo registra quien confirme
+        last_values.record(rows)
+        hot_window.record(rows)
+    return rows
+
+
 # ============================
 # GET DATA BY MACHINE
 # ============================
-def get_machine_data_by_machine(db: Session, machine_id: int, limit: int = 100):
+def page_statement(machine_id: int, limit: int = 100, start=None, end=None, cursor=None):
+    """
+    SELECT de una página de lecturas de una máquina, de más nueva a más vieja
+    (compartido por la versión sync y la async en crud/aio).
+    - start/end: rango [start, end) sobre recorded_at (opcionales)
+    - cursor: (recorded_at, id) de la última fila de la página anterior
+    Pide limit + 1 filas para saber si hay página siguiente (ver split_page).
+    Usa el índice (machine_id, recorded_at, id): coste constante por página.
+    """
+    stmt = select(MachineData).where(MachineData.machine_id == machine_id)
+    if start is not None:
+        stmt = stmt.where(MachineData.recorded_at >= start)
+    if end is not None:
+        stmt = stmt.where(MachineData.recorded_at < end)
+    if cursor is not None:
+        stmt = stmt.where(keyset_before(MachineData.recorded_at, MachineData.id, cursor))
+    return stmt.order_by(MachineData.recorded_at.desc(), MachineData.id.desc()).limit(limit + 1)
+
+
+def split_page(rows: list, limit: int):
+    """Devuelve (filas, next_cursor); next_cursor es None si no hay más."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        # filas servidas desde la ventana caliente
+        return rows, encode_cursor(last["recorded_at"], last["id"])
+    return rows, encode_cursor(last.recorded_at, last.id)
+
+
+def get_machine_data_page(
+    db: Session,
+    machine_id: int,
+    limit: int = 100,
+    start=None,
+    end=None,
+    cursor=None,
+):
+    """Página de lecturas de una máquina: (filas, next_cursor); las recientes salen de la ventana caliente."""
+    rows = hot_window.page(machine_id, limit, start, end, cursor)
+    if rows is not None:
+        return split_page(rows, limit)
+    rows = db.execute(page_statement(machine_id, limit, start, end, cursor)).scalars().all()
+    return split_page(rows, limit)
+
+
+def get_machine_data_by_machine(db: Session, machine_id: int, limit: int = 100, start=None, end=None, cursor=None):
+    rows, _ = get_machine_data_page(db, machine_id, limit, start, end, cursor)
+    return rows
+
+
+# ============================
+# EXPORT (STREAMING)
+# ============================
+# Columnas exportadas, en orden
+EXPORT_COLUMNS = ("id", "machine_id", "recorded_at", "temperature", "vibration", "energy_consumption")
+# Filas que se traen del cursor del servidor en cada vuelta
+EXPORT_BATCH_SIZE = 5000
+
+
+def export_statement(machine_id: int, start=None, end=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    SELECT de todas las lecturas de una máquina en [start, end), de más vieja
+    a más nueva. Tuplas sin ORM (sin mapa de identidad) y cursor del lado del
+    servidor (yield_per): la memoria no depende del tamaño del rango.
+    Recorre el índice (machine_id, recorded_at, id) sin ordenar en la BD.
+    """
+    table = MachineData.__table__
+    stmt = select(*(table.c[name] for name in EXPORT_COLUMNS)).where(table.c.machine_id == machine_id)
+    if start is not None:
+        stmt = stmt.where(table.c.recorded_at >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.recorded_at < end)
     return (
-        db.query(MachineData)
-        .filter(MachineData.machine_id == machine_id)
-        .order_by(MachineData.recorded_at.desc())
-        .limit(limit)
-        .all()
+        stmt.order_by(table.c.recorded_at, table.c.id)
+        .execution_options(yield_per=batch_size)
     )
 
 
+def iter_machine_data(db: Session, machine_ids: list, start=None, end=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Lotes (listas de tuplas EXPORT_COLUMNS) de las máquinas, una tras otra."""
+    for machine_id in machine_ids:
+        result = db.execute(export_statement(machine_id, start, end, batch_size))
+        for batch in result.partitions():
+            yield batch
+
+
 # ============================
 # GET ONE ENTRY
 # ============================
@@ -51,4 +241,5 @@ def delete_machine_data(db: Session, data_id: int):
 
     db.delete(data)
     db.commit()
+    hot_window.discard_row(data_id)
     return True
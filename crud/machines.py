@@ -3,6 +3,12 @@
 from sqlalchemy.orm import Session
 from bd.models import Machine
 from bd.schemas import MachineCreate, MachineUpdate
+from analisys.predictive import threshold_cache
+from analisys.stats import stats_registry
+from analisys.alerting import alert_tracker
+from crud.machine_cache import machine_cache
+from crud.last_values import last_values
+from crud.hot_window import hot_window
 
 
 # ============================
@@ -12,11 +18,15 @@ def create_machine(db: Session, machine_data: MachineCreate, image_url: str = No
     new_machine = Machine(
         name=machine_data.name,
         description=machine_data.description,
+        machine_type=machine_data.machine_type,
         image_url=image_url
     )
     db.add(new_machine)
     db.commit()
     db.refresh(new_machine)
+    machine_cache.invalidate()
+    last_values.set_machine(new_machine)
+    hot_window.add_machine(new_machine.id)
     return new_machine
 
 
@@ -50,8 +60,17 @@ def update_machine(db: Session, machine_id: int, machine_data: MachineUpdate):
     if machine_data.description is not None:
         machine.description = machine_data.description
 
+    type_changed = machine_data.machine_type is not None and machine_data.machine_type != machine.machine_type
+    if type_changed:
+        machine.machine_type = machine_data.machine_type
+
     db.commit()
     db.refresh(machine)
+    if type_changed:
+        # cambia qué perfil de umbrales por tipo le corresponde
+        threshold_cache.invalidate()
+    machine_cache.invalidate()
+    last_values.set_machine(machine)
     return machine
 
 
@@ -66,4 +85,10 @@ def delete_machine(db: Session, machine_id: int):
 
     db.delete(machine)
     db.commit()
+    threshold_cache.invalidate()
+    machine_cache.invalidate()
+    last_values.forget(machine_id)
+    hot_window.forget(machine_id)
+    stats_registry.forget(machine_id)
+    alert_tracker.forget(machine_id)
     return True
@@ -0,0 +1,37 @@
+# crud/pagination.py
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+# ============================
+# CURSOR OPACO (keyset)
+# ============================
+# El cursor codifica la última fila devuelta (timestamp, id); la página
+# siguiente empieza justo después, sin OFFSET, usando el índice compuesto.
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Devuelve (timestamp, id). Lanza ValueError si el cursor no es válido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def keyset_before(ts_column, id_column, cursor):
+    """
+    Condición "(ts, id) < cursor" para recorrer de más nuevo a más viejo.
+    Se escribe expandida (OR) porque MySQL aprovecha mejor el índice así que
+    con la comparación de tuplas.
+    """
+    ts, row_id = cursor
+    return or_(ts_column < ts, and_(ts_column == ts, id_column < row_id))
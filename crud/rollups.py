@@ -0,0 +1,235 @@
+# crud/rollups.py
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from bd.models import MachineData, MachineDataRollup
+
+
+# Resoluciones mantenidas (segundos por bucket): 1 minuto y 1 hora
+ROLLUP_RESOLUTIONS = (60, 3600)
+METRICS = ("temperature", "vibration", "energy_consumption")
+
+# Máximo de buckets por sentencia INSERT ... ON DUPLICATE KEY UPDATE
+UPSERT_CHUNK_SIZE = 1000
+# Máximo de lecturas crudas por serie cuando ninguna agregación alcanza
+MAX_RAW_POINTS = 5000
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime, resolution: int) -> datetime:
+    """Inicio del bucket de `resolution` segundos que contiene ts (UTC naive)."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    seconds = int((ts - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+# ============================
+# AGREGACIÓN EN MEMORIA
+# ============================
+def aggregate_rows(rows: list) -> list:
+    """
+    Agrega lecturas (dicts con machine_id, recorded_at y métricas) en un
+    dict por (máquina, resolución, bucket), ordenados por clave para que
+    las escrituras concurrentes bloqueen las filas siempre en el mismo orden.
+    """
+    acc = {}
+    for row in rows:
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (row["machine_id"], resolution, bucket_start(row["recorded_at"], resolution))
+            agg = acc.get(key)
+            if agg is None:
+                agg = {"machine_id": key[0], "resolution": resolution, "bucket_start": key[2], "count": 0}
+                for m in METRICS:
+                    agg[f"{m}_min"] = row[m]
+                    agg[f"{m}_max"] = row[m]
+                    agg[f"{m}_sum"] = 0.0
+                    agg[f"{m}_sumsq"] = 0.0
+                acc[key] = agg
+            agg["count"] += 1
+            for m in METRICS:
+                x = row[m]
+                if x < agg[f"{m}_min"]:
+                    agg[f"{m}_min"] = x
+                if x > agg[f"{m}_max"]:
+                    agg[f"{m}_max"] = x
+                agg[f"{m}_sum"] += x
+                agg[f"{m}_sumsq"] += x * x
+    return [acc[key] for key in sorted(acc)]
+
+
+def upsert_statements(rows: list):
+    """
+    Sentencias INSERT ... ON DUPLICATE KEY UPDATE que suman los agregados
+    de `rows` a los buckets existentes (compartido con crud/aio/rollups.py).
+    """
+    aggregates = aggregate_rows(rows)
+    cols = MachineDataRollup.__table__.c
+    for start in range(0, len(aggregates), UPSERT_CHUNK_SIZE):
+        stmt = mysql_insert(MachineDataRollup).values(aggregates[start:start + UPSERT_CHUNK_SIZE])
+        new = stmt.inserted
+        updates = {"count": cols.count + new.count}
+        for m in METRICS:
+            updates[f"{m}_min"] = func.least(cols[f"{m}_min"], new[f"{m}_min"])
+            updates[f"{m}_max"] = func.greatest(cols[f"{m}_max"], new[f"{m}_max"])
+            updates[f"{m}_sum"] = cols[f"{m}_sum"] + new[f"{m}_sum"]
+            updates[f"{m}_sumsq"] = cols[f"{m}_sumsq"] + new[f"{m}_sumsq"]
+        yield stmt.on_duplicate_key_update(**updates)
+
+
+def apply_rollups(db: Session, rows: list):
+    """Actualiza los rollups con nuevas lecturas; lo confirma quien llama."""
+    for stmt in upsert_statements(rows):
+        db.execute(stmt)
+
+
+# ============================
+# SERIES
+# ============================
+def choose_resolution(start: datetime, end: datetime, points: int):
+    """
+    Resolución más gruesa que aún da al menos `points` buckets en el rango;
+    None → no alcanza ninguna y se sirven las lecturas crudas.
+    """
+    span = (end - start).total_seconds()
+    for resolution in sorted(ROLLUP_RESOLUTIONS, reverse=True):
+        if span / resolution >= points:
+            return resolution
+    return None
+
+
+def raw_count_statement(machine_id: int, start: datetime, end: datetime):
+    """
+    Lecturas crudas en [start, end), contando como mucho MAX_RAW_POINTS + 1:
+    basta para saber si caben (solo recorre el índice (machine_id, recorded_at, id)).
+    """
+    rows = (
+        select(MachineData.id)
+        .where(
+            MachineData.machine_id == machine_id,
+            MachineData.recorded_at >= start,
+            MachineData.recorded_at < end,
+        )
+        .limit(MAX_RAW_POINTS + 1)
+        .subquery()
+    )
+    return select(func.count()).select_from(rows)
+
+
+def series_statement(machine_id: int, resolution, start: datetime, end: datetime):
+    if resolution is None:
+        return (
+            select(MachineData)
+            .where(
+                MachineData.machine_id == machine_id,
+                MachineData.recorded_at >= start,
+                MachineData.recorded_at < end,
+            )
+            .order_by(MachineData.recorded_at, MachineData.id)
+            .limit(MAX_RAW_POINTS)
+        )
+    return (
+        select(MachineDataRollup)
+        .where(
+            MachineDataRollup.machine_id == machine_id,
+            MachineDataRollup.resolution == resolution,
+            MachineDataRollup.bucket_start >= bucket_start(start, resolution),
+            MachineDataRollup.bucket_start < end,
+        )
+        .order_by(MachineDataRollup.bucket_start)
+    )
+
+
+def series_points(rows: list, resolution) -> list:
+    """Convierte lecturas crudas o buckets al formato de SeriesPoint."""
+    points = []
+    for row in rows:
+        if resolution is None:
+            point = {"ts": row.recorded_at, "count": 1}
+            for m in METRICS:
+                x = getattr(row, m)
+                point[m] = {"min": x, "max": x, "avg": x, "std": 0.0}
+        else:
+            n = row.count
+            point = {"ts": row.bucket_start, "count": n}
+            for m in METRICS:
+                avg = getattr(row, f"{m}_sum") / n
+                var = max(getattr(row, f"{m}_sumsq") / n - avg * avg, 0.0)
+                point[m] = {
+                    "min": getattr(row, f"{m}_min"),
+                    "max": getattr(row, f"{m}_max"),
+                    "avg": avg,
+                    "std": var ** 0.5,
+                }
+        points.append(point)
+    return points
+
+
+# ============================
+# BACKFILL
+# ============================
+def backfill_rollups(
+    db: Session,
+    machine_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    chunk_size: int = 10000,
+    progress=None,
+):
+    """
+    Reconstruye los rollups desde machine_data, por bloques de chunk_size
+    filas (keyset por id, un commit por bloque).
+    El rango se amplía a horas completas para rehacer buckets enteros.
+    Solo se recorren las filas existentes al empezar; conviene lanzarlo con
+    la ingesta parada para no contar dos veces las lecturas que lleguen
+    mientras se borran los buckets.
+    """
+    coarse = max(ROLLUP_RESOLUTIONS)
+    if start is not None:
+        start = bucket_start(start, coarse)
+    if end is not None:
+        aligned = bucket_start(end, coarse)
+        end = aligned if aligned == end else aligned + timedelta(seconds=coarse)
+
+    rollup_filters = []
+    data_filters = []
+    if machine_id is not None:
+        rollup_filters.append(MachineDataRollup.machine_id == machine_id)
+        data_filters.append(MachineData.machine_id == machine_id)
+    if start is not None:
+        rollup_filters.append(MachineDataRollup.bucket_start >= start)
+        data_filters.append(MachineData.recorded_at >= start)
+    if end is not None:
+        rollup_filters.append(MachineDataRollup.bucket_start < end)
+        data_filters.append(MachineData.recorded_at < end)
+
+    db.execute(delete(MachineDataRollup).where(*rollup_filters))
+    max_id = db.execute(select(func.max(MachineData.id))).scalar() or 0
+    db.commit()
+
+    columns = [MachineData.id, MachineData.machine_id, MachineData.recorded_at] + [
+        getattr(MachineData, m) for m in METRICS
+    ]
+    last_id, total = 0, 0
+    while last_id < max_id:
+        stmt = (
+            select(*columns)
+            .where(MachineData.id > last_id, MachineData.id <= max_id, *data_filters)
+            .order_by(MachineData.id)
+            .limit(chunk_size)
+        )
+        rows = [dict(r._mapping) for r in db.execute(stmt)]
+        if not rows:
+            break
+        apply_rollups(db, rows)
+        db.commit()
+        last_id = rows[-1]["id"]
+        total += len(rows)
+        if progress:
+            progress(total)
+    return total
@@ -0,0 +1,61 @@
+# crud/thresholds.py
+
+from typing import Optional
+
+from sqlalchemy.orm import Session
+from bd.models import ThresholdProfile
+from bd.schemas import ThresholdValues
+from analisys.predictive import threshold_cache
+
+
+def profile_filter(machine_id: Optional[int], machine_type: Optional[str]):
+    if (machine_id is None) == (machine_type is None):
+        raise ValueError("Indica machine_id o machine_type (solo uno)")
+    if machine_id is not None:
+        return ThresholdProfile.machine_id == machine_id
+    return ThresholdProfile.machine_type == machine_type
+
+
+# ============================
+# GET PROFILES
+# ============================
+def get_profiles(db: Session):
+    return db.query(ThresholdProfile).all()
+
+
+def get_profile(db: Session, machine_id: int = None, machine_type: str = None):
+    return db.query(ThresholdProfile).filter(profile_filter(machine_id, machine_type)).first()
+
+
+# ============================
+# UPSERT PROFILE
+# ============================
+def set_profile(db: Session, values: ThresholdValues, machine_id: int = None, machine_type: str = None):
+    profile = get_profile(db, machine_id, machine_type)
+    if profile is None:
+        profile = ThresholdProfile(machine_id=machine_id, machine_type=machine_type)
+        db.add(profile)
+
+    profile.temperature = values.temperature
+    profile.vibration = values.vibration
+    profile.energy_consumption = values.energy_consumption
+
+    db.commit()
+    db.refresh(profile)
+    # el análisis recarga los umbrales en la siguiente lectura
+    threshold_cache.invalidate()
+    return profile
+
+
+# ============================
+# DELETE PROFILE
+# ============================
+def delete_profile(db: Session, machine_id: int = None, machine_type: str = None):
+    profile = get_profile(db, machine_id, machine_type)
+    if not profile:
+        return False
+
+    db.delete(profile)
+    db.commit()
+    threshold_cache.invalidate()
+    return True
@@ -0,0 +1,178 @@
+# export.py
+"""
+Exportación masiva de machine_data en streaming (CSV, NDJSON, Arrow, Parquet).
+
+Las filas salen en lotes del cursor del lado del servidor
+(crud.aio.machine_data.stream_machine_data) y cada lote se codifica y se
+envía antes de pedir el siguiente: la memoria es la de un lote, exporte uno
+o cien millones de filas. Si el cliente lee despacio, la respuesta deja de
+pedir lotes a la BD (contrapresión de StreamingResponse).
+
+Arrow IPC y Parquet necesitan pyarrow (opcional); sin él solo se ofrecen
+CSV y NDJSON.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from bd.database import AsyncSessionLocal
+from crud.aio.machine_data import stream_machine_data
+from crud.machine_data import EXPORT_BATCH_SIZE, EXPORT_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# formato -> (media type, extensión); arrow es el formato de stream de Arrow IPC
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+
+def available_formats() -> tuple:
+    if pa is None:
+        return tuple(f for f in FORMATS if f not in COLUMNAR_FORMATS)
+    return tuple(FORMATS)
+
+
+# ============================
+# LECTURA
+# ============================
+async def export_batches(machine_ids: list, start=None, end=None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[list]:
+    """
+    Lotes de filas de las máquinas. Abre su propia sesión: la del endpoint
+    se cierra antes de que empiece a enviarse la respuesta.
+    """
+    async with AsyncSessionLocal() as db:
+        async for batch in stream_machine_data(db, machine_ids, start, end, batch_size):
+            yield batch
+
+
+# ============================
+# CODIFICACIÓN
+# ============================
+async def encode_csv(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    async for batch in batches:
+        writer.writerows(
+            (row_id, machine_id, recorded_at.isoformat(), temperature, vibration, energy)
+            for row_id, machine_id, recorded_at, temperature, vibration, energy in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def encode_ndjson(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    dumps = json.dumps
+    async for batch in batches:
+        lines = []
+        for row_id, machine_id, recorded_at, temperature, vibration, energy in batch:
+            lines.append(dumps({
+                "id": row_id,
+                "machine_id": machine_id,
+                "recorded_at": recorded_at.isoformat(),
+                "temperature": temperature,
+                "vibration": vibration,
+                "energy_consumption": energy,
+            }))
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+class _ChunkSink:
+    """Fichero solo-escritura en memoria que se vacía tras cada lote."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("machine_id", pa.int32()),
+        ("recorded_at", pa.timestamp("us")),
+        ("temperature", pa.float64()),
+        ("vibration", pa.float64()),
+        ("energy_consumption", pa.float64()),
+    ])
+
+
+async def encode_columnar(batches: AsyncIterator[list], fmt: str) -> AsyncIterator[bytes]:
+    """Arrow IPC (stream) o Parquet: un record batch / row group por lote."""
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(out, schema)
+    else:
+        writer = pq.ParquetWriter(out, schema, compression="zstd")
+    try:
+        async for batch in batches:
+            columns = list(zip(*batch))
+            record_batch = pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+            if fmt == "arrow":
+                writer.write_batch(record_batch)
+            else:
+                writer.write_table(pa.Table.from_batches([record_batch]))
+            yield sink.take()
+    finally:
+        # cierra el stream / escribe el pie de Parquet (también si no hubo filas)
+        writer.close()
+    yield sink.take()
+
+
+def encode(batches: AsyncIterator[list], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        return encode_csv(batches)
+    if fmt == "ndjson":
+        return encode_ndjson(batches)
+    if fmt in COLUMNAR_FORMATS and pa is not None:
+        return encode_columnar(batches, fmt)
+    raise ValueError(f"format debe ser uno de {available_formats()}")
+
+
+def export_filename(fmt: str, start: Optional[datetime], end: Optional[datetime]) -> str:
+    def stamp(ts):
+        return ts.strftime("%Y%m%dT%H%M%S") if ts else "all"
+    return f"machine_data_{stamp(start)}_{stamp(end)}.{FORMATS[fmt][1]}"
@@ -0,0 +1,295 @@
+# images.py
+"""
+Almacén de imágenes de máquinas direccionado por contenido.
+
+- la subida se copia a disco por bloques de IMAGE_CHUNK_BYTES; cada bloque
+  se escribe y se suma al hash en un hilo (to_thread), así el event loop
+  no espera al disco aunque la imagen sea grande.
+- el nombre es el sha256 del contenido más la extensión del formato real
+  (cabecera del fichero, no image.filename): dos subidas iguales comparten
+  fichero y dos "foto.jpg" distintas ya no se pisan.
+- más de IMAGE_MAX_BYTES → ImageTooLarge; formato no reconocido → UnsupportedImage;
+  un campo de fichero vacío cuenta como "sin imagen" (save devuelve None).
+- FastAPI lee y guarda todo el multipart antes de llamar al endpoint: el
+  límite de tamaño del cuerpo lo aplica UploadLimitMiddleware antes de eso.
+- las miniaturas se generan con Pillow (opcional) en un pool de hilos
+  propio, para no ocupar los hilos de to_thread que usa la BD. Sin Pillow
+  la miniatura es la imagen original.
+- como el nombre cambia si cambia el contenido, se sirven con caché de un
+  año (immutable) y ETag = hash.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "uploads/machines")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_CHUNK_BYTES = 1024 * 1024
+IMAGE_THUMB_WORKERS = int(os.getenv("IMAGE_THUMB_WORKERS", "2"))
+# Margen del cuerpo multipart para los demás campos del formulario y las cabeceras de cada parte
+FORM_OVERHEAD_BYTES = 64 * 1024
+# Lado máximo de la miniatura (px), se conserva la proporción
+THUMBNAIL_SIZE = (320, 320)
+
+# URL pública de las imágenes (la sirve routers/images.py)
+IMAGE_URL_PREFIX = "/machine_images"
+# Caché del navegador: el contenido de un nombre no cambia nunca
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# extensión -> media type
+IMAGE_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+IMAGE_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|gif|webp)$")
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Formato por la firma de los primeros bytes."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def parse_name(name: str):
+    """(hash, extensión) de un nombre válido del almacén, o None (evita rutas arbitrarias)."""
+    match = IMAGE_NAME.match(name)
+    return match.groups() if match else None
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    f.write(chunk)
+    digest.update(chunk)
+
+
+def _make_thumbnail(source: str, target: str):
+    with Image.open(source) as img:
+        img.thumbnail(THUMBNAIL_SIZE)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, "JPEG", quality=85, optimize=True)
+    os.replace(tmp, target)
+
+
+class ImageStore:
+    def __init__(self, directory: str = IMAGE_DIR, max_bytes: int = IMAGE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # miniaturas en curso: nombre -> future (una sola generación por imagen)
+        self._thumbnails: Dict[str, asyncio.Future] = {}
+
+        # contadores
+        self.stored = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.thumbnails_made = 0
+        self.thumbnail_errors = 0
+
+    def path(self, name: str) -> str:
+        # un subdirectorio por los dos primeros caracteres del hash
+        return os.path.join(self.directory, name[:2], name)
+
+    def thumbnail_path(self, name: str) -> str:
+        digest, _ = parse_name(name)
+        return os.path.join(self.directory, name[:2], f"{digest}.thumb.jpg")
+
+    # ============================
+    # SUBIDA
+    # ============================
+    async def save(self, upload) -> Optional[str]:
+        """Guarda un UploadFile y devuelve su nombre (<sha256>.<ext>), o None si viene vacío."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".upload")
+        digest = hashlib.sha256()
+        size = 0
+        extension = None
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await upload.read(IMAGE_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if extension is None:
+                        extension = sniff_extension(chunk[:16])
+                        if extension is None:
+                            raise UnsupportedImage(f"formato no soportado; se aceptan {', '.join(IMAGE_TYPES)}")
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ImageTooLarge(f"la imagen supera {self.max_bytes} bytes")
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+            if extension is None:
+                # campo de fichero sin fichero (formulario enviado sin elegir imagen)
+                os.unlink(tmp)
+                return None
+
+            name = f"{digest.hexdigest()}.{extension}"
+            target = self.path(name)
+            if os.path.exists(target):
+                # mismo contenido ya guardado
+                os.unlink(tmp)
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp, target)
+                self.stored += 1
+        except (ImageTooLarge, UnsupportedImage):
+            self.rejected += 1
+            os.unlink(tmp)
+            raise
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        if Image is not None:
+            # la miniatura se prepara ya, sin esperarla
+            self.thumbnail(name)
+        return name
+
+    # ============================
+    # MINIATURAS
+    # ============================
+    def thumbnail(self, name: str) -> asyncio.Future:
+        """Future con la ruta de la miniatura; la genera en el pool si falta."""
+        loop = asyncio.get_running_loop()
+        target = self.thumbnail_path(name)
+        if Image is None:
+            future = loop.create_future()
+            future.set_result(self.path(name))
+            return future
+        future = self._thumbnails.get(name)
+        if future is not None:
+            return future
+        if os.path.exists(target):
+            future = loop.create_future()
+            future.set_result(target)
+            return future
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=IMAGE_THUMB_WORKERS, thread_name_prefix="thumbnails")
+        future = loop.run_in_executor(self._pool, self._generate, name, target)
+        self._thumbnails[name] = future
+        future.add_done_callback(lambda f: self._thumbnail_done(name, f))
+        return future
+
+    def _thumbnail_done(self, name: str, future: asyncio.Future):
+        self._thumbnails.pop(name, None)
+        if not future.cancelled() and future.exception() is not None:
+            # imagen que Pillow no sabe leer: se servirá la original
+            self.thumbnail_errors += 1
+
+    def _generate(self, name: str, target: str) -> str:
+        _make_thumbnail(self.path(name), target)
+        self.thumbnails_made += 1
+        return target
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "max_bytes": self.max_bytes,
+            "thumbnails": Image is not None,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "thumbnails_made": self.thumbnails_made,
+            "thumbnail_errors": self.thumbnail_errors,
+            "thumbnails_pending": len(self._thumbnails),
+        }
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que corta los cuerpos de más de max_bytes en las rutas
+    indicadas antes de que FastAPI los lea: 413 directamente si lo anuncia
+    Content-Length, y si no (chunked) en cuanto lo recibido lo supera.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for key, value in scope["headers"]:
+            if key == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(send)
+                return
+
+        received = 0
+        rejected = False
+
+        async def receive_wrapper():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes and not rejected:
+                    rejected = True
+                    await self._reject(send)
+                    # la aplicación deja de leer como si el cliente se hubiera ido
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def send_wrapper(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"el cuerpo supera {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def image_url(name: str) -> str:
+    return f"{IMAGE_URL_PREFIX}/{name}"
+
+
+# instancia global
+image_store = ImageStore()
@@ -0,0 +1,220 @@
+# ingestion.py
+import asyncio
+import time
+from typing import Optional
+
+from bd.database import SessionLocal
+from bd.profiling import profile_scope
+from bd.models import MachineData
+from crud.machine_data import create_machine_data_bulk
+from analisys.predictive import analyze_batch
+from metrics import metrics
+from spool import DB_UNAVAILABLE, SPOOL_COMMIT_MS, spool
+
+
+READING_COLUMNS = ("machine_id", "vibration", "temperature", "energy_consumption", "recorded_at")
+
+flush_latency = metrics.histogram(
+    "ingestion_flush_seconds", "Duración de cada lote de la ingesta (INSERT + análisis + commit)"
+)
+flushed_rows = metrics.counter("ingestion_rows_total", "Lecturas escritas por la ingesta en lote")
+flush_errors = metrics.counter("ingestion_flush_errors_total", "Lotes de la ingesta que fallaron")
+
+spooled_flushes = metrics.counter("ingestion_spooled_flushes_total", "Lotes de la ingesta escritos en el spool local")
+
+# marca de fin: el consumidor escribe lo acumulado y termina
+_STOP = object()
+
+
+def write_readings(rows: list, analyze: bool = True):
+    """
+    INSERT multi-fila + análisis predictivo (si analyze) de un lote (dicts
+    con READING_COLUMNS). Lanza la excepción solo si el INSERT no se confirmó;
+    también la usa el replayer del spool.
+    Las lecturas se confirman antes de analizarlas: si después falla el
+    análisis ya están en la BD y no deben ir al spool (se repetirían, y el
+    análisis ya habrá sumado parte del lote a las estadísticas en memoria).
+    """
+    db = SessionLocal()
+    try:
+        try:
+            create_machine_data_bulk(db, rows)
+        except Exception:
+            db.rollback()
+            raise
+
+        if not analyze:
+            return
+
+        # ANALISIS PREDICTIVO (ya con ids asignados)
+        try:
+            analyze_batch(db, [MachineData(**row) for row in rows])
+        except Exception as e:
+            print("Error analizando lote de lecturas (ya guardadas):", e)
+            db.rollback()
+    finally:
+        db.close()
+
+
+class IngestionPipeline:
+    """
+    Etapa de ingesta con cola para lecturas (simulador u otros productores).
+    - los productores hacen `await submit(reading)` y siguen sin esperar a la BD.
+    - un único consumidor vacía la cola en lotes: cuando hay batch_size lecturas
+      o han pasado max_delay segundos desde la primera del lote.
+    - cada lote se escribe con INSERT multi-fila y se analiza con un solo commit,
+      en un único hilo (una llamada a to_thread por lote, no por lectura).
+    - si la BD no está disponible o el commit tarda más de SPOOL_COMMIT_MS,
+      los lotes van al spool local (spool.py) hasta que se haya vaciado.
+    """
+
+    def __init__(self, batch_size: int = 500, max_delay: float = 0.5, max_queue: int = 50000):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # métricas de los flush para poder ajustar batch_size / max_delay
+        self.flushes = 0
+        self.rows = 0
+        self.errors = 0
+        self.spooled = 0
+        self.last_flush_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        await spool.start(write_readings)
+
+    async def stop(self):
+        """Detiene el consumidor escribiendo antes lo que quede en cola."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        await spool.stop()
+
+    async def submit(self, reading: dict):
+        """Encola una lectura; si la cola está llena espera (backpressure)."""
+        if not self.running:
+            await self.start()
+        await self._queue.put(reading)
+
+    async def submit_many(self, readings: list):
+        if not self.running:
+            await self.start()
+        for reading in readings:
+            await self._queue.put(reading)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        if not batch:
+            return
+        start = time.perf_counter()
+        outcome = await asyncio.to_thread(self._write_batch, batch)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.flushes += 1
+        self.last_flush_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        flush_latency.observe(elapsed_ms / 1000)
+        if outcome == "written":
+            self.rows += len(batch)
+            flushed_rows.inc(len(batch))
+        elif outcome == "spooled":
+            self.spooled += len(batch)
+            spooled_flushes.inc()
+        else:
+            self.errors += 1
+            flush_errors.inc()
+
+    def _write_batch(self, batch: list) -> str:
+        """Corre en hilo: "written" (BD), "spooled" (spool local) o "error" (lote perdido)."""
+        rows = [{col: reading[col] for col in READING_COLUMNS} for reading in batch]
+        # con lecturas pendientes en el spool, las nuevas van detrás (orden por máquina)
+        if spool.append_if_active(rows):
+            return "spooled"
+        with profile_scope("ingestion flush"):
+            return self._write_batch_db(rows)
+
+    def _write_batch_db(self, rows: list) -> str:
+        start = time.perf_counter()
+        try:
+            write_readings(rows)
+        except DB_UNAVAILABLE as e:
+            print("BD no disponible, lote de lecturas al spool:", e)
+            spool.append(rows)
+            return "spooled"
+        except Exception as e:
+            # aquí podrías loggear error
+            print("Error guardando lote de lecturas:", e)
+            return "error"
+        if (time.perf_counter() - start) * 1000 > SPOOL_COMMIT_MS:
+            # BD lenta: los siguientes lotes van al spool hasta que el replayer lo vacíe
+            spool.trip()
+        return "written"
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size,
+            "max_delay": self.max_delay,
+            "flushes": self.flushes,
+            "rows": self.rows,
+            "errors": self.errors,
+            "spooled": self.spooled,
+            "last_flush_size": self.last_flush_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "avg_flush_size": round(self.rows / self.flushes, 1) if self.flushes else 0.0,
+            "spool": spool.stats(),
+        }
+
+
+# instancia global (importable)
+ingestion_pipeline = IngestionPipeline()
+
+metrics.callback(
+    "ingestion_queue_depth", "Lecturas en cola pendientes de escribir",
+    lambda: ingestion_pipeline.stats()["queue_depth"],
+)
@@ -1,17 +1,35 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 # Routers
-from bd.database import Base, engine
+from bd.database import Base, engine, SessionLocal, async_engine
 from routers.machines import routerMachines
 from routers.machine_data import routerMachineData
 from routers.alerts import routerAlerts
 
 from routers.realtime import routerRealtime
 from routers.simulator_control import routerSimuladorControl
-
-# import simulator singleton
-from simulator import simulator
+from routers.maintenance import routerMaintenance
+from routers.thresholds import routerThresholds
+from routers.debug import routerDebug
+from routers.images import routerImages
+
+# import simulator singleton (con varios workers solo lo ejecuta el líder)
+from simulator_leader import simulator_leader
+from analisys.stats import stats_registry
+from analisys.alerting import alert_tracker
+from ingestion import ingestion_pipeline
+from retention import retention_worker
+from crud.last_values import last_values
+from crud.hot_window import hot_window
+from crud.machine_data import bulk_ids
+from routers.realtime import ws_manager
+from metrics import MetricsMiddleware, metrics
+from bd.profiling import SQLProfileMiddleware
+from images import FORM_OVERHEAD_BYTES, IMAGE_MAX_BYTES, UploadLimitMiddleware, image_store
 
 
 app = FastAPI(
@@ -20,13 +38,22 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# tamaño de la subida de imágenes, antes de que FastAPI lea el multipart
+# (el más interno: el 413 pasa por CORS y cuenta en /metrics)
+app.add_middleware(UploadLimitMiddleware, paths=["/new_machine"], max_bytes=IMAGE_MAX_BYTES + FORM_OVERHEAD_BYTES)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # cabeceras propias que el frontend necesita leer
+    expose_headers=["X-Next-Cursor", "X-DB-Queries", "X-DB-Time-Ms", "X-DB-Slowest-Ms"],
 )
+# consultas por petición (solo con SQL_PROFILE=1)
+app.add_middleware(SQLProfileMiddleware)
+# peticiones y latencia por ruta para /metrics
+app.add_middleware(MetricsMiddleware)
 
 
 
@@ -39,21 +66,67 @@ app.include_router(routerMachineData)
 app.include_router(routerAlerts)
 app.include_router(routerRealtime)
 app.include_router(routerSimuladorControl)
+app.include_router(routerMaintenance)
+app.include_router(routerThresholds)
+app.include_router(routerDebug)
+app.include_router(routerImages)
+
+# ============================================================
+# MÉTRICAS (formato de texto de Prometheus)
+# ============================================================
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 # ============================================================
 # ENDPOINT RAÍZ
 # ============================================================
 
+def warm_fleet_state():
+    db = SessionLocal()
+    try:
+        # cómo se conocen los ids de los INSERT multi-fila (innodb_autoinc_lock_mode)
+        bulk_ids.detect(db)
+        alert_tracker.warm_all(db)
+        last_values.warm(db)
+        # últimas lecturas de cada máquina para /datas_machine/ (una consulta por máquina)
+        hot_window.warm(db)
+    finally:
+        db.close()
+
+
 # Opcional: arrancar simulación automática al iniciar la app
 @app.on_event("startup")
 async def startup_event():
     # Si quieres que arranque todo automáticamente:
     # await simulator.start_all([1,2,3])  # pasar ids que tengas
-    pass
+    # vista de flota: últimas lecturas y alertas abiertas de todas las máquinas
+    await asyncio.to_thread(warm_fleet_state)
+    await ingestion_pipeline.start()
+    # reparto de lecturas entre workers y elección del líder del simulador
+    await ws_manager.start()
+    await simulator_leader.start()
+    # purga periódica de lecturas y alertas antiguas
+    await retention_worker.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await simulator.stop_all()
+    await retention_worker.stop()
+    await simulator_leader.stop()
+    await ws_manager.stop()
+    image_store.shutdown()
+    # escribe las lecturas que queden en cola
+    await ingestion_pipeline.stop()
+
+    # Guarda las estadísticas incrementales y las alertas en curso pendientes
+    db = SessionLocal()
+    try:
+        stats_registry.checkpoint_all(db)
+        alert_tracker.flush_all(db)
+    finally:
+        db.close()
+    await async_engine.dispose()
 
 
 
@@ -0,0 +1,289 @@
+# metrics.py
+"""
+Métricas de proceso en formato de texto de Prometheus (GET /metrics).
+
+Pensado para dejarlo siempre activo en los caminos calientes:
+- cada serie (métrica + valores de etiquetas) es un objeto creado una vez;
+  las etiquetas se resuelven al importar o se cachean, no en cada observación.
+- un histograma son buckets fijos en una lista de enteros: observar es un
+  bisect, dos sumas y un lock sin contención (las escrituras vienen del
+  event loop y del hilo de ingesta).
+- lo que ya existe como estado (profundidad de colas, conexiones, tamaño
+  de cachés) no se instrumenta: se lee con callbacks al servir /metrics.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+# Buckets de latencia (segundos): de 0.5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ============================
+# SERIES
+# ============================
+class CounterSeries:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # un contador por bucket más el de +Inf (no acumulados)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager que observa la duración del bloque."""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("series", "start")
+
+    def __init__(self, series: HistogramSeries):
+        self.series = series
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.start)
+        return False
+
+
+# ============================
+# MÉTRICAS
+# ============================
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Serie para esos valores de etiqueta; conviene guardarla y reutilizarla."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _items(self):
+        return list(self._series.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_series())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return CounterSeries()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def _render_series(self):
+        for values, series in self._items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(series.value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_series(self):
+        return HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_series(self):
+        for values, series in self._items():
+            with series._lock:
+                counts = list(series.counts)
+                total = series.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric:
+    """
+    Valor leído al servir /metrics: fn() → número o {(valores de etiqueta): número}.
+    kind "gauge" para estados (profundidad de cola) o "counter" para
+    contadores que ya lleva el componente (frames descartados).
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: Iterable[str] = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn()
+        except Exception:
+            # un componente sin arrancar no debe romper /metrics
+            return lines
+        if isinstance(value, dict):
+            for values, v in value.items():
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(v)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+# ============================
+# REGISTRO
+# ============================
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, fn: Callable, labelnames: Iterable[str] = (), kind: str = "gauge"):
+        """Registra (o sustituye) una métrica leída al servir /metrics."""
+        with self._lock:
+            self._metrics[name] = CallbackMetric(name, help, fn, labelnames, kind)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ============================
+# HTTP
+# ============================
+class MetricsMiddleware:
+    """
+    Middleware ASGI (sin BaseHTTPMiddleware: no envuelve request/response)
+    que cuenta peticiones y mide su duración por método y ruta. Se etiqueta
+    con la plantilla de la ruta (/datas_machine/, no la URL con su query)
+    para que el nº de series no crezca con los parámetros.
+    """
+
+    def __init__(self, app, registry: "MetricsRegistry" = None):
+        self.app = app
+        registry = registry or metrics
+        self.requests = registry.counter(
+            "http_requests_total", "Peticiones HTTP por método, ruta y código", ("method", "route", "status")
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            self.latency.labels(method, path).observe(time.perf_counter() - start)
+            self.requests.labels(method, path, status).inc()
+
+
+# instancia global
+metrics = MetricsRegistry()
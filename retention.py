@@ -0,0 +1,146 @@
+# retention.py
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from bd.database import SessionLocal
+from bd.models import Alert, MachineData
+from crud.hot_window import hot_window
+
+
+# ============================
+# Política de retención
+# ============================
+# días que se conserva cada tabla (0 → sin purga); se pueden sobreescribir
+# con variables de entorno
+RETENTION_DAYS = {
+    "machine_data": int(os.getenv("RETENTION_MACHINE_DATA_DAYS", "30")),
+    "alerts": int(os.getenv("RETENTION_ALERTS_DAYS", "365")),
+}
+
+# tabla -> (modelo, columna de antigüedad); la columna debe tener índice
+RETENTION_TABLES = {
+    "machine_data": (MachineData, MachineData.recorded_at),
+    # última vez vista: una alerta que sigue activa no se purga
+    "alerts": (Alert, Alert.last_seen_at),
+}
+
+
+class RetentionWorker:
+    """
+    Purga periódica de filas antiguas en segundo plano.
+    - borra por bloques de chunk_size filas (una transacción corta por bloque)
+      para no mantener bloqueos largos ni frenar la ingesta.
+    - duerme `pause` segundos entre bloques.
+    - guarda un informe por ejecución (filas purgadas y tiempo por tabla).
+    """
+
+    def __init__(self, interval: float = 3600.0, chunk_size: int = 5000, pause: float = 0.2, initial_delay: float = 60.0):
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.initial_delay = initial_delay
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[dict] = None
+        self.totals = {table: 0 for table in RETENTION_TABLES}
+        self.runs = 0
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        await asyncio.sleep(self.initial_delay)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # aquí podrías loggear error
+                print("Error en la purga de retención:", e)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> dict:
+        """Ejecuta una pasada completa de purga (una a la vez)."""
+        async with self._lock:
+            report = {"started_at": datetime.utcnow(), "tables": {}}
+            for table, days in RETENTION_DAYS.items():
+                if not days:
+                    continue
+                report["tables"][table] = await self._purge_table(table, datetime.utcnow() - timedelta(days=days))
+            report["finished_at"] = datetime.utcnow()
+
+            self.runs += 1
+            self.last_run = report
+            summary = ", ".join(f"{t}: {r['deleted']} filas en {r['seconds']}s" for t, r in report["tables"].items())
+            print("Purga de retención:", summary)
+            return report
+
+    async def _purge_table(self, table: str, cutoff: datetime) -> dict:
+        started = time.perf_counter()
+        deleted = chunks = 0
+        while True:
+            n = await asyncio.to_thread(self._delete_chunk, table, cutoff)
+            deleted += n
+            if n:
+                chunks += 1
+            if n < self.chunk_size:
+                break
+            await asyncio.sleep(self.pause)
+        self.totals[table] += deleted
+        if table == "machine_data":
+            # la ventana caliente no debe devolver lecturas ya purgadas
+            hot_window.evict_before(cutoff)
+        return {
+            "cutoff": cutoff,
+            "deleted": deleted,
+            "chunks": chunks,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def _delete_chunk(self, table: str, cutoff: datetime) -> int:
+        """Corre en hilo: borra hasta chunk_size filas anteriores a cutoff."""
+        model, column = RETENTION_TABLES[table]
+        db = SessionLocal()
+        try:
+            # primero los ids (rango sobre el índice de antigüedad) y luego
+            # DELETE por clave primaria: solo se bloquean esas filas
+            ids = db.execute(
+                select(model.id).where(column < cutoff).order_by(column).limit(self.chunk_size)
+            ).scalars().all()
+            if not ids:
+                return 0
+            db.execute(delete(model).where(model.id.in_(ids)), execution_options={"synchronize_session": False})
+            db.commit()
+            return len(ids)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "retention_days": RETENTION_DAYS,
+            "interval": self.interval,
+            "chunk_size": self.chunk_size,
+            "pause": self.pause,
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "total_deleted": self.totals,
+            "last_run": self.last_run,
+        }
+
+
+# instancia global (importable)
+retention_worker = RetentionWorker()
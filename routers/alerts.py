@@ -1,14 +1,19 @@
 # routers/alerts.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
 
-from bd.database import get_db
-from bd.models import Alert, Machine
-from bd.schemas import AlertResponse, AlertCreate
-from crud import alerts
+from bd.database import get_async_db
+from bd.models import Alert, AlertType, Machine
+from bd.schemas import AlertCount, AlertResponse, AlertCreate
+from crud.aio import alerts
+from crud.alerts import COUNT_BUCKETS, COUNT_GROUPS
+from crud.pagination import decode_cursor
 
 routerAlerts = APIRouter(tags=["Alerts"])
 
@@ -17,8 +22,8 @@ routerAlerts = APIRouter(tags=["Alerts"])
 # CREATE ALERT
 # ============================================================
 @routerAlerts.post("/new_alert", response_model=AlertResponse)
-async def create_alert(data: AlertCreate, session: Session = Depends(get_db)):
-    return alerts.create_alert(session, data)
+async def create_alert(data: AlertCreate, session: AsyncSession = Depends(get_async_db)):
+    return await alerts.create_alert(session, data)
 
 
 # ============================================================
@@ -27,15 +32,65 @@ async def create_alert(data: AlertCreate, session: Session = Depends(get_db)):
 @routerAlerts.get("/alerts_machine/", response_model=list[AlertResponse])
 async def get_alerts(
     machine_id: int,
-    session: Session = Depends(get_db),
+    response: Response,
+    alert_type: Optional[AlertType] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_db),
+):
+    """
+    Alertas de la máquina de más nueva a más vieja, opcionalmente de un tipo
+    y creadas en [from, to). Si hay más páginas se devuelve la cabecera
+    X-Next-Cursor; para pedir la siguiente se repite la consulta con cursor=<valor>.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    rows, next_cursor = await alerts.get_alerts_page(
+        session, machine_id, limit=limit, alert_type=alert_type, start=from_, end=to, cursor=after
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+# ============================================================
+# ALERT COUNTS
+# ============================================================
+@routerAlerts.get("/alerts_counts/", response_model=list[AlertCount], response_model_exclude_none=True)
+async def get_alert_counts(
+    group_by: List[str] = Query(["machine", "type"]),
+    bucket: str = "day",
+    machine_id: Optional[List[int]] = Query(None),
+    alert_type: Optional[AlertType] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_db),
 ):
-    return alerts.get_alerts_by_machine(session, machine_id)
+    """
+    Nº de alertas (y suma de ocurrencias) calculado en la BD, agrupado por
+    group_by (repetible: machine, type, bucket). bucket = hour / day / month
+    sobre created_at. Filtros opcionales: machine_id (repetible), alert_type, [from, to).
+    """
+    unknown = set(group_by) - set(COUNT_GROUPS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"group_by debe ser de {COUNT_GROUPS}")
+    if bucket not in COUNT_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket debe ser uno de {tuple(COUNT_BUCKETS)}")
+    return await alerts.get_alert_counts(
+        session, group_by=group_by, bucket=bucket, machine_ids=machine_id,
+        alert_type=alert_type, start=from_, end=to,
+    )
 
 
 # ============================================================
 # GET ONE ALERT
 # ============================================================
 @routerAlerts.get("/get_alert/", response_model=AlertResponse)
-async def get_alert(alert_id: int, session: Session = Depends(get_db)):
-    return alerts.get_alert(session, alert_id)
+async def get_alert(alert_id: int, session: AsyncSession = Depends(get_async_db)):
+    return await alerts.get_alert(session, alert_id)
 
@@ -0,0 +1,21 @@
+# routers/debug.py
+from fastapi import APIRouter
+
+from bd.profiling import profile_stats
+
+routerDebug = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+@routerDebug.get("/sql")
+async def get_sql_profile():
+    """
+    Consultas por unidad de trabajo (SQL_PROFILE=1): media y máximo por
+    etiqueta, últimas unidades con sus sentencias repetidas y consultas lentas.
+    """
+    return profile_stats.report()
+
+
+@routerDebug.post("/sql/reset")
+async def reset_sql_profile():
+    profile_stats.reset()
+    return {"message": "Profile reset"}
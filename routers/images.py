@@ -0,0 +1,58 @@
+# routers/images.py
+import os
+
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import FileResponse
+
+from images import IMAGE_CACHE_CONTROL, IMAGE_TYPES, IMAGE_URL_PREFIX, image_store, parse_name
+
+routerImages = APIRouter(prefix=IMAGE_URL_PREFIX, tags=["Images"])
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def _image_response(path: str, media_type: str, etag: str, if_none_match: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    # el nombre es el hash del contenido: si el ETag coincide, la copia del cliente vale
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@routerImages.get("/stats")
+async def get_image_stats():
+    """Imágenes guardadas, deduplicadas, rechazadas y miniaturas generadas."""
+    return image_store.stats()
+
+
+@routerImages.get("/{name}")
+async def get_image(name: str, if_none_match: str = Header(None)):
+    parsed = parse_name(name)
+    if parsed is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    digest, extension = parsed
+    return _image_response(image_store.path(name), IMAGE_TYPES[extension], f'"{digest}"', if_none_match)
+
+
+@routerImages.get("/{name}/thumbnail")
+async def get_thumbnail(name: str, if_none_match: str = Header(None)):
+    """Miniatura (JPEG, lado máximo 320 px); sin Pillow o si no se pudo generar, la imagen original."""
+    parsed = parse_name(name)
+    if parsed is None or not os.path.exists(image_store.path(name)):
+        raise HTTPException(status_code=404, detail="Image not found")
+    digest, extension = parsed
+    try:
+        path = await image_store.thumbnail(name)
+    except Exception:
+        path = image_store.path(name)
+    if path == image_store.path(name):
+        return _image_response(path, IMAGE_TYPES[extension], f'"{digest}"', if_none_match)
+    return _image_response(path, "image/jpeg", f'"{digest}-thumb"', if_none_match)
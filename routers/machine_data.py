@@ -1,24 +1,252 @@
 # routers/machine_data.py
 
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import codecs
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
 
-from bd.database import get_db
+from bd.database import get_async_db
 from bd.models import MachineData, Machine
-from bd.schemas import MachineDataBase, MachineDataResponse
-from crud import machine_data
+from bd.schemas import MachineDataBase, MachineDataResponse, MachineDataBatchResult, SeriesResponse
+from crud.aio import machine_data, rollups
+from crud.pagination import decode_cursor
+from crud.hot_window import hot_window
+from crud.last_values import last_values
+from ingestion import ingestion_pipeline
+from spool import DB_UNAVAILABLE, spool
+import export
 
 routerMachineData = APIRouter( tags=["Machine Data"])
 
+# Filas por transacción en la ingesta en lote
+BATCH_CHUNK_SIZE = 5000
+# Máximo de errores detallados en la respuesta (el conteo siempre es completo)
+BATCH_MAX_ERRORS = 100
+
 
 # ============================================================
 # CREATE DATA RECORD
 # ============================================================
-@routerMachineData.post("/new_machine_data", response_model=MachineDataResponse)
-async def create_machine_data(data: MachineDataBase, session: Session = Depends(get_db)):
-    return machine_data.create_machine_data(session, data)
+@routerMachineData.post(
+    "/new_machine_data",
+    response_model=MachineDataResponse,
+    responses={202: {"description": "BD no disponible: lectura guardada en el spool local"}},
+)
+async def create_machine_data(data: MachineDataBase, session: AsyncSession = Depends(get_async_db)):
+    """Si la BD no está disponible la lectura se guarda en el spool y se responde 202 (sin id)."""
+    row = data.model_dump()
+    if await spool.append_if_active_async([row], analyze=False):
+        return _spooled_response(data)
+    try:
+        return await machine_data.create_machine_data(session, data)
+    except DB_UNAVAILABLE:
+        await session.rollback()
+        await spool.append_async([row], analyze=False)
+        return _spooled_response(data)
+
+
+def _spooled_response(data: MachineDataBase) -> JSONResponse:
+    return JSONResponse(status_code=202, content={**data.model_dump(mode="json"), "spooled": True})
+
+
+
+# ============================================================
+# CREATE DATA RECORDS (BULK / STREAMING)
+# ============================================================
+async def _iter_ndjson(request: Request):
+    """Un objeto JSON por línea, leído por trozos sin cargar todo el body."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _iter_json_array(request: Request):
+    """
+    Elementos de un array JSON, leídos por trozos sin cargar todo el body.
+    Si un elemento llega partido entre trozos se espera al siguiente.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    stream = request.stream()
+    buffer, pos = "", 0
+    started = finished = False
+
+    while True:
+        # salta espacios y comas entre elementos
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("se esperaba un array JSON")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+                yield obj
+                continue
+            except json.JSONDecodeError:
+                if finished:
+                    raise ValueError("array JSON mal formado")
+
+        if finished:
+            raise ValueError("array JSON incompleto")
+        # necesita más datos: descarta lo ya consumido y lee otro trozo
+        buffer, pos = buffer[pos:], 0
+        try:
+            buffer += utf8.decode(await stream.__anext__())
+        except StopAsyncIteration:
+            buffer += utf8.decode(b"", final=True)
+            finished = True
+
+
+async def _write_chunk(session: AsyncSession, rows: list) -> str:
+    """Escribe un bloque en una transacción: "written", "spooled" o "error"."""
+    if await spool.append_if_active_async(rows, analyze=False):
+        return "spooled"
+    try:
+        await machine_data.create_machine_data_bulk(session, rows)
+        return "written"
+    except DB_UNAVAILABLE:
+        await session.rollback()
+        await spool.append_async(rows, analyze=False)
+        return "spooled"
+    except Exception:
+        await session.rollback()
+        return "error"
+
+
+@routerMachineData.post(
+    "/new_machine_data_batch",
+    response_model=MachineDataBatchResult,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": MachineDataBase.model_json_schema()}},
+                "application/x-ndjson": {"schema": MachineDataBase.model_json_schema()},
+            },
+            "required": True,
+        }
+    },
+)
+async def create_machine_data_batch(request: Request, session: AsyncSession = Depends(get_async_db)):
+    """
+    Ingesta en lote para gateways que acumulan lecturas:
+    - Content-Type application/json → array de lecturas
+    - Content-Type application/x-ndjson → una lectura por línea (streaming)
+
+    Las filas se validan contra MachineDataBase y se insertan con INSERT
+    multi-fila en bloques de BATCH_CHUNK_SIZE, una transacción por bloque.
+    Mientras un bloque se escribe se sigue leyendo y validando el siguiente.
+    Si la BD no está disponible los bloques se guardan en el spool local
+    (cuentan como aceptados y también en "spooled").
+
+    Si el body se corta o está mal formado a mitad, las filas válidas
+    anteriores se escriben igualmente y se responde 400 con los conteos y
+    failed_at (nº de filas leídas): el cliente reenvía desde esa fila.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = _iter_ndjson(request)
+        ndjson = True
+    else:
+        items = _iter_json_array(request)
+        ndjson = False
+
+    # ids válidos (la tabla de máquinas es pequeña): evita que un machine_id
+    # inexistente haga fallar la FK de todo el bloque
+    try:
+        known_ids = set((await session.execute(select(Machine.id))).scalars().all())
+        catalogue = "no existe"
+    except DB_UNAVAILABLE:
+        # BD caída: vale el catálogo en memoria (lo que conoce este proceso)
+        await session.rollback()
+        known_ids = last_values.machine_ids()
+        catalogue = "no se pudo comprobar (BD no disponible)"
+
+    result = {"accepted": 0, "rejected": 0, "spooled": 0, "errors": []}
+
+    def reject(index: int, error: str):
+        result["rejected"] += 1
+        if len(result["errors"]) < BATCH_MAX_ERRORS:
+            result["errors"].append({"index": index, "error": error})
+
+    chunk = []
+    pending = None  # (tarea, filas, índices) del bloque en escritura
+
+    async def wait_pending():
+        task, rows, indexes = pending
+        outcome = await task
+        if outcome != "error":
+            result["accepted"] += len(rows)
+            if outcome == "spooled":
+                result["spooled"] += len(rows)
+        else:
+            for index in indexes:
+                reject(index, "error de base de datos al insertar el bloque")
+
+    index = 0
+    indexes = []
+    body_error = None
+    try:
+        async for item in items:
+            try:
+                obj = json.loads(item) if ndjson else item
+                row = MachineDataBase.model_validate(obj)
+            except ValidationError as e:
+                reject(index, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                index += 1
+                continue
+            except ValueError as e:
+                reject(index, f"JSON inválido: {e}")
+                index += 1
+                continue
+            if row.machine_id not in known_ids:
+                reject(index, f"machine_id {row.machine_id} {catalogue}")
+                index += 1
+                continue
+
+            chunk.append(row.model_dump())
+            indexes.append(index)
+            index += 1
+
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                if pending:
+                    await wait_pending()
+                pending = (asyncio.create_task(_write_chunk(session, chunk)), chunk, indexes)
+                chunk, indexes = [], []
+    except ValueError as e:
+        body_error = f"Body inválido tras {index} filas: {e}"
+
+    if pending:
+        await wait_pending()
+    if chunk:
+        pending = (asyncio.create_task(_write_chunk(session, chunk)), chunk, indexes)
+        await wait_pending()
+
+    if body_error is not None:
+        # lo anterior ya está escrito: se informa para no reenviarlo
+        raise HTTPException(status_code=400, detail={"error": body_error, "failed_at": index, **result})
+    return result
 
 
 
@@ -28,16 +256,117 @@ async def create_machine_data(data: MachineDataBase, session: Session = Depends(
 @routerMachineData.get("/datas_machine/", response_model=list[MachineDataResponse])
 async def get_all_data(
     machine_id: int,
-    session: Session = Depends(get_db),
+    response: Response,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_db),
+):
+    """
+    Lecturas de la máquina de más nueva a más vieja, en el rango [from, to).
+    Si hay más páginas se devuelve la cabecera X-Next-Cursor; para pedir la
+    siguiente se repite la consulta con cursor=<valor>.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    rows, next_cursor = await machine_data.get_machine_data_page(
+        session, machine_id, limit=limit, start=from_, end=to, cursor=after
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+# ============================================================
+# EXPORT (STREAMING: CSV / NDJSON / ARROW / PARQUET)
+# ============================================================
+@routerMachineData.get("/export_machine_data/")
+async def export_machine_data(
+    machine_id: Optional[List[int]] = Query(None),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    fmt: str = Query("csv", alias="format"),
+    session: AsyncSession = Depends(get_async_db),
+):
+    """
+    Todas las lecturas de las máquinas indicadas (machine_id repetible; sin
+    él, todas) en [from, to), por máquina y en orden cronológico. La
+    respuesta se genera en streaming desde un cursor del servidor, con
+    memoria constante sea cual sea el tamaño de la exportación.
+    Formatos: csv, ndjson y, si está instalado pyarrow, arrow (IPC stream) y parquet.
+    """
+    if fmt not in export.available_formats():
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de {export.available_formats()}")
+    if from_ and to and from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+
+    if machine_id:
+        machine_ids = sorted(set(machine_id))
+    else:
+        machine_ids = (await session.execute(select(Machine.id).order_by(Machine.id))).scalars().all()
+
+    media_type, _ = export.FORMATS[fmt]
+    filename = export.export_filename(fmt, from_, to)
+    return StreamingResponse(
+        export.encode(export.export_batches(machine_ids, from_, to), fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# ============================================================
+# SERIES (ROLLUPS 1 MIN / 1 HORA)
+# ============================================================
+@routerMachineData.get("/series_machine/", response_model=SeriesResponse)
+async def get_series(
+    machine_id: int,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    points: int = Query(200, ge=1, le=5000),
+    session: AsyncSession = Depends(get_async_db),
 ):
-    return machine_data.get_machine_data_by_machine(session, machine_id)
+    """
+    Serie agregada (min/max/avg/std y nº de lecturas por punto) en [from, to).
+    Se usa el rollup más grueso que aún da al menos `points` puntos en el
+    rango; si ninguno alcanza se devuelven las lecturas crudas, salvo que
+    sean más de MAX_RAW_POINTS: entonces el rollup de 1 minuto (menos puntos
+    de los pedidos, pero sin cortar el rango).
+    Por defecto, la última hora.
+    """
+    end = to or datetime.utcnow()
+    start = from_ or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+
+    resolution, series = await rollups.get_series(session, machine_id, start, end, points)
+    return {"machine_id": machine_id, "resolution": resolution, "points": series}
 
 
 # ============================================================
 # GET SINGLE DATA ENTRY
 # ============================================================
 @routerMachineData.get("/get_data", response_model=MachineDataResponse)
-async def get_data(data_id: int, session: Session = Depends(get_db)):
-    return machine_data.get_machine_data(session, data_id)
+async def get_data(data_id: int, session: AsyncSession = Depends(get_async_db)):
+    return await machine_data.get_machine_data(session, data_id)
+
 
-    
+# ============================================================
+# INGESTION PIPELINE STATS
+# ============================================================
+@routerMachineData.get("/ingestion_stats")
+async def get_ingestion_stats():
+    """Tamaño/latencia de los flush de la ingesta en lote, profundidad de la cola y estado del spool."""
+    return ingestion_pipeline.stats()
+
+
+# ============================================================
+# HOT WINDOW STATS
+# ============================================================
+@routerMachineData.get("/hot_window_stats")
+async def get_hot_window_stats():
+    """Ventana caliente: lecturas y memoria por máquina, aciertos y fallos."""
+    return hot_window.stats()
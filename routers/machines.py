@@ -1,27 +1,43 @@
 # routers/machines.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 
-from bd.database import get_db
+from bd.database import get_async_db
 from bd.models import Machine
-from crud import machines
+from crud.aio import machines
+from crud.machine_cache import CachedBody, machine_cache
+from crud.last_values import last_values
+from analisys.alerting import alert_tracker
+from images import ImageTooLarge, UnsupportedImage, image_store, image_url
+from bd.models import AlertType
 from bd.schemas import (
     MachineCreate,
     MachineUpdate,
-    MachineResponse
+    MachineResponse,
+    FleetSnapshot,
 )
 
-import os
-import shutil
+from datetime import datetime
 from fastapi import File, Form, UploadFile
 
 
 
 routerMachines = APIRouter(tags=["Machines"])
 
+_machine_json = TypeAdapter(MachineResponse)
+_machines_json = TypeAdapter(list[MachineResponse])
+
+
+def _cached_response(entry: CachedBody, if_none_match, if_modified_since) -> Response:
+    """Cuerpo cacheado, o 304 sin cuerpo si la copia del cliente sigue valiendo."""
+    if machine_cache.is_fresh(entry, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=entry.headers())
+    return Response(content=entry.body, media_type="application/json", headers=entry.headers())
+
 
 # ============================================================
 # CREATE
@@ -30,23 +46,27 @@ routerMachines = APIRouter(tags=["Machines"])
 async def create_machine_with_image(
     name: str = Form(...),
     description: str = Form(None),
+    machine_type: str = Form(None),
     image: UploadFile = File(None),
-    session: Session = Depends(get_db)
+    session: AsyncSession = Depends(get_async_db)
 ):
-    # Guardar la imagen
-    file_path = None
+    data = MachineCreate(name=name, description=description, machine_type=machine_type)
 
-    if image:
-        upload_dir = "uploads/machines"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = f"{upload_dir}/{image.filename}"
+    # Guardar la imagen (por bloques, fuera del event loop y con nombre = hash del contenido)
+    file_url = None
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+    # el tamaño del cuerpo ya lo limita UploadLimitMiddleware (main.py)
+    if image:
+        try:
+            name = await image_store.save(image)
+            file_url = image_url(name) if name else None
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except UnsupportedImage as e:
+            raise HTTPException(status_code=415, detail=str(e))
 
     # Llamar al CRUD
-    data = MachineCreate(name=name, description=description)
-    return machines.create_machine(session, data, image_url=file_path)
+    return await machines.create_machine(session, data, image_url=file_url)
 
 
 
@@ -54,17 +74,84 @@ async def create_machine_with_image(
 # READ ALL
 # ============================================================
 @routerMachines.get("/machines", response_model=list[MachineResponse])
-async def get_machines(session: Session = Depends(get_db)):
-    return machines.get_machines(session)
-    
+async def get_machines(
+    session: AsyncSession = Depends(get_async_db),
+    if_none_match: str = Header(None),
+    if_modified_since: str = Header(None),
+):
+    # la sesión no abre conexión hasta la primera consulta: un acierto no toca la BD
+    entry = machine_cache.get("all")
+    if entry is None:
+        generation = machine_cache.generation
+        body = _machines_json.dump_json(await machines.get_machines(session))
+        entry = machine_cache.put("all", body, generation)
+    return _cached_response(entry, if_none_match, if_modified_since)
+
 
 # ============================================================
 # READ ONE
 # ============================================================
 @routerMachines.get("/get_machine/", response_model=MachineResponse)
-async def get_machine(machine_id: int, session: Session = Depends(get_db)):
-    return machines.get_machine(session, machine_id)
-    
+async def get_machine(
+    machine_id: int,
+    session: AsyncSession = Depends(get_async_db),
+    if_none_match: str = Header(None),
+    if_modified_since: str = Header(None),
+):
+    entry = machine_cache.get(machine_id)
+    if entry is None:
+        generation = machine_cache.generation
+        machine = await machines.get_machine(session, machine_id)
+        if machine is None:
+            machine_cache.discard(machine_id)
+            raise HTTPException(status_code=404, detail="Machine not found")
+        entry = machine_cache.put(machine_id, _machine_json.dump_json(machine), generation)
+    return _cached_response(entry, if_none_match, if_modified_since)
+
+
+# ============================================================
+# FLEET SNAPSHOT
+# ============================================================
+def _load_fleet(db: Session) -> tuple:
+    return last_values.load_snapshot(db), alert_tracker.load_open_alerts(db)
+
+
+@routerMachines.get("/fleet_snapshot", response_model=FleetSnapshot)
+async def get_fleet_snapshot(session: AsyncSession = Depends(get_async_db)):
+    """
+    Todas las máquinas con su última lectura y sus alertas abiertas, en una
+    sola llamada y sin consultar la BD (caché de últimos valores + alertas
+    en memoria). status: critical / warning si hay alertas abiertas, ok si
+    no, no_data si aún no hay lecturas.
+    Con varios workers la memoria de cada uno solo refleja sus propias
+    escrituras: entonces se consulta la BD (tres consultas).
+    """
+    if last_values.enabled:
+        snapshot, open_alerts = last_values.snapshot(), alert_tracker.open_alerts()
+    else:
+        snapshot, open_alerts = await session.run_sync(_load_fleet)
+    counts = {"critical": 0, "warning": 0, "ok": 0, "no_data": 0}
+    items = []
+    for machine, reading in snapshot:
+        alerts = open_alerts.get(machine["id"], [])
+        if any(a["alert_type"] == AlertType.critical for a in alerts):
+            status = "critical"
+        elif alerts:
+            status = "warning"
+        elif reading is None:
+            status = "no_data"
+        else:
+            status = "ok"
+        counts[status] += 1
+        items.append({**machine, "status": status, "last_reading": reading, "alerts": alerts})
+    return {"generated_at": datetime.utcnow(), "counts": counts, "machines": items}
+
+
+@routerMachines.get("/machines/cache")
+async def get_machine_cache():
+    """Aciertos, fallos, 304 e invalidaciones de la caché del catálogo."""
+    return machine_cache.stats()
+
 
 # ============================================================
 # UPDATE
@@ -73,15 +160,15 @@ async def get_machine(machine_id: int, session: Session = Depends(get_db)):
 async def update_machine(
     machine_id: int,
     machine_data: MachineUpdate,
-    session: Session = Depends(get_db)
+    session: AsyncSession = Depends(get_async_db)
 ):
-    return machines.update_machine(session, machine_id, machine_data)
+    return await machines.update_machine(session, machine_id, machine_data)
     
 
 # ============================================================
 # DELETE
 # ============================================================
 @routerMachines.delete("/delete_machine/")
-async def delete_machine(machine_id: int, session: Session = Depends(get_db)):
-    return machines.delete_machine(session, machine_id)
+async def delete_machine(machine_id: int, session: AsyncSession = Depends(get_async_db)):
+    return await machines.delete_machine(session, machine_id)
 
@@ -0,0 +1,18 @@
+# routers/maintenance.py
+from fastapi import APIRouter
+
+from retention import retention_worker
+
+routerMaintenance = APIRouter(prefix="/maintenance", tags=["Maintenance"])
+
+
+@routerMaintenance.get("/retention")
+async def get_retention_status():
+    """Política de retención, totales purgados e informe de la última ejecución."""
+    return retention_worker.stats()
+
+
+@routerMaintenance.post("/retention/run")
+async def run_retention():
+    """Lanza una purga ahora (espera si ya hay una en curso) y devuelve su informe."""
+    return await retention_worker.run_once()
@@ -1,36 +1,327 @@
 # routers/realtime.py
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from typing import Dict, List
+from collections import deque
+from typing import Dict, Iterable, Optional, Set
+import asyncio
 import json
+import os
+import time
+
+from metrics import metrics
+from bd.profiling import profile_scope
+from broadcast import broadcast
 
 routerRealtime = APIRouter(prefix="/realtime", tags=["Realtime"])
 
+
+# Políticas cuando la cola de salida de una conexión está llena:
+# - "drop_oldest": se descarta el frame más antiguo
+# - "latest": se descartan los frames pendientes de la misma máquina
+#   (solo interesa el último valor); si no hay, el más antiguo
+# - "disconnect": se cierra la conexión del cliente lento
+QUEUE_POLICIES = ("drop_oldest", "latest", "disconnect")
+
+WS_QUEUE_POLICY = os.getenv("WS_QUEUE_POLICY", "drop_oldest")
+WS_MAX_QUEUE = int(os.getenv("WS_MAX_QUEUE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# Máximo de ids por mensaje subscribe/unsubscribe
+WS_MAX_SUBSCRIBE_IDS = int(os.getenv("WS_MAX_SUBSCRIBE_IDS", "5000"))
+
+# Canal de broadcast.py por el que viajan las lecturas entre workers
+WS_CHANNEL = "ws"
+
+broadcast_latency = metrics.histogram(
+    "ws_broadcast_seconds", "Duración de broadcast_machine (serializar y encolar en los suscriptores)"
+)
+delivery_latency = metrics.histogram(
+    "ws_delivery_seconds", "Desde que un frame se encola hasta que se envía al cliente"
+)
+ws_connects = metrics.counter("ws_connections_opened_total", "Conexiones WebSocket aceptadas")
+ws_disconnects = metrics.counter("ws_connections_closed_total", "Conexiones WebSocket cerradas")
+
+
+class WSConnection:
+    """
+    Un websocket con su propia cola de salida acotada y su tarea escritora.
+    Encolar nunca espera: un cliente lento solo se retrasa a sí mismo.
+    Las respuestas de control (pong, confirmaciones de suscripción) van por
+    una cola aparte que el escritor vacía primero y a la que no se aplica la
+    política de descarte: un cliente lento no pierde el pong ni se le
+    desconecta por él (si deja de leer, lo cierra WS_SEND_TIMEOUT).
+    - machines / all: suscripciones de la conexión (las mantiene WSManager).
+    - max_rate: máximo de frames por segundo y máquina; lo que llega antes
+      se fusiona y solo se envía el último valor al vencer el intervalo.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float, on_close=None):
+        self.ws = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._on_close = on_close
+        self._queue = deque()  # (clave, frame, instante en que se encoló)
+        self._control = deque()  # respuestas de control, sin descarte
+        self._wakeup = asyncio.Event()
+        self.closed = False
+
+        # suscripciones
+        self.machines: Set[int] = set()
+        self.all = False
+
+        # limitación por máquina: machine_id -> instante del próximo envío
+        self.max_rate: Optional[float] = None
+        self._next_send: Dict[int, float] = {}
+        # frames retenidos a la espera de su turno (solo el último por máquina)
+        self._coalesced: Dict[int, str] = {}
+
+        # contadores
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.coalesced = 0
+
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: str, key=None) -> bool:
+        """Encola un frame ya serializado. Devuelve False si la conexión se cerró."""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.dropped += 1
+                self.close()
+                return False
+            if self.policy == "latest" and key is not None:
+                before = len(self._queue)
+                self._queue = deque(item for item in self._queue if item[0] != key)
+                self.dropped += before - len(self._queue)
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+
+        self._queue.append((key, frame, time.perf_counter()))
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._wakeup.set()
+        return True
+
+    def reply(self, frame: str) -> bool:
+        """Encola una respuesta de control; nunca se descarta. False si la conexión se cerró."""
+        if self.closed:
+            return False
+        self._control.append(frame)
+        self._wakeup.set()
+        return True
+
+    def set_max_rate(self, max_rate: Optional[float]):
+        self.max_rate = max_rate or None
+        if self.max_rate is None:
+            # sin límite: se sueltan ya los frames retenidos
+            for machine_id in list(self._coalesced):
+                self._release(machine_id)
+            self._next_send.clear()
+
+    def publish(self, machine_id: int, frame: str):
+        """Encola una lectura respetando max_rate (coalescencia por máquina)."""
+        if self.max_rate is None:
+            self.enqueue(frame, machine_id)
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if machine_id in self._coalesced:
+            # ya hay un envío programado: se sustituye el valor retenido
+            self._coalesced[machine_id] = frame
+            self.coalesced += 1
+            return
+        next_at = self._next_send.get(machine_id, 0.0)
+        if now >= next_at:
+            self._next_send[machine_id] = now + 1.0 / self.max_rate
+            self.enqueue(frame, machine_id)
+            return
+        self._coalesced[machine_id] = frame
+        loop.call_later(next_at - now, self._release, machine_id)
+
+    def _release(self, machine_id: int):
+        frame = self._coalesced.pop(machine_id, None)
+        if frame is None or self.closed:
+            return
+        if self.max_rate is not None:
+            self._next_send[machine_id] = asyncio.get_running_loop().time() + 1.0 / self.max_rate
+        self.enqueue(frame, machine_id)
+
+    def forget_machines(self, machine_ids: Optional[Iterable[int]] = None):
+        """Descarta el estado de limitación de máquinas que ya no se siguen (None → todas)."""
+        if machine_ids is None:
+            self._coalesced.clear()
+            self._next_send.clear()
+            return
+        for machine_id in machine_ids:
+            self._coalesced.pop(machine_id, None)
+            self._next_send.pop(machine_id, None)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self._queue and not self._control:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                # un socket atascado no puede retener la tarea para siempre
+                if self._control:
+                    frame = self._control.popleft()
+                    await asyncio.wait_for(self.ws.send_text(frame), self.send_timeout)
+                    continue
+                _, frame, enqueued_at = self._queue.popleft()
+                await asyncio.wait_for(self.ws.send_text(frame), self.send_timeout)
+                delivery_latency.observe(time.perf_counter() - enqueued_at)
+                self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # envío fallido o atascado → se cierra la conexión
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._control.clear()
+        self._coalesced.clear()
+        if not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.ensure_future(self._safe_close())
+        if self._on_close:
+            self._on_close(self)
+
+    async def _safe_close(self):
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        client = self.ws.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "subscriptions": "all" if self.all else sorted(self.machines),
+            "max_rate": self.max_rate,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+        }
+
+
 class WSManager:
     """
     Manager simple para websockets.
-    Mantiene conexiones por machine_id.
+    Una conexión puede seguir varias máquinas o toda la flota; el índice
+    machine_id -> conexiones (más el conjunto de suscriptores a "all") hace
+    que publicar cueste lo mismo que los suscriptores reales, no que el
+    total de conexiones.
+    broadcast_machine serializa el frame una vez, lo encola en cada
+    suscriptor y vuelve sin esperar a ningún envío.
+    Con varios workers, el backend (broadcast.py) reenvía cada frame a los
+    demás procesos, que lo entregan a sus propias conexiones.
     """
-    def __init__(self):
-        # mapping: machine_id -> list of websocket connections
-        self.active: Dict[int, List[WebSocket]] = {}
+    def __init__(self, max_queue: int = 100, policy: str = "drop_oldest", send_timeout: float = 10.0, backend=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy debe ser una de {QUEUE_POLICIES}")
+        self.backend = backend or broadcast
+        self.backend.subscribe(WS_CHANNEL, self._on_remote_frame)
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.connections: Set[WSConnection] = set()
+        # mapping: machine_id -> conexiones suscritas a esa máquina
+        self.active: Dict[int, Set[WSConnection]] = {}
+        # conexiones suscritas a todas las máquinas
+        self.fleet: Set[WSConnection] = set()
+        # frames descartados / fusionados por conexiones ya cerradas
+        self._dropped_closed = 0
+        self._coalesced_closed = 0
+
+    async def start(self):
+        await self.backend.start()
 
-    async def connect(self, machine_id: int, websocket: WebSocket):
+    async def stop(self):
+        await self.backend.stop()
+
+    async def connect(self, websocket: WebSocket) -> WSConnection:
         await websocket.accept()
-        conns = self.active.get(machine_id, [])
-        conns.append(websocket)
-        self.active[machine_id] = conns
+        conn = WSConnection(
+            websocket,
+            self.max_queue,
+            self.policy,
+            self.send_timeout,
+            on_close=self._forget,
+        )
+        self.connections.add(conn)
+        ws_connects.inc()
+        return conn
+
+    def subscribe(self, conn: WSConnection, machine_ids: Optional[Iterable[int]] = None):
+        """Suscribe la conexión a machine_ids, o a toda la flota si es None."""
+        if conn.closed:
+            return
+        if machine_ids is None:
+            conn.all = True
+            self.fleet.add(conn)
+            return
+        for machine_id in machine_ids:
+            if machine_id not in conn.machines:
+                conn.machines.add(machine_id)
+                self.active.setdefault(machine_id, set()).add(conn)
+
+    def unsubscribe(self, conn: WSConnection, machine_ids: Optional[Iterable[int]] = None):
+        """
+        Quita machine_ids de las suscripciones explícitas; None lo quita todo
+        (también "all"). Con "all" activo, quitar ids sueltos no filtra la flota.
+        """
+        if machine_ids is None:
+            conn.all = False
+            self.fleet.discard(conn)
+            conn.forget_machines()
+            machine_ids = list(conn.machines)
+        removed = []
+        for machine_id in machine_ids:
+            if machine_id in conn.machines:
+                conn.machines.discard(machine_id)
+                removed.append(machine_id)
+                conns = self.active.get(machine_id)
+                if conns is not None:
+                    conns.discard(conn)
+                    if not conns:
+                        del self.active[machine_id]
+        if not conn.all:
+            conn.forget_machines(removed)
 
-    def disconnect(self, machine_id: int, websocket: WebSocket):
-        conns = self.active.get(machine_id, [])
-        if websocket in conns:
-            conns.remove(websocket)
-            self.active[machine_id] = conns
+    def disconnect(self, conn: WSConnection):
+        conn.close()
+
+    def _forget(self, conn: WSConnection):
+        if conn not in self.connections:
+            return
+        self.connections.discard(conn)
+        ws_disconnects.inc()
+        self.unsubscribe(conn)
+        self._dropped_closed += conn.dropped
+        self._coalesced_closed += conn.coalesced
 
     async def broadcast_machine(self, machine_id: int, payload: dict):
-        """Enviar payload JSON a todos los sockets suscritos a machine_id."""
-        conns = self.active.get(machine_id, [])
-        if not conns:
+        """Enviar payload JSON a todos los sockets suscritos a machine_id (en todos los workers)."""
+        multiprocess = self.backend.multiprocess
+        if not multiprocess and not self.active.get(machine_id) and not self.fleet:
             return
+        start = time.perf_counter()
         text = json.dumps({
             "machine_id": machine_id,
             "data": {
@@ -40,23 +331,62 @@ class WSManager:
                 "recorded_at": payload["recorded_at"].isoformat()
             }
         }, default=str)
-        for ws in list(conns):
-            try:
-                await ws.send_text(text)
-            except Exception:
-                # si falla, desconectar
-                await self._safe_disconnect(machine_id, ws)
-
-    async def _safe_disconnect(self, machine_id: int, ws: WebSocket):
-        try:
-            await ws.close()
-        except Exception:
-            pass
-        self.disconnect(machine_id, ws)
+        self.deliver(machine_id, text)
+        if multiprocess:
+            self.backend.publish(WS_CHANNEL, f"{machine_id} {text}")
+        broadcast_latency.observe(time.perf_counter() - start)
+
+    def deliver(self, machine_id: int, text: str):
+        """Encola un frame ya serializado en las conexiones de este worker."""
+        conns = self.active.get(machine_id)
+        for conn in list(self.fleet):
+            conn.publish(machine_id, text)
+        if conns:
+            for conn in list(conns):
+                # los suscriptores a "all" ya lo han recibido
+                if not conn.all:
+                    conn.publish(machine_id, text)
+
+    def _on_remote_frame(self, message: str):
+        machine_id, _, text = message.partition(" ")
+        self.deliver(int(machine_id), text)
+
+    def stats(self) -> dict:
+        connections = []
+        dropped = self._dropped_closed
+        coalesced = self._coalesced_closed
+        for conn in self.connections:
+            dropped += conn.dropped
+            coalesced += conn.coalesced
+            connections.append(conn.stats())
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "connections": len(connections),
+            "fleet_subscribers": len(self.fleet),
+            "machines_subscribed": len(self.active),
+            "dropped_total": dropped,
+            "coalesced_total": coalesced,
+            "broadcast": self.backend.stats(),
+            "per_connection": connections,
+        }
 
 
 # instancia global
-ws_manager = WSManager()
+ws_manager = WSManager(max_queue=WS_MAX_QUEUE, policy=WS_QUEUE_POLICY, send_timeout=WS_SEND_TIMEOUT)
+
+metrics.callback("ws_connections", "Conexiones WebSocket abiertas", lambda: len(ws_manager.connections))
+metrics.callback(
+    "ws_frames_dropped_total", "Frames descartados por colas de salida llenas",
+    lambda: ws_manager._dropped_closed + sum(conn.dropped for conn in ws_manager.connections),
+    kind="counter",
+)
+
+
+@routerRealtime.get("/stats")
+async def realtime_stats():
+    """Conexiones activas, profundidad de cola y frames descartados por conexión (de este worker)."""
+    return ws_manager.stats()
 
 
 @routerRealtime.websocket("/machine/")
@@ -65,16 +395,102 @@ async def machine_ws(websocket: WebSocket, machine_id: int):
     WebSocket endpoint para suscribirse a lecturas de la máquina con id=machine_id.
     - Conectar desde Angular: new WebSocket("ws://localhost:8000/realtime/machine/1")
     """
+    conn = await ws_manager.connect(websocket)
+    ws_manager.subscribe(conn, [machine_id])
     try:
-        await ws_manager.connect(machine_id, websocket)
         while True:
             # Espera mensajes del cliente si quieres soporte bidireccional.
             # Para solo emitir lecturas, simplemente espera pings o duerme.
             data = await websocket.receive_text()
             # opcional: procesar mensajes del cliente
             # Aquí no hacemos nada con data, pero podrías permitir "start", "stop", etc.
-            # Por ejemplo, si cliente envía "ping" responder:
+            # Por ejemplo, si cliente envía "ping" responder
+            # (por la cola de control de la conexión: un único escritor por socket):
+            if data == "ping":
+                conn.reply("pong")
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        # el socket se cerró desde el servidor (cliente lento desconectado)
+        pass
+    finally:
+        ws_manager.disconnect(conn)
+
+
+def _parse_machine_ids(value):
+    """"all" → None (toda la flota); lista de enteros → lista de ids."""
+    if value == "all":
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+        raise ValueError('machine_ids debe ser "all", un entero o una lista de enteros')
+    if len(value) > WS_MAX_SUBSCRIBE_IDS:
+        raise ValueError(f"como máximo {WS_MAX_SUBSCRIBE_IDS} ids por mensaje")
+    return value
+
+
+def _handle_fleet_message(conn: WSConnection, data: str) -> dict:
+    """Aplica un mensaje de control del cliente y devuelve la respuesta."""
+    try:
+        message = json.loads(data)
+        if not isinstance(message, dict):
+            raise ValueError("el mensaje debe ser un objeto JSON")
+        action = message.get("action")
+        if action not in ("subscribe", "unsubscribe"):
+            raise ValueError('action debe ser "subscribe" o "unsubscribe"')
+
+        if action == "subscribe":
+            machine_ids = _parse_machine_ids(message.get("machine_ids", "all"))
+            if "max_rate" in message:
+                max_rate = message["max_rate"]
+                if max_rate is not None and (
+                    isinstance(max_rate, bool) or not isinstance(max_rate, (int, float)) or max_rate <= 0
+                ):
+                    raise ValueError("max_rate debe ser un número positivo o null")
+                conn.set_max_rate(max_rate)
+            ws_manager.subscribe(conn, machine_ids)
+        else:
+            ws_manager.unsubscribe(conn, _parse_machine_ids(message.get("machine_ids", "all")))
+    except ValueError as e:
+        # json.JSONDecodeError es subclase de ValueError
+        return {"type": "error", "detail": str(e)}
+
+    return {
+        "type": "subscriptions",
+        "all": conn.all,
+        "machine_ids": sorted(conn.machines),
+        "max_rate": conn.max_rate,
+    }
+
+
+@routerRealtime.websocket("/fleet/")
+async def fleet_ws(websocket: WebSocket):
+    """
+    Un único WebSocket para varias máquinas o para toda la flota.
+    Mensajes del cliente (JSON):
+    - {"action": "subscribe", "machine_ids": [1, 2, 3], "max_rate": 2}
+    - {"action": "subscribe", "machine_ids": "all"}
+    - {"action": "unsubscribe", "machine_ids": [2]}   ("all" quita todo)
+    max_rate (opcional, frames/s por máquina; null lo quita): las lecturas que
+    llegan antes de tiempo se fusionan y solo se envía la última.
+    Cada respuesta es {"type": "subscriptions", ...} o {"type": "error", "detail": ...};
+    las lecturas llegan con el mismo formato que en /realtime/machine/.
+    """
+    conn = await ws_manager.connect(websocket)
+    try:
+        while True:
+            data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_text("pong")
+                conn.reply("pong")
+                continue
+            with profile_scope("WS /realtime/fleet/ message"):
+                reply = _handle_fleet_message(conn, data)
+            conn.reply(json.dumps(reply))
     except WebSocketDisconnect:
-        ws_manager.disconnect(machine_id, websocket)
+        pass
+    except Exception:
+        # el socket se cerró desde el servidor (cliente lento desconectado)
+        pass
+    finally:
+        ws_manager.disconnect(conn)
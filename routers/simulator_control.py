@@ -1,42 +1,70 @@
 # routers/simulator_control.py
-from fastapi import APIRouter, HTTPException
-from simulator import simulator
-from bd.database import SessionLocal
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from simulator_leader import simulator_leader
+from simulator_signals import PROFILES
+from sqlalchemy import select
+from bd.database import AsyncSessionLocal
 from bd.models import Machine
 
 routerSimuladorControl = APIRouter(prefix="/simulator", tags=["Simulator"])
 
+
+def _reply(response: Response, body: dict, forwarded: bool) -> dict:
+    """
+    Con varios workers, si este no es el líder la orden solo se reenvió:
+    202 y status "forwarded" (el resultado se ve en /simulator/status).
+    """
+    if not forwarded:
+        return body
+    response.status_code = 202
+    return {**body, "status": "forwarded", "requested": body["status"], "forwarded": True}
+
+
 @routerSimuladorControl.post("/start/")
-async def start_machine_simulation(machine_id: int):
+async def start_machine_simulation(
+    machine_id: int,
+    response: Response,
+    interval: Optional[float] = Query(None, gt=0, description="Segundos entre lecturas (por defecto el del simulador)"),
+    jitter: Optional[float] = Query(None, ge=0, lt=1, description="Variación aleatoria como fracción del intervalo"),
+    profile: Optional[str] = Query(None, description="Modelo de señal: " + ", ".join(PROFILES)),
+):
+    if profile is not None and profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"profile debe ser uno de {list(PROFILES)}")
     # validar que exista la máquina
-    db = SessionLocal()
-    try:
-        m = db.query(Machine).filter(Machine.id == machine_id).first()
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        m = await db.get(Machine, machine_id)
     if not m:
         raise HTTPException(status_code=404, detail="Machine not found")
-    await simulator.start_machine(machine_id)
-    return {"status": "started", "machine_id": machine_id}
+    # si ya estaba iniciada, interval/jitter la reprograman sin reiniciar nada
+    # con varios workers la orden se reenvía al que ejecuta el simulador
+    schedule = await simulator_leader.start_machine(machine_id, interval, jitter, profile=profile)
+    forwarded = schedule.pop("forwarded", False)
+    return _reply(response, {"status": "started", "machine_id": machine_id, **schedule}, forwarded)
 
 @routerSimuladorControl.post("/stop/")
-async def stop_machine_simulation(machine_id: int):
-    await simulator.stop_machine(machine_id)
-    return {"status": "stopped", "machine_id": machine_id}
+async def stop_machine_simulation(machine_id: int, response: Response):
+    forwarded = await simulator_leader.stop_machine(machine_id)
+    return _reply(response, {"status": "stopped", "machine_id": machine_id}, forwarded)
 
 @routerSimuladorControl.post("/start_all")
-async def start_all_simulations():
+async def start_all_simulations(
+    response: Response,
+    interval: Optional[float] = Query(None, gt=0, description="Segundos entre lecturas (por defecto el del simulador)"),
+    jitter: Optional[float] = Query(None, ge=0, lt=1, description="Variación aleatoria como fracción del intervalo"),
+):
     # opcional: iniciar para todas las máquinas existentes
-    db = SessionLocal()
-    try:
-        machines = db.query(Machine.id).all()
-        ids = [m[0] for m in machines]
-    finally:
-        db.close()
-    await simulator.start_all(ids)
-    return {"status": "started_all", "count": len(ids)}
+    async with AsyncSessionLocal() as db:
+        ids = (await db.execute(select(Machine.id))).scalars().all()
+    forwarded = await simulator_leader.start_all(ids, interval, jitter)
+    return _reply(response, {"status": "started_all", "count": len(ids)}, forwarded)
 
 @routerSimuladorControl.post("/stop_all")
-async def stop_all_simulations():
-    await simulator.stop_all()
-    return {"status": "stopped_all"}
+async def stop_all_simulations(response: Response):
+    forwarded = await simulator_leader.stop_all()
+    return _reply(response, {"status": "stopped_all"}, forwarded)
+
+@routerSimuladorControl.get("/status")
+async def simulator_status():
+    """Máquinas simuladas y métricas del planificador (tamaño de lote, retraso) y qué worker es el líder."""
+    return await simulator_leader.stats()
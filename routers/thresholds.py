@@ -0,0 +1,80 @@
+# routers/thresholds.py
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bd.database import get_async_db
+from bd.models import Machine
+from bd.schemas import EffectiveThresholds, ThresholdProfileResponse, ThresholdValues
+from crud.aio import thresholds
+from analisys.predictive import THRESHOLDS, threshold_cache
+
+routerThresholds = APIRouter(prefix="/thresholds", tags=["Thresholds"])
+
+
+# ============================================================
+# READ
+# ============================================================
+@routerThresholds.get("/defaults")
+async def get_default_thresholds():
+    """Umbrales por defecto (cuando ni la máquina ni su tipo tienen perfil)."""
+    return THRESHOLDS
+
+
+@routerThresholds.get("/profiles", response_model=list[ThresholdProfileResponse])
+async def get_profiles(session: AsyncSession = Depends(get_async_db)):
+    return await thresholds.get_profiles(session)
+
+
+@routerThresholds.get("/effective/", response_model=EffectiveThresholds)
+async def get_effective_thresholds(machine_id: int, session: AsyncSession = Depends(get_async_db)):
+    """Umbrales que aplica el análisis a la máquina y de dónde sale cada uno."""
+    effective = await thresholds.get_effective(session, machine_id)
+    if effective is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    return effective
+
+
+@routerThresholds.get("/cache")
+async def get_threshold_cache():
+    return threshold_cache.stats()
+
+
+# ============================================================
+# PER MACHINE
+# ============================================================
+@routerThresholds.put("/machine/", response_model=ThresholdProfileResponse)
+async def set_machine_thresholds(
+    machine_id: int,
+    values: ThresholdValues,
+    session: AsyncSession = Depends(get_async_db),
+):
+    if await session.get(Machine, machine_id) is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    return await thresholds.set_profile(session, values, machine_id=machine_id)
+
+
+@routerThresholds.delete("/machine/")
+async def delete_machine_thresholds(machine_id: int, session: AsyncSession = Depends(get_async_db)):
+    if not await thresholds.delete_profile(session, machine_id=machine_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"message": "Profile deleted"}
+
+
+# ============================================================
+# PER MACHINE TYPE
+# ============================================================
+@routerThresholds.put("/type/", response_model=ThresholdProfileResponse)
+async def set_type_thresholds(
+    machine_type: str,
+    values: ThresholdValues,
+    session: AsyncSession = Depends(get_async_db),
+):
+    return await thresholds.set_profile(session, values, machine_type=machine_type)
+
+
+@routerThresholds.delete("/type/")
+async def delete_type_thresholds(machine_type: str, session: AsyncSession = Depends(get_async_db)):
+    if not await thresholds.delete_profile(session, machine_type=machine_type):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"message": "Profile deleted"}
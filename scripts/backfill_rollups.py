@@ -0,0 +1,45 @@
+# scripts/backfill_rollups.py
+"""
+Reconstruye los rollups (1 minuto / 1 hora) desde machine_data.
+
+    python -m scripts.backfill_rollups
+    python -m scripts.backfill_rollups --machine-id 3 --from 2024-01-01 --to 2024-02-01
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from bd.database import Base, SessionLocal, engine
+from crud.rollups import backfill_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machine-id", type=int, default=None)
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    # crea la tabla de rollups si aún no existe
+    Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        total = backfill_rollups(
+            db,
+            machine_id=args.machine_id,
+            start=args.start,
+            end=args.end,
+            chunk_size=args.chunk_size,
+            progress=lambda n: print(f"{n} lecturas procesadas", flush=True),
+        )
+    finally:
+        db.close()
+    print(f"Rollups reconstruidos desde {total} lecturas en {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
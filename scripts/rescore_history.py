@@ -0,0 +1,67 @@
+# scripts/rescore_history.py
+"""
+Re-evalúa el historial de machine_data con las reglas actuales
+(umbrales de threshold_profiles o THRESHOLDS y desviación estándar de
+analisys/predictive.py) y, salvo
+--dry-run, sustituye las alertas de ciclo de vida del rango por las calculadas.
+
+    python -m scripts.rescore_history --dry-run
+    python -m scripts.rescore_history --workers 4
+    python -m scripts.rescore_history --machine-id 3 --from 2024-01-01 --to 2024-02-01
+
+Conviene lanzarlo con la ingesta parada (o reiniciar la app después).
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+from analisys.rescore import CHUNK_SIZE, rescore_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machine-id", type=int, action="append", default=None, help="repetible; sin él, todas")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="procesos en paralelo (una máquina por tarea)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="solo cuenta, no escribe alertas")
+    parser.add_argument("--out", default=None, help="guarda el informe completo en JSON")
+    args = parser.parse_args()
+
+    def progress(report):
+        if "error" in report:
+            print(f"máquina {report['machine_id']}: ERROR {report['error']}", flush=True)
+        else:
+            print(
+                f"máquina {report['machine_id']}: {report['readings']} lecturas, "
+                f"{report['alerts']} alertas ({report['still_open']} abiertas)",
+                flush=True,
+            )
+
+    started = time.perf_counter()
+    result = rescore_history(
+        machine_ids=args.machine_id,
+        start=args.start,
+        end=args.end,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        progress=progress,
+    )
+    totals = result["totals"]
+    print(
+        f"{'[dry-run] ' if args.dry_run else ''}{totals['machines']} máquinas, {totals['readings']} lecturas, "
+        f"{totals['alerts']} alertas (borradas {totals['deleted']}, escritas {totals['written']}), "
+        f"{totals['errors']} errores en {time.perf_counter() - started:.1f}s"
+    )
+    print("por condición:", totals["by_condition"])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
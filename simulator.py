@@ -1,14 +1,21 @@
 # simulator.py
 import asyncio
+import heapq
+import itertools
+import os
 import random
+import time
 from datetime import datetime
 from typing import Dict, Optional
 
-# IMPORTS PARA ESCRIBIR EN BD (sin bloquear el loop)
-from bd.database import SessionLocal   # asume que tienes SessionLocal en bd.database
-from crud.machine_data import create_machine_data
-from bd.schemas import MachineDataBase
-from analisys.predictive import analyze_data_point
+import numpy as np
+
+# INGESTA EN LOTES (no bloquea el loop ni abre una sesión por lectura)
+from ingestion import ingestion_pipeline
+# MODELOS DE SEÑAL VECTORIZADOS (deriva, correlación, desgaste, picos)
+from simulator_signals import SIM_SEED, SignalBank
+from metrics import metrics
+from bd.profiling import profile_scope
 
 
 # IMPORT PARA EMITIR A WEBSOCKETS
@@ -18,104 +25,291 @@ try:
 except Exception:
     ws_manager = None
 
+
+# Las máquinas que vencen dentro de esta ventana (segundos) se generan en el
+# mismo tick: menos despertares del loop a costa de adelantar algunas lecturas
+TICK_RESOLUTION = 0.05
+
+# Acelera deriva y desgaste de las señales (1 = tiempo real)
+SIM_TIME_SCALE = float(os.getenv("SIM_TIME_SCALE", "1"))
+
+tick_latency = metrics.histogram(
+    "simulator_tick_seconds", "Duración de un tick del simulador (generar, encolar y emitir por WebSocket)"
+)
+simulated_readings = metrics.counter("simulator_readings_total", "Lecturas generadas por el simulador")
+
+
+class MachineSchedule:
+    """Programación de una máquina: intervalo propio y jitter (fracción del intervalo)."""
+    __slots__ = ("interval", "jitter", "generation")
+
+    def __init__(self, interval: float, jitter: float, generation: int):
+        self.interval = interval
+        self.jitter = jitter
+        self.generation = generation
+
+    def next_delay(self, rand: random.Random) -> float:
+        if not self.jitter:
+            return self.interval
+        return self.interval * (1.0 + rand.uniform(-self.jitter, self.jitter))
+
+
 class Simulator:
     """
     Simula lecturas para máquinas registradas en la BD.
-    - genera valores de temperature, vibration, energy cada N segundos por máquina.
-    - guarda en BD usando create_machine_data (función CRUD sincronica) dentro de un hilo.
+    - un único bucle planificador (heap de próximos vencimientos) atiende a
+      todas las máquinas; no hay una tarea por máquina.
+    - cada máquina tiene su intervalo y jitter; en cada tick se generan en
+      lote las lecturas de todas las máquinas vencidas (SignalBank, NumPy).
+    - con seed, las señales son reproducibles: deriva y desgaste avanzan con
+      un reloj simulado por máquina (lecturas × intervalo), no con el de pared,
+      así que el retraso del loop no cambia la salida. El ruido sale de un
+      generador compartido: se repite mientras los lotes de cada tick sean
+      los mismos (p. ej. mismas máquinas arrancadas a la vez).
+    - encola el lote en ingestion_pipeline, que lo guarda y analiza en lotes.
     - emite evento via WebSocket (si ws_manager está presente).
     """
 
-    def __init__(self, interval: float = 1.0):
-        self.interval = interval  # segundos entre lecturas por máquina
-        self._tasks: Dict[int, asyncio.Task] = {}
+    def __init__(
+        self,
+        interval: float = 1.0,
+        jitter: float = 0.0,
+        seed: Optional[int] = None,
+        time_scale: float = 1.0,
+    ):
+        self.interval = interval  # segundos entre lecturas por máquina (por defecto)
+        self.jitter = jitter      # variación aleatoria ± jitter * interval
+        self.signals = SignalBank(seed=seed, time_scale=time_scale)
+        self._random = random.Random(seed)  # jitter y reparto de arranques
+        self._machines: Dict[int, MachineSchedule] = {}
+        # reloj simulado de cada máquina (segundos de su próxima lectura); se
+        # conserva al parar: al reanudar la señal sigue donde se quedó
+        self._clocks: Dict[int, float] = {}
+        # heap de (vencimiento, seq, machine_id, generation); las entradas de
+        # máquinas paradas o reprogramadas se descartan al salir del heap
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._generations = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
         self._running = False
 
-    async def _run_for_machine(self, machine_id: int):
-        """Loop que genera datos para una máquina específica."""
-        while self._running and machine_id in self._tasks:
-            reading = self._generate_reading(machine_id)
-            # Guarda en BD (operación bloqueante) dentro de hilo con asyncio.to_thread
-            await asyncio.to_thread(self._save_reading_db, reading)
+        # métricas del planificador
+        self.ticks = 0
+        self.readings = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.max_lag = 0.0        # retraso máximo de una lectura sobre su vencimiento
+        self.rescheduled = 0      # máquinas realineadas por ir más de un intervalo tarde
+        self.total_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ============================
+    # PLANIFICADOR
+    # ============================
+    def _ensure_driver(self):
+        if self.running:
+            return
+        self._running = True
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._drive())
+
+    def _schedule(self, machine_id: int, schedule: MachineSchedule, due: float):
+        heapq.heappush(self._heap, (due, next(self._seq), machine_id, schedule.generation))
+
+    async def _drive(self):
+        """Bucle único: espera al próximo vencimiento y genera el lote vencido."""
+        loop = asyncio.get_running_loop()
+        while self._running:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = loop.time()
+            wait = self._heap[0][0] - now
+            if wait > TICK_RESOLUTION:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due, clocks = self._pop_due(now + TICK_RESOLUTION, now)
+            if due:
+                await self._tick(due, clocks)
+
+    def _pop_due(self, horizon: float, now: float):
+        """Saca del heap las máquinas vencidas y las reprograma; devuelve (ids, reloj simulado de cada una)."""
+        due = []
+        clocks = []
+        while self._heap and self._heap[0][0] <= horizon:
+            when, _, machine_id, generation = heapq.heappop(self._heap)
+            schedule = self._machines.get(machine_id)
+            if schedule is None or schedule.generation != generation:
+                continue
+            due.append(machine_id)
+            clock = self._clocks.get(machine_id, 0.0)
+            clocks.append(clock)
+            self._clocks[machine_id] = clock + schedule.interval
+            if now - when > self.max_lag:
+                self.max_lag = now - when
+            # siguiente vencimiento desde el teórico (sin deriva); si vamos más
+            # de un intervalo tarde se realinea en vez de generar ráfagas
+            next_due = when + schedule.next_delay(self._random)
+            if next_due < now:
+                next_due = now + schedule.next_delay(self._random)
+                self.rescheduled += 1
+            self._schedule(machine_id, schedule, next_due)
+        return due, clocks
+
+    async def _tick(self, machine_ids: list, clocks: Optional[list] = None):
+        start = time.perf_counter()
+        # la escritura en BD es de la ingesta ("ingestion flush"); aquí solo
+        # aparecerían consultas hechas directamente desde el tick
+        with profile_scope("simulator tick"):
+            readings = self._generate_batch(machine_ids, clocks=clocks)
+            # Encola para guardado + análisis en lote (espera solo si la cola está llena)
+            await ingestion_pipeline.submit_many(readings)
             # Emite por WebSocket (si manager disponible)
             if ws_manager:
-                await ws_manager.broadcast_machine(machine_id, reading)
-            await asyncio.sleep(self.interval)
+                for reading in readings:
+                    await ws_manager.broadcast_machine(reading["machine_id"], reading)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        tick_latency.observe(elapsed_ms / 1000)
+        simulated_readings.inc(len(readings))
 
-    def _generate_reading(self, machine_id: int) -> dict:
-        """Genera una lectura realista simulada."""
-        # Puedes ajustar los rangos según el tipo de máquina
-        temperature = round(random.uniform(40.0, 95.0), 2)         # °C
-        vibration = round(random.uniform(0.05, 5.0), 3)            # g o mm/s según escala
-        energy = round(random.uniform(50.0, 800.0), 2)             # W o kW
-        ts = datetime.utcnow()
-        data = {
-            "machine_id": machine_id,
-            "temperature": temperature,
-            "vibration": vibration,
-            "energy_consumption": energy,
-            "recorded_at": ts
-        }
-        return data
+        self.ticks += 1
+        self.readings += len(readings)
+        self.last_batch_size = len(readings)
+        self.max_batch_size = max(self.max_batch_size, len(readings))
+        self.total_tick_ms += elapsed_ms
+        self.max_tick_ms = max(self.max_tick_ms, elapsed_ms)
 
-    def _save_reading_db(self, reading: dict):
+    # ============================
+    # GENERACIÓN
+    # ============================
+    def _generate_batch(self, machine_ids: list, ts: Optional[datetime] = None, clocks: Optional[list] = None) -> list:
         """
-        Función que corre en hilo (sync) para usar tu CRUD sync que maneja Session.
-        Crea una SessionLocal, llama a create_machine_data(db, schema).
+        Lecturas de todas las máquinas vencidas en este tick (misma marca de tiempo).
+        clocks: reloj simulado de cada máquina (None → reloj monotónico).
         """
-        db = SessionLocal()
-        try:
-            schema = MachineDataBase(
-                machine_id=reading["machine_id"],
-                vibration=reading["vibration"],
-                temperature=reading["temperature"],
-                energy_consumption=reading["energy_consumption"],
-                recorded_at=reading["recorded_at"]
+        ts = ts or datetime.utcnow()
+        now = np.array(clocks, dtype=float) if clocks is not None else None
+        # °C, g o mm/s según escala, W o kW; ver PROFILES en simulator_signals.py
+        temperature, vibration, energy = self.signals.generate(machine_ids, now)
+        return [
+            {
+                "machine_id": machine_id,
+                "temperature": t,
+                "vibration": v,
+                "energy_consumption": e,
+                "recorded_at": ts,
+            }
+            for machine_id, t, v, e in zip(
+                machine_ids, temperature.tolist(), vibration.tolist(), energy.tolist()
             )
-            # Guarda en la base de datos
-            created = create_machine_data(db, schema)
-
-            # ANALISIS PREDICTIVO AQUÍ
-            # created es un modelo MachineData ya guardado y refrescado
-            analyze_data_point(db, created)
-        except Exception as e:
-            # aquí podrías loggear error
-            print("Error guardando lectura simulada:", e)
-        finally:
-            db.close()
-
-    async def start_machine(self, machine_id: int):
-        """Inicia la simulación para una máquina concreta (si no está ya iniciada)."""
-        if machine_id in self._tasks:
+        ]
+
+    def _generate_reading(self, machine_id: int, ts: Optional[datetime] = None) -> dict:
+        """Genera una lectura realista simulada."""
+        return self._generate_batch([machine_id], ts)[0]
+
+    # ============================
+    # CONTROL
+    # ============================
+    async def start_machine(
+        self,
+        machine_id: int,
+        interval: Optional[float] = None,
+        jitter: Optional[float] = None,
+        stagger: bool = False,
+        profile: Optional[str] = None,
+    ):
+        """
+        Inicia la simulación para una máquina concreta. Si ya está iniciada y
+        se pasa interval/jitter, se reprograma con los nuevos valores.
+        stagger reparte la primera lectura dentro del intervalo (arranques masivos).
+        profile fija (y reinicia) el modelo de señal; sin él se sortea una vez.
+        """
+        if profile is not None:
+            self.signals.add(machine_id, profile)
+        current = self._machines.get(machine_id)
+        if current is not None and interval is None and jitter is None:
             return
-        self._running = True
-        task = asyncio.create_task(self._run_for_machine(machine_id))
-        self._tasks[machine_id] = task
+        schedule = MachineSchedule(
+            interval if interval is not None else (current.interval if current else self.interval),
+            jitter if jitter is not None else (current.jitter if current else self.jitter),
+            next(self._generations),
+        )
+        self._machines[machine_id] = schedule
+        self._ensure_driver()
+        now = asyncio.get_running_loop().time()
+        if current is not None:
+            due = now + schedule.next_delay(self._random)
+        elif stagger:
+            due = now + self._random.uniform(0, schedule.interval)
+        else:
+            due = now
+        self._schedule(machine_id, schedule, due)
+        self._wakeup.set()
 
     async def stop_machine(self, machine_id: int):
-        """Detiene la simulación para una máquina concreta."""
-        if machine_id in self._tasks:
-            # cancelar tarea
-            task = self._tasks.pop(machine_id)
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
-
-    async def start_all(self, machine_ids: Optional[list] = None):
-        """Inicia simulación para cada id de machine; si no se pasa ids intentará simular para [1..n] o dejar neutral."""
-        self._running = True
+        """Detiene la simulación para una máquina concreta (su entrada del heap se descarta)."""
+        self._machines.pop(machine_id, None)
+
+    async def start_all(
+        self,
+        machine_ids: Optional[list] = None,
+        interval: Optional[float] = None,
+        jitter: Optional[float] = None,
+    ):
+        """Inicia simulación para cada id de machine, repartiendo las primeras lecturas."""
         if machine_ids:
             for mid in machine_ids:
-                if mid not in self._tasks:
-                    await self.start_machine(mid)
+                await self.start_machine(mid, interval, jitter, stagger=True)
 
     async def stop_all(self):
-        """Detiene todas las simulaciones."""
-        self._running = False
-        for mid in list(self._tasks.keys()):
-            await self.stop_machine(mid)
+        """Detiene todas las simulaciones y el bucle planificador."""
+        self._machines.clear()
+        self._heap.clear()
+        if self.running:
+            self._running = False
+            self._wakeup.set()
+            await self._task
+        self._task = None
+
+    def machines(self) -> Dict[int, dict]:
+        return {
+            mid: {"interval": s.interval, "jitter": s.jitter, "profile": self.signals.profile(mid)}
+            for mid, s in self._machines.items()
+        }
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "machines": len(self._machines),
+            "heap_size": len(self._heap),
+            "default_interval": self.interval,
+            "default_jitter": self.jitter,
+            "seed": self.signals.seed,
+            "time_scale": self.signals.time_scale,
+            "ticks": self.ticks,
+            "readings": self.readings,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_tick_ms": round(self.total_tick_ms / self.ticks, 3) if self.ticks else 0.0,
+            "max_tick_ms": round(self.max_tick_ms, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "rescheduled": self.rescheduled,
+        }
 
 # instancia global (importable)
-simulator = Simulator(interval=30.0)
+simulator = Simulator(interval=30.0, seed=SIM_SEED, time_scale=SIM_TIME_SCALE)
+
+metrics.callback("simulator_machines", "Máquinas programadas en el simulador", lambda: len(simulator._machines))
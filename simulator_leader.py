@@ -0,0 +1,269 @@
+# simulator_leader.py
+"""
+Un solo simulador aunque haya varios workers (uvicorn --workers N).
+
+Con un backend de broadcast multiproceso (BROADCAST_BACKEND=unix):
+- el líder es el worker que tiene el flock de SIM_LEADER_LOCK; solo él
+  ejecuta el simulador, así que cada lectura se genera y se ingiere una vez.
+  El kernel suelta el lock si el proceso muere; los demás lo reintentan
+  cada SIM_LEADER_RETRY segundos y el primero que lo obtiene toma el relevo.
+- las órdenes (/simulator/start/, stop, ...) pueden llegar a cualquier
+  worker: los seguidores las reenvían al líder por el canal "simulator".
+  El reenvío es de mejor esfuerzo: si en ese momento ningún worker tiene el
+  lock (relevo en curso) la orden se pierde; la API responde 202 y
+  /simulator/status dice si se aplicó.
+- el líder guarda cada segundo en SIM_STATE_FILE la programación de las
+  máquinas y sus métricas: los seguidores responden /simulator/status con
+  ella y un líder nuevo retoma las máquinas si el estado es reciente.
+Con el backend "inprocess" (un worker) todo se ejecuta localmente, como siempre.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import time
+from typing import Optional
+
+from broadcast import BROADCAST_DIR, broadcast
+from simulator import simulator
+
+
+SIM_LEADER_LOCK = os.getenv("SIM_LEADER_LOCK", os.path.join(BROADCAST_DIR, "simulator.lock"))
+SIM_STATE_FILE = os.getenv("SIM_STATE_FILE", os.path.join(BROADCAST_DIR, "simulator.json"))
+SIM_LEADER_RETRY = float(os.getenv("SIM_LEADER_RETRY", "2"))
+# Un líder nuevo solo retoma la programación si el estado tiene menos de esto
+# (segundos); si todos los workers estuvieron parados más tiempo, el
+# simulador arranca parado como en un solo proceso
+SIM_RESUME_MAX_AGE = float(os.getenv("SIM_RESUME_MAX_AGE", "30"))
+# Cada cuánto escribe el líder su estado (segundos)
+SIM_STATE_INTERVAL = 1.0
+
+# Canal de broadcast.py para las órdenes de los seguidores al líder
+SIM_CHANNEL = "simulator"
+# Ids por mensaje al reenviar start_all (un datagrama)
+FORWARD_CHUNK = 2000
+
+
+class LeaderLock:
+    """flock exclusivo y no bloqueante sobre un fichero; se suelta al cerrar o al morir el proceso."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class SimulatorLeader:
+    """Punto de entrada de /simulator/*: ejecuta en el líder o reenvía a él."""
+
+    def __init__(self, sim=simulator, backend=None, lock_path: str = SIM_LEADER_LOCK, state_path: str = SIM_STATE_FILE):
+        self.simulator = sim
+        self.backend = backend or broadcast
+        self.lock = LeaderLock(lock_path)
+        self.state_path = state_path
+        self._task: Optional[asyncio.Task] = None
+        self._commands: set = set()
+        # programación serializada; se rehace solo cuando cambia
+        self._machines_json: Optional[str] = None
+        self.elected_at: Optional[float] = None
+        self.forwarded = 0
+        self.handled = 0
+        self.resumed = 0
+        self.backend.subscribe(SIM_CHANNEL, self._on_command)
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend.multiprocess
+
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or self.lock.held
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lock.held:
+            # el worker que tome el relevo retoma las máquinas (reinicio escalonado)
+            await self._write_state()
+        await self.simulator.stop_all()
+        if self.lock.held:
+            self.lock.release()
+
+    # ============================
+    # ELECCIÓN
+    # ============================
+    async def _loop(self):
+        while True:
+            if self.lock.held:
+                await self._write_state()
+                await asyncio.sleep(SIM_STATE_INTERVAL)
+            else:
+                if self.lock.try_acquire():
+                    await self._take_over()
+                    continue
+                await asyncio.sleep(SIM_LEADER_RETRY)
+
+    async def _take_over(self):
+        self.elected_at = time.time()
+        state = await asyncio.to_thread(self._read_state)
+        if state is None or time.time() - state.get("updated_at", 0) > SIM_RESUME_MAX_AGE:
+            return
+        # el líder anterior cayó hace poco: se retoman sus máquinas
+        for machine_id, params in state.get("machines", {}).items():
+            await self.simulator.start_machine(
+                int(machine_id), params["interval"], params["jitter"], stagger=True, profile=params.get("profile"),
+            )
+            self.resumed += 1
+        self._machines_json = None
+
+    def _read_state(self) -> Optional[dict]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def _write_state(self):
+        if self._machines_json is None:
+            self._machines_json = json.dumps(self.simulator.machines())
+        text = (
+            '{"pid": %d, "updated_at": %r, "stats": %s, "machines": %s}'
+            % (os.getpid(), time.time(), json.dumps(self.simulator.stats()), self._machines_json)
+        )
+        await asyncio.to_thread(self._replace_state, text)
+
+    def _replace_state(self, text: str):
+        # escribir aparte y renombrar: un lector nunca ve el fichero a medias
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, self.state_path)
+
+    # ============================
+    # ÓRDENES
+    # ============================
+    def _forward(self, op: str, **params):
+        self.backend.publish(SIM_CHANNEL, json.dumps({"op": op, **params}))
+        self.forwarded += 1
+
+    def _on_command(self, message: str):
+        if not self.lock.held:
+            return
+        command = json.loads(message)
+        op = command.pop("op")
+        if op == "start_machine":
+            coro = self.simulator.start_machine(**command)
+        elif op == "stop_machine":
+            coro = self.simulator.stop_machine(**command)
+        elif op == "start_all":
+            coro = self.simulator.start_all(**command)
+        elif op == "stop_all":
+            coro = self.simulator.stop_all()
+        else:
+            return
+        self.handled += 1
+        task = asyncio.ensure_future(coro)
+        # referencia hasta que termine (el loop solo guarda referencias débiles)
+        self._commands.add(task)
+        task.add_done_callback(self._command_done)
+
+    def _command_done(self, task: asyncio.Task):
+        self._commands.discard(task)
+        self._machines_json = None
+
+    async def start_machine(self, machine_id: int, interval=None, jitter=None, profile=None) -> dict:
+        """Inicia (o reprograma) una máquina; devuelve su programación o lo pedido si se reenvió."""
+        if not self.is_leader:
+            self._forward("start_machine", machine_id=machine_id, interval=interval, jitter=jitter, profile=profile)
+            return {"interval": interval, "jitter": jitter, "profile": profile, "forwarded": True}
+        await self.simulator.start_machine(machine_id, interval, jitter, profile=profile)
+        self._machines_json = None
+        return self.simulator.machines()[machine_id]
+
+    async def stop_machine(self, machine_id: int) -> bool:
+        """Devuelve True si la orden se reenvió al líder (sin confirmación)."""
+        if not self.is_leader:
+            self._forward("stop_machine", machine_id=machine_id)
+            return True
+        await self.simulator.stop_machine(machine_id)
+        self._machines_json = None
+        return False
+
+    async def start_all(self, machine_ids: list, interval=None, jitter=None) -> bool:
+        """Devuelve True si la orden se reenvió al líder (sin confirmación)."""
+        if not self.is_leader:
+            for i in range(0, len(machine_ids), FORWARD_CHUNK):
+                self._forward(
+                    "start_all", machine_ids=list(machine_ids[i:i + FORWARD_CHUNK]), interval=interval, jitter=jitter,
+                )
+            return True
+        await self.simulator.start_all(machine_ids, interval, jitter)
+        self._machines_json = None
+        return False
+
+    async def stop_all(self) -> bool:
+        """Devuelve True si la orden se reenvió al líder (sin confirmación)."""
+        if not self.is_leader:
+            self._forward("stop_all")
+            return True
+        await self.simulator.stop_all()
+        self._machines_json = None
+        return False
+
+    async def stats(self) -> dict:
+        """Métricas del simulador: las propias en el líder, las del último estado del líder en los demás."""
+        cluster = {
+            "enabled": self.enabled,
+            "leader": self.is_leader,
+            "pid": os.getpid(),
+            "forwarded": self.forwarded,
+            "handled": self.handled,
+            "resumed": self.resumed,
+        }
+        if self.is_leader:
+            cluster["elected_at"] = self.elected_at
+            return {**self.simulator.stats(), "cluster": cluster}
+        state = await asyncio.to_thread(self._read_state)
+        if state is None:
+            return {"running": None, "cluster": {**cluster, "leader_pid": None}}
+        cluster["leader_pid"] = state.get("pid")
+        cluster["state_age_s"] = round(time.time() - state.get("updated_at", 0), 3)
+        return {**state.get("stats", {}), "cluster": cluster}
+
+
+# instancia global
+simulator_leader = SimulatorLeader()
@@ -0,0 +1,255 @@
+# simulator_signals.py
+import os
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+# Semilla global del simulador (None → no reproducible)
+SIM_SEED: Optional[int] = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+
+
+# ============================
+# Perfiles de señal
+# ============================
+# Cada parámetro es un rango (min, max): al registrar una máquina se sortea
+# su valor con un generador derivado de (seed, machine_id), así los
+# parámetros de una máquina no dependen del orden de registro.
+# - base_*: nivel normal de cada métrica
+# - *_sigma: ruido gaussiano por lectura
+# - corr: correlación del ruido temperatura/vibración
+# - drift: deriva de temperatura en ºC/hora, acotada por drift_max
+# - wear_hours: horas hasta desgaste total de rodamiento (None → sin desgaste);
+#   el desgaste multiplica la vibración (wear_vib) y sube la temperatura (wear_temp)
+# - spike_prob: probabilidad por lectura de un pico de vibración/temperatura
+PROFILES: Dict[str, dict] = {
+    "healthy": {
+        "base_temperature": (50.0, 65.0),
+        "base_vibration": (0.5, 1.5),
+        "base_energy": (200.0, 450.0),
+        "temperature_sigma": (1.0, 2.0),
+        "vibration_sigma": (0.05, 0.15),
+        "energy_sigma": (10.0, 20.0),
+        "corr": (0.5, 0.8),
+        "drift": (0.0, 0.0),
+        "drift_max": (0.0, 0.0),
+        "wear_hours": None,
+        "wear_vib": (0.0, 0.0),
+        "wear_temp": (0.0, 0.0),
+        "spike_prob": (0.0, 0.002),
+    },
+    "drifting": {
+        "base_temperature": (50.0, 65.0),
+        "base_vibration": (0.5, 1.5),
+        "base_energy": (200.0, 450.0),
+        "temperature_sigma": (1.0, 2.0),
+        "vibration_sigma": (0.05, 0.15),
+        "energy_sigma": (10.0, 20.0),
+        "corr": (0.5, 0.8),
+        "drift": (0.5, 2.0),
+        "drift_max": (15.0, 30.0),
+        "wear_hours": None,
+        "wear_vib": (0.0, 0.0),
+        "wear_temp": (0.0, 0.0),
+        "spike_prob": (0.0, 0.002),
+    },
+    "bearing_wear": {
+        "base_temperature": (50.0, 65.0),
+        "base_vibration": (0.8, 1.5),
+        "base_energy": (250.0, 450.0),
+        "temperature_sigma": (1.0, 2.0),
+        "vibration_sigma": (0.05, 0.15),
+        "energy_sigma": (10.0, 20.0),
+        "corr": (0.6, 0.9),
+        "drift": (0.0, 0.0),
+        "drift_max": (0.0, 0.0),
+        "wear_hours": (6.0, 48.0),
+        "wear_vib": (2.0, 4.0),
+        "wear_temp": (10.0, 25.0),
+        "spike_prob": (0.002, 0.01),
+    },
+    "spiky": {
+        "base_temperature": (50.0, 65.0),
+        "base_vibration": (0.5, 1.5),
+        "base_energy": (200.0, 450.0),
+        "temperature_sigma": (1.0, 2.0),
+        "vibration_sigma": (0.05, 0.15),
+        "energy_sigma": (10.0, 20.0),
+        "corr": (0.5, 0.8),
+        "drift": (0.0, 0.0),
+        "drift_max": (0.0, 0.0),
+        "wear_hours": None,
+        "wear_vib": (0.0, 0.0),
+        "wear_temp": (0.0, 0.0),
+        "spike_prob": (0.01, 0.05),
+    },
+}
+
+# Reparto de perfiles cuando no se indica uno al registrar la máquina
+PROFILE_MIX = {"healthy": 0.80, "drifting": 0.10, "bearing_wear": 0.07, "spiky": 0.03}
+
+# Un pico multiplica la vibración y suma grados a la temperatura
+SPIKE_VIBRATION = 2.5
+SPIKE_TEMPERATURE = 12.0
+# Consumo extra por ºC sobre la temperatura base (carga ↔ calor)
+ENERGY_PER_DEGREE = 8.0
+
+_PARAMS = (
+    "base_temperature", "base_vibration", "base_energy",
+    "temperature_sigma", "vibration_sigma", "energy_sigma", "corr",
+    "drift", "drift_max", "wear_rate", "wear_vib", "wear_temp", "spike_prob",
+)
+# estado que evoluciona con el tiempo
+_STATE = ("offset", "wear", "last_t")
+
+
+class SignalBank:
+    """
+    Generador vectorizado de lecturas para muchas máquinas.
+    - Los parámetros y el estado (deriva acumulada, desgaste) de cada máquina
+      viven en arrays de NumPy, una fila por máquina.
+    - generate() produce de una vez las lecturas de un lote de máquinas.
+    - Con la misma seed, la misma secuencia de llamadas (mismos lotes) y los
+      mismos `now`, la salida es idéntica. Sin `now` se usa el reloj
+      monotónico y deriva y desgaste dependen de cuándo se llame.
+    - time_scale > 1 acelera deriva y desgaste (pruebas de carga).
+    """
+
+    def __init__(self, seed: Optional[int] = None, time_scale: float = 1.0, mix: Optional[dict] = None):
+        self.seed = seed
+        self.time_scale = time_scale
+        self.mix = mix or PROFILE_MIX
+        self._rng = np.random.default_rng(seed)
+        self._rows: Dict[int, int] = {}
+        self._profiles: Dict[int, str] = {}
+        self._capacity = 0
+        self._size = 0
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._grow(64)
+
+    def _grow(self, capacity: int):
+        for name in _PARAMS + _STATE:
+            new = np.zeros(capacity)
+            old = self._arrays.get(name)
+            if old is not None:
+                new[:self._size] = old[:self._size]
+            self._arrays[name] = new
+        self._capacity = capacity
+
+    def _machine_rng(self, machine_id: int) -> np.random.Generator:
+        if self.seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([self.seed, machine_id])
+
+    # ============================
+    # REGISTRO
+    # ============================
+    def add(self, machine_id: int, profile: Optional[str] = None):
+        """Registra (o reinicia) una máquina con un perfil; None → sorteado según mix."""
+        rng = self._machine_rng(machine_id)
+        if profile is None:
+            names = list(self.mix)
+            weights = np.array([self.mix[n] for n in names], dtype=float)
+            profile = names[rng.choice(len(names), p=weights / weights.sum())]
+        if profile not in PROFILES:
+            raise ValueError(f"profile debe ser uno de {tuple(PROFILES)}")
+
+        row = self._rows.get(machine_id)
+        if row is None:
+            if self._size == self._capacity:
+                self._grow(self._capacity * 2)
+            row = self._size
+            self._size += 1
+            self._rows[machine_id] = row
+        self._profiles[machine_id] = profile
+
+        spec = PROFILES[profile]
+        a = self._arrays
+        for name, bounds in spec.items():
+            if name == "wear_hours":
+                continue
+            a[name][row] = rng.uniform(*bounds)
+        wear_hours = spec["wear_hours"]
+        a["wear_rate"][row] = 1.0 / (rng.uniform(*wear_hours) * 3600) if wear_hours else 0.0
+        a["offset"][row] = 0.0
+        a["wear"][row] = 0.0
+        a["last_t"][row] = np.nan
+        return profile
+
+    def ensure(self, machine_ids) -> np.ndarray:
+        """Filas de machine_ids, registrando con perfil sorteado las que falten."""
+        rows = self._rows
+        for machine_id in machine_ids:
+            if machine_id not in rows:
+                self.add(machine_id)
+        return np.fromiter((rows[m] for m in machine_ids), dtype=np.intp, count=len(machine_ids))
+
+    def profile(self, machine_id: int) -> Optional[str]:
+        return self._profiles.get(machine_id)
+
+    # ============================
+    # GENERACIÓN
+    # ============================
+    def generate(self, machine_ids: list, now=None):
+        """
+        Lecturas de un lote de máquinas en el instante `now`: segundos (uno
+        para todas o un array alineado con machine_ids) en el reloj que lleve
+        quien llama, p. ej. el reloj simulado del simulador; None → reloj
+        monotónico. Devuelve (temperature, vibration, energy_consumption)
+        como arrays alineados con machine_ids.
+        """
+        if now is None:
+            now = time.monotonic()
+        idx = self.ensure(machine_ids)
+        n = len(idx)
+        a = self._arrays
+        rng = self._rng
+
+        # tiempo transcurrido por máquina desde su última lectura (0 la primera vez)
+        last = a["last_t"][idx]
+        # un reloj que retrocede (p. ej. al cambiar de reloj) no deshace deriva ni desgaste
+        dt = np.maximum(np.where(np.isnan(last), 0.0, now - last), 0.0) * self.time_scale
+        a["last_t"][idx] = now
+
+        # deriva acotada y desgaste progresivo
+        offset = np.minimum(a["offset"][idx] + a["drift"][idx] * dt / 3600.0, a["drift_max"][idx])
+        a["offset"][idx] = offset
+        wear = np.minimum(a["wear"][idx] + a["wear_rate"][idx] * dt, 1.0)
+        a["wear"][idx] = wear
+        # el desgaste se nota sobre todo al final (curva convexa)
+        wear_effect = wear * wear
+
+        # ruido correlado temperatura/vibración
+        z = rng.standard_normal((3, n))
+        corr = a["corr"][idx]
+        z_vib = corr * z[0] + np.sqrt(1.0 - corr * corr) * z[1]
+
+        temperature = (
+            a["base_temperature"][idx]
+            + offset
+            + a["wear_temp"][idx] * wear_effect
+            + a["temperature_sigma"][idx] * z[0]
+        )
+        vibration = (
+            a["base_vibration"][idx] * (1.0 + a["wear_vib"][idx] * wear_effect)
+            + a["vibration_sigma"][idx] * z_vib
+        )
+
+        spikes = rng.random(n) < a["spike_prob"][idx]
+        if spikes.any():
+            vibration = np.where(spikes, vibration * SPIKE_VIBRATION, vibration)
+            temperature = np.where(spikes, temperature + SPIKE_TEMPERATURE, temperature)
+
+        energy = (
+            a["base_energy"][idx]
+            + ENERGY_PER_DEGREE * (temperature - a["base_temperature"][idx])
+            + a["energy_sigma"][idx] * z[2]
+        )
+
+        # mismas unidades y precisión que las lecturas anteriores
+        return (
+            np.round(temperature, 2),
+            np.round(np.maximum(vibration, 0.01), 3),
+            np.round(np.maximum(energy, 0.0), 2),
+        )
@@ -0,0 +1,416 @@
+# spool.py
+"""
+Spool local de lecturas (write-ahead) para cuando MySQL está caído o lento.
+
+- si escribir un lote falla por la conexión (DB_UNAVAILABLE) o el commit
+  tarda más de SPOOL_COMMIT_MS, las lecturas pasan a ficheros de segmento
+  en SPOOL_DIR (NDJSON solo-añadir, un fichero cada SPOOL_SEGMENT_BYTES).
+- fsync por grupos: cada append escribe y espera a un fsync, pero los
+  append concurrentes comparten el mismo (group commit).
+- mientras quede algo en el spool, todo lo nuevo va también al spool; así
+  el orden por máquina se conserva y la latencia de la ingesta no depende
+  de la BD.
+- un replayer en segundo plano lo vuelca en la BD en lotes de
+  SPOOL_REPLAY_BATCH, en orden, guardando por dónde va en cada segmento;
+  si falla reintenta con espera creciente. Si la BD responde pero no acepta
+  un lote, se parte en mitades hasta aislar las filas culpables (máquina
+  borrada), que van a rejected.ndjson; el resto se escribe.
+- cada registro guarda si la lectura pasa por el análisis predictivo: sí
+  las de la ingesta, no las de /new_machine_data(_batch), igual que al
+  escribirlas directamente.
+- cada worker usa su propio hueco (slot-N, con flock): tras reiniciar, los
+  workers retoman lo que quedó pendiente en cualquier hueco.
+Tras un corte la entrega es "al menos una vez": un lote confirmado justo
+antes de guardar la posición se repetiría.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from metrics import metrics
+
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# Commit más lento que esto (ms) → las siguientes lecturas van al spool
+SPOOL_COMMIT_MS = float(os.getenv("SPOOL_COMMIT_MS", "2000"))
+SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "5000"))
+# Espera máxima entre reintentos del replayer (segundos)
+SPOOL_RETRY_MAX = float(os.getenv("SPOOL_RETRY_MAX", "30"))
+# Huecos que se prueban (uno por worker)
+SPOOL_SLOTS = 64
+
+# Errores de conexión / disponibilidad: la lectura se guarda en el spool
+DB_UNAVAILABLE = (OperationalError, InterfaceError, PoolTimeoutError)
+
+SEGMENT_SUFFIX = ".seg"
+
+spooled_rows = metrics.counter("spool_rows_total", "Lecturas del spool por operación", ("op",))
+appended_rows = spooled_rows.labels("appended")
+replayed_rows = spooled_rows.labels("replayed")
+rejected_rows = spooled_rows.labels("rejected")
+
+
+def encode_reading(row: dict, analyze: bool = True) -> bytes:
+    return json.dumps([
+        row["machine_id"],
+        row["vibration"],
+        row["temperature"],
+        row["energy_consumption"],
+        row["recorded_at"].isoformat() if isinstance(row["recorded_at"], datetime) else row["recorded_at"],
+        analyze,
+    ]).encode() + b"\n"
+
+
+def decode_reading(line: bytes) -> tuple:
+    """(lectura, analyze)."""
+    machine_id, vibration, temperature, energy, recorded_at, analyze = json.loads(line)
+    return {
+        "machine_id": machine_id,
+        "vibration": vibration,
+        "temperature": temperature,
+        "energy_consumption": energy,
+        "recorded_at": datetime.fromisoformat(recorded_at),
+    }, bool(analyze)
+
+
+class WriteAheadSpool:
+    def __init__(self, directory: str = SPOOL_DIR, segment_bytes: int = SPOOL_SEGMENT_BYTES):
+        self.root = directory
+        self.segment_bytes = segment_bytes
+        self.directory: Optional[str] = None
+        self._slot_fd: Optional[int] = None
+        self._lock = threading.Lock()        # estado y escritura del segmento
+        self._sync_lock = threading.Lock()   # un fsync a la vez (group commit)
+        self._file = None
+        self._file_path: Optional[str] = None
+        self._file_size = 0
+        self._seq = 0
+        self._written = 0   # append completados (escritos, no necesariamente en disco)
+        self._synced = 0    # append cubiertos por un fsync
+        self.active = False
+        self._writer: Optional[Callable[[list, bool], None]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # contadores
+        self.appended = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.corrupt = 0
+        self.fsyncs = 0
+        self.trips = 0
+        self.last_error: Optional[str] = None
+        self.retry_in = 0.0
+
+    # ============================
+    # ARRANQUE
+    # ============================
+    def _claim_slot(self):
+        os.makedirs(self.root, exist_ok=True)
+        for slot in range(SPOOL_SLOTS):
+            path = os.path.join(self.root, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            fd = os.open(os.path.join(path, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            self._slot_fd = fd
+            self.directory = path
+            return
+        raise RuntimeError(f"sin huecos libres en {self.root}")
+
+    async def start(self, writer: Callable[[list, bool], None]):
+        """writer(filas, analyze) escribe en la BD (en un hilo) y lanza excepción si falla."""
+        if self._task is not None:
+            return
+        self._writer = writer
+        if self.directory is None:
+            await asyncio.to_thread(self._claim_slot)
+        segments = self._segments()
+        if segments:
+            # lo que quedó de una ejecución anterior
+            self._seq = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)])
+            self.active = True
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._replay_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            self._close_segment()
+
+    def _segments(self) -> List[str]:
+        if self.directory is None:
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    # ============================
+    # ESCRITURA
+    # ============================
+    def trip(self):
+        """La BD va lenta: lo siguiente va al spool hasta que el replayer lo vacíe."""
+        with self._lock:
+            if not self.active:
+                self.active = True
+                self.trips += 1
+
+    def append(self, rows: list, analyze: bool = True):
+        """Añade lecturas al spool y vuelve cuando están en disco (fsync)."""
+        with self._lock:
+            self._append_locked(rows, analyze)
+            ticket = self._written
+        self._sync(ticket)
+
+    def append_if_active(self, rows: list, analyze: bool = True) -> bool:
+        """Si hay algo pendiente en el spool, las lecturas van detrás (orden por máquina)."""
+        with self._lock:
+            if not self.active:
+                return False
+            self._append_locked(rows, analyze)
+            ticket = self._written
+        self._sync(ticket)
+        return True
+
+    async def append_async(self, rows: list, analyze: bool = True):
+        await asyncio.to_thread(self.append, rows, analyze)
+
+    async def append_if_active_async(self, rows: list, analyze: bool = True) -> bool:
+        if not self.active:
+            return False
+        return await asyncio.to_thread(self.append_if_active, rows, analyze)
+
+    def _append_locked(self, rows: list, analyze: bool):
+        if self.directory is None:
+            self._claim_slot()
+        if self._file is None or self._file_size >= self.segment_bytes:
+            self._open_segment()
+        data = b"".join(encode_reading(row, analyze) for row in rows)
+        self._file.write(data)
+        self._file_size += len(data)
+        self._written += 1
+        self.appended += len(rows)
+        appended_rows.inc(len(rows))
+        self.active = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _open_segment(self):
+        self._close_segment()
+        self._seq += 1
+        self._file_path = os.path.join(self.directory, f"{self._seq:012d}{SEGMENT_SUFFIX}")
+        self._file = open(self._file_path, "ab")
+        self._file_size = self._file.tell()
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._file_path = None
+        self._file_size = 0
+
+    def _sync(self, ticket: int):
+        # quien entra hace fsync de todo lo escrito hasta ese momento; los
+        # append que esperaban en el lock ya quedan cubiertos
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._lock:
+                target = self._written
+                file = self._file
+                if file is not None:
+                    file.flush()
+            if file is not None:
+                try:
+                    os.fsync(file.fileno())
+                except (ValueError, OSError):
+                    # el segmento se cerró (y sincronizó) mientras tanto
+                    pass
+            self.fsyncs += 1
+            self._synced = target
+
+    # ============================
+    # REPLAY
+    # ============================
+    async def _replay_loop(self):
+        delay = 0.0
+        while True:
+            if not self.active:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            segment = await asyncio.to_thread(self._next_segment)
+            if segment is None:
+                # vacío: vuelve la escritura directa
+                continue
+            try:
+                done = await self._replay_segment(segment)
+                delay = 0.0
+                self.retry_in = 0.0
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                delay = min(max(delay * 2, 0.5), SPOOL_RETRY_MAX)
+                self.retry_in = delay
+                await asyncio.sleep(delay)
+                continue
+            if done:
+                await asyncio.to_thread(self._drop_segment, segment)
+
+    def _next_segment(self) -> Optional[str]:
+        """Segmento más antiguo; cierra el de escritura para poder leerlo entero."""
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                self.active = False
+                return None
+            if segments[0] == self._file_path:
+                if self._file_size == 0:
+                    self.active = False
+                    return None
+                # los append siguientes abren otro segmento
+                self._close_segment()
+            return segments[0]
+
+    def _read_offset(self, segment: str) -> int:
+        try:
+            with open(segment + ".offset") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, segment: str, offset: int):
+        tmp = segment + ".offset.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, segment + ".offset")
+
+    def _read_batch(self, segment: str, offset: int):
+        """
+        ([(lectura, analyze, offset tras la línea)], offset siguiente); una
+        última línea sin \\n (corte a mitad) se ignora.
+        """
+        items = []
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            while len(items) < SPOOL_REPLAY_BATCH:
+                line = f.readline()
+                if not line or not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    row, analyze = decode_reading(line)
+                except (ValueError, TypeError):
+                    self.corrupt += 1
+                    continue
+                items.append((row, analyze, offset))
+        return items, offset
+
+    async def _replay_segment(self, segment: str) -> bool:
+        offset = await asyncio.to_thread(self._read_offset, segment)
+        while True:
+            items, next_offset = await asyncio.to_thread(self._read_batch, segment, offset)
+            if next_offset == offset:
+                return True
+            # tramos consecutivos con el mismo analyze, en orden
+            start = 0
+            for i in range(1, len(items) + 1):
+                if i == len(items) or items[i][1] != items[start][1]:
+                    await self._replay_rows(segment, items[start:i])
+                    start = i
+            offset = next_offset
+            await asyncio.to_thread(self._write_offset, segment, offset)
+
+    async def _replay_rows(self, segment: str, items: list):
+        """Escribe un tramo; si la BD lo rechaza lo parte en mitades hasta aislar las filas culpables."""
+        try:
+            await asyncio.to_thread(self._writer, [dict(row) for row, _, _ in items], items[0][1])
+        except DB_UNAVAILABLE:
+            # la BD sigue caída: el bucle reintenta desde el último offset guardado
+            raise
+        except Exception as e:
+            # la BD responde pero no acepta el tramo
+            self.last_error = f"{type(e).__name__}: {e}"
+            if len(items) > 1:
+                middle = len(items) // 2
+                await self._replay_rows(segment, items[:middle])
+                await self._replay_rows(segment, items[middle:])
+                return
+            await asyncio.to_thread(self._reject, items, self.last_error)
+        else:
+            self.replayed += len(items)
+            replayed_rows.inc(len(items))
+        # lo escrito (o apartado) no se repite si después cae la BD
+        await asyncio.to_thread(self._write_offset, segment, items[-1][2])
+
+    def _reject(self, items: list, error: str):
+        with open(os.path.join(self.directory, "rejected.ndjson"), "ab") as f:
+            for row, analyze, _ in items:
+                f.write(encode_reading(row, analyze))
+            f.flush()
+            os.fsync(f.fileno())
+        self.rejected += len(items)
+        rejected_rows.inc(len(items))
+        print(f"Spool: {len(items)} lecturas apartadas en rejected.ndjson ({error})")
+
+    def _drop_segment(self, segment: str):
+        os.unlink(segment)
+        try:
+            os.unlink(segment + ".offset")
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        segments = self._segments()
+        pending_bytes = 0
+        for segment in segments:
+            try:
+                pending_bytes += os.path.getsize(segment) - self._read_offset(segment)
+            except OSError:
+                pass
+        return {
+            "active": self.active,
+            "directory": self.directory,
+            "segments": len(segments),
+            "pending_bytes": pending_bytes,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "corrupt": self.corrupt,
+            "fsyncs": self.fsyncs,
+            "trips": self.trips,
+            "retry_in": self.retry_in,
+            "last_error": self.last_error,
+        }
+
+
+# instancia global
+spool = WriteAheadSpool()
+
+metrics.callback("spool_pending_bytes", "Bytes del spool pendientes de volcar en la BD",
+                 lambda: spool.stats()["pending_bytes"])
+metrics.callback("spool_active", "1 si las lecturas se están escribiendo en el spool", lambda: int(spool.active))